@@ -0,0 +1,345 @@
+"""Streaming alert engine.
+
+Each committed reading updates a handful of numbers per device and metric
+(EWMA, exponentially weighted variance, rate of change, repeat count) and
+is checked against them, so evaluation is O(1) per reading and never reads
+stored history. Three kinds of alert:
+
+- threshold: value outside the configured range (ALERT_PH_RANGE, ...)
+- spike: value more than ALERT_SPIKE_Z standard deviations from the EWMA
+- stuck: the exact same value ALERT_STUCK_READINGS times in a row
+
+An alert stays active until its condition clears. Raising and resolving
+are written to the alerts table inside the ingest transaction; evaluate()
+works on copies, and the engine takes the new state and alerts only when
+apply() is called after commit, so a rolled-back batch leaves it as it
+was (discard()). evaluate() holds the batch's devices until then, so two
+overlapping batches for one device run one after the other instead of
+both starting from the same state. Changes are pushed to live subscribers
+after commit. With several workers, each one replays
+the readings and alert changes of the others (see bus.py), so the
+statistics cover every reading whichever worker stored it.
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Alert
+
+
+def _range(name, default):
+    low, high = os.getenv(name, default).split(",")
+    return float(low), float(high)
+
+
+# "min,max", the same format the dashboard stores its ranges in
+LIMITS = {
+    "ph_value": _range("ALERT_PH_RANGE", "6.5,8.5"),
+    "tds_value": _range("ALERT_TDS_RANGE", "0,1000"),
+    "temperature": _range("ALERT_TEMPERATURE_RANGE", "10,35"),
+}
+LABELS = {"ph_value": ("pH", ""), "tds_value": ("TDS", " ppm"), "temperature": ("Temperature", "°C")}
+# Standard deviation floor, so a very quiet sensor does not turn normal
+# jitter into spikes
+MIN_STD = {"ph_value": 0.05, "tds_value": 5.0, "temperature": 0.2}
+
+ALPHA = float(os.getenv("ALERT_EWMA_ALPHA", "0.1"))
+SPIKE_Z = float(os.getenv("ALERT_SPIKE_Z", "4"))
+STUCK_READINGS = int(os.getenv("ALERT_STUCK_READINGS", "30"))
+# Readings per device and metric before spike detection starts
+WARMUP = 20
+
+KINDS = ("threshold", "spike", "stuck")
+
+
+class MetricState:
+    """Running statistics for one device and metric."""
+
+    __slots__ = ("count", "mean", "var", "last", "last_ts", "rate", "repeats")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.last = None
+        self.last_ts = None
+        self.rate = None  # units per minute
+        self.repeats = 0
+
+    def copy(self):
+        state = MetricState.__new__(MetricState)
+        for field in self.__slots__:
+            setattr(state, field, getattr(self, field))
+        return state
+
+    def zscore(self, value, min_std):
+        if self.count < WARMUP:
+            return None
+        return (value - self.mean) / max(math.sqrt(self.var), min_std)
+
+    def update(self, value, ts):
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = ALPHA * diff
+            self.mean += increment
+            self.var = (1 - ALPHA) * (self.var + diff * increment)
+            if ts > self.last_ts:
+                self.rate = (value - self.last) / ((ts - self.last_ts).total_seconds() / 60)
+        self.repeats = self.repeats + 1 if value == self.last else 1
+        self.count += 1
+        self.last = value
+        self.last_ts = ts
+
+
+def _message(kind, metric, value, state, z):
+    label, unit = LABELS[metric]
+    if kind == "threshold":
+        low, high = LIMITS[metric]
+        return f"{label} is {value}{unit}, outside {low:g}-{high:g}{unit}"
+    if kind == "spike":
+        return f"{label} jumped to {value}{unit} ({z:+.1f} sd from {state.mean:.2f}{unit})"
+    return f"{label} stuck at {value}{unit} for {state.repeats} readings"
+
+
+class StagedAlerts:
+    """What evaluate() would change, held until the transaction commits."""
+
+    def __init__(self):
+        self.states = {}  # (device_id, metric) -> updated copy of the MetricState
+        self.active = {}  # (device_id, metric, kind) -> alert, or None once resolved
+        self.events = []  # raised / resolved alerts, in order
+        self.evaluated = 0
+        self.seconds = 0.0
+        self.locks = []  # device locks held from evaluate() until apply() / discard()
+
+
+class AlertEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._device_locks = {}
+        self._states = {}
+        self._active = {}  # (device_id, metric, kind) -> alert dict
+        self.evaluated = 0
+        self.raised = 0
+        self.resolved = 0
+        self._seconds = 0.0
+
+    def warm(self, db: Session):
+        """Reload unresolved alerts so a restart does not raise them twice."""
+        active = {}
+        for alert in db.scalars(select(Alert).where(Alert.resolved_at.is_(None))):
+            active[(alert.device_id, alert.metric, alert.kind)] = _as_dict(alert)
+        with self._lock:
+            self._active = active
+
+    def _hold(self, device_ids):
+        """Acquire the devices' locks, in sorted order so batches cannot deadlock."""
+        with self._lock:
+            locks = [self._device_locks.setdefault(d, threading.Lock()) for d in sorted(set(device_ids))]
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    @staticmethod
+    def _release(locks):
+        for lock in reversed(locks):
+            lock.release()
+        locks.clear()
+
+    def _check(self, row, metric, staged):
+        value = row[metric]
+        if value is None:
+            return
+        key = (row["device_id"], metric)
+        state = staged.states.get(key)
+        if state is None:
+            current = self._states.get(key)
+            state = staged.states[key] = MetricState() if current is None else current.copy()
+
+        low, high = LIMITS[metric]
+        z = state.zscore(value, MIN_STD[metric])
+        state.update(value, row["timestamp"])
+        conditions = {
+            "threshold": not (low <= value <= high),
+            "spike": z is not None and abs(z) > SPIKE_Z,
+            "stuck": state.repeats >= STUCK_READINGS,
+        }
+
+        for kind in KINDS:
+            alert_key = (*key, kind)
+            active = staged.active[alert_key] if alert_key in staged.active else self._active.get(alert_key)
+            if conditions[kind] and active is None:
+                alert = {
+                    "device_id": row["device_id"], "metric": metric, "kind": kind, "value": value,
+                    "message": _message(kind, metric, value, state, z),
+                    "raised_at": row["timestamp"], "resolved_at": None,
+                }
+                staged.active[alert_key] = alert
+                staged.events.append(alert)
+            elif active is not None and not conditions[kind]:
+                staged.active[alert_key] = None
+                staged.events.append({**active, "resolved_at": row["timestamp"]})
+
+    def evaluate(self, db: Session, rows):
+        """Check rows and record alert changes in the caller's transaction.
+
+        Nothing in memory changes: pass the returned StagedAlerts to apply()
+        once the transaction has committed, or to discard() if it does not.
+        Until then other batches for the same devices wait here.
+        """
+        staged = StagedAlerts()
+        staged.locks = self._hold(row["device_id"] for row in rows)
+        try:
+            self._stage(db, rows, staged)
+        except BaseException:
+            self._release(staged.locks)
+            raise
+        return staged
+
+    def _stage(self, db, rows, staged):
+        started = time.perf_counter()
+        with self._lock:
+            for row in rows:
+                for metric in LIMITS:
+                    self._check(row, metric, staged)
+        staged.evaluated = len(rows)
+        staged.seconds = time.perf_counter() - started
+        events = staged.events
+        raised = [e for e in events if e["resolved_at"] is None]
+
+        if raised:
+            ids = db.scalars(
+                insert(Alert).returning(Alert.id, sort_by_parameter_order=True),
+                [{k: e[k] for k in ("device_id", "metric", "kind", "value", "message", "raised_at")}
+                 for e in raised],
+            ).all()
+            for event, new_id in zip(raised, ids):
+                event["id"] = new_id
+        for event in events:
+            if event["resolved_at"] is not None:
+                db.execute(
+                    update(Alert)
+                    .where(Alert.device_id == event["device_id"], Alert.metric == event["metric"],
+                           Alert.kind == event["kind"], Alert.resolved_at.is_(None))
+                    .values(resolved_at=event["resolved_at"])
+                )
+
+    def apply(self, staged):
+        """Take the state and alert changes of a committed batch; returns its events."""
+        try:
+            with self._lock:
+                self._states.update(staged.states)
+                for key, alert in staged.active.items():
+                    if alert is None:
+                        self._active.pop(key, None)
+                    else:
+                        self._active[key] = alert
+                raised = sum(1 for e in staged.events if e["resolved_at"] is None)
+                self.evaluated += staged.evaluated
+                self.raised += raised
+                self.resolved += len(staged.events) - raised
+                self._seconds += staged.seconds
+        finally:
+            self._release(staged.locks)
+        return staged.events
+
+    def discard(self, staged):
+        """Drop the changes of a batch whose transaction did not commit."""
+        self._release(staged.locks)
+
+    def replay(self, rows, items):
+        """Apply readings and alert changes committed by another worker.
+
+        The readings update the running statistics without raising anything:
+        the worker that stored them has already raised what they triggered,
+        and items (in to_item() shape) carry those changes.
+        """
+        locks = self._hold([row["device_id"] for row in rows] + [item["device_id"] for item in items])
+        try:
+            self._replay(rows, items)
+        finally:
+            self._release(locks)
+
+    def _replay(self, rows, items):
+        with self._lock:
+            for row in rows:
+                for metric in LIMITS:
+                    value = row[metric]
+                    if value is None:
+                        continue
+                    state = self._states.get((row["device_id"], metric))
+                    if state is None:
+                        state = self._states[(row["device_id"], metric)] = MetricState()
+                    state.update(value, row["timestamp"])
+            for item in items:
+                key = (item["device_id"], item["metric"], item["kind"])
+                if item["resolved_at"] is not None:
+                    self._active.pop(key, None)
+                    continue
+                alert = {field: item[field] for field in _FIELDS}
+                alert["raised_at"] = datetime.fromisoformat(item["raised_at"])
+                self._active[key] = alert
+
+    def active(self, device_id=None):
+        with self._lock:
+            alerts = list(self._active.values())
+        if device_id is not None:
+            alerts = [a for a in alerts if a["device_id"] == device_id]
+        return sorted(alerts, key=lambda a: a["raised_at"], reverse=True)
+
+    def state(self, device_id):
+        """Current running statistics per metric for one device."""
+        with self._lock:
+            states = {metric: self._states.get((device_id, metric)) for metric in LIMITS}
+        return {
+            metric: None if s is None else {
+                "ewma": round(s.mean, 4), "std": round(math.sqrt(s.var), 4),
+                "rate_per_min": None if s.rate is None else round(s.rate, 4),
+                "last": s.last, "repeats": s.repeats, "count": s.count,
+            }
+            for metric, s in states.items()
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "evaluated": self.evaluated,
+                "raised": self.raised,
+                "resolved": self.resolved,
+                "active": len(self._active),
+                "tracked_series": len(self._states),
+                "us_per_reading": round(self._seconds / self.evaluated * 1e6, 3) if self.evaluated else None,
+            }
+
+
+_FIELDS = ("id", "device_id", "metric", "kind", "value", "message", "raised_at", "resolved_at")
+
+
+def _as_dict(alert: Alert):
+    return {field: getattr(alert, field) for field in _FIELDS}
+
+
+def to_item(alert):
+    """JSON shape shared by GET /alerts and the live feed; takes an Alert or an engine dict."""
+    if isinstance(alert, Alert):
+        alert = _as_dict(alert)
+    return {
+        "id": alert.get("id"),
+        "device_id": alert["device_id"],
+        "metric": alert["metric"],
+        "kind": alert["kind"],
+        "value": alert["value"],
+        "message": alert["message"],
+        "raised_at": alert["raised_at"].isoformat(),
+        "resolved_at": alert["resolved_at"].isoformat() if alert["resolved_at"] else None,
+    }
+
+
+alert_engine = AlertEngine()
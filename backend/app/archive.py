@@ -0,0 +1,317 @@
+"""Cold storage for old readings as day-partitioned Parquet files.
+
+Layout: <ARCHIVE_DIR>/date=YYYY-MM-DD/part-<first id>-<last id>.parquet
+
+`python archive.py [--retention-days N]` moves raw rows older than the
+retention window out of Monitoring_Data. Rollups and the devices registry
+stay in the database, and the read helpers below let history, chart and
+export queries include archived days transparently. A reading that arrives
+again after its day was archived (a late retry or spooled upload) is found
+here by find() and answered as a duplicate, so the key stays unique across
+the database and the archive.
+"""
+import argparse
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, or_, select
+
+from database import SessionLocal, zambia_tz
+from models import Device, MonitoringData
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))
+
+COLUMNS = ("id", "device_id", "timestamp", "ph_value", "tds_value", "temperature")
+
+ArchivedReading = namedtuple("ArchivedReading", COLUMNS)
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("pyarrow is required for Parquet/Arrow support: pip install pyarrow") from e
+    return pyarrow
+
+
+def schema():
+    pa = require_pyarrow()
+    return pa.schema([
+        ("id", pa.int64()),
+        ("device_id", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+        ("ph_value", pa.float64()),
+        ("tds_value", pa.float64()),
+        ("temperature", pa.float64()),
+    ])
+
+
+def rows_to_batch(rows):
+    """Monitoring_Data rows (anything with the column attributes) -> RecordBatch."""
+    pa = require_pyarrow()
+    return pa.record_batch(
+        [[getattr(r, c) for r in rows] for c in COLUMNS], schema=schema()
+    )
+
+
+# -------------------------
+# Read side
+# -------------------------
+
+def partitions(start=None, end=None):
+    """Archived (day, directory) pairs overlapping [start, end), oldest first."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+
+    found = []
+    for name in os.listdir(ARCHIVE_DIR):
+        if not name.startswith("date="):
+            continue
+        day = datetime.strptime(name[5:], "%Y-%m-%d")
+        if start is not None and day + timedelta(days=1) <= start:
+            continue
+        if end is not None and day >= end:
+            continue
+        found.append((day, os.path.join(ARCHIVE_DIR, name)))
+    return sorted(found)
+
+
+def _mask(pc, table, device_id, start, end):
+    """Row filter for the device and [start, end), or None when there is nothing to filter."""
+    mask = None
+    for condition in (
+        pc.equal(table["device_id"], device_id) if device_id is not None else None,
+        pc.greater_equal(table["timestamp"], start) if start is not None else None,
+        pc.less(table["timestamp"], end) if end is not None else None,
+    ):
+        if condition is not None:
+            mask = condition if mask is None else pc.and_(mask, condition)
+    return mask
+
+
+def iter_batches(device_id=None, start=None, end=None):
+    """Yield filtered RecordBatches from the archive, day by day."""
+    days = partitions(start, end)
+    if not days:
+        return
+
+    pa = require_pyarrow()
+    pc, pq = pa.compute, pa.parquet
+    for _, path in days:
+        files = _parquet_files(path)
+        if not files:
+            continue
+        table = pa.concat_tables(pq.read_table(f) for f in files)
+
+        mask = _mask(pc, table, device_id, start, end)
+        if mask is not None:
+            table = table.filter(mask)
+
+        table = table.sort_by([("timestamp", "ascending"), ("id", "ascending")])
+        yield from table.to_batches()
+
+
+def iter_rows(device_id=None, start=None, end=None, after=None):
+    """Archived readings in (timestamp, id) order, optionally strictly after a key."""
+    for batch in iter_batches(device_id, start, end):
+        for values in zip(*(batch.column(c).to_pylist() for c in COLUMNS)):
+            row = ArchivedReading(*values)
+            if after is not None and (row.timestamp, row.id) <= after:
+                continue
+            yield row
+
+
+def _parquet_files(path):
+    return sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".parquet"))
+
+
+def _row_group_range(row_group, column):
+    """(min, max) of column in one row group, or None without statistics."""
+    stats = row_group.column(column).statistics
+    if stats is None or not stats.has_min_max:
+        return None
+    return stats.min, stats.max
+
+
+def count(device_id=None, start=None, end=None):
+    """Archived readings matching the filters, from Parquet metadata where it settles it.
+
+    A day inside [start, end) with no device filter is counted from the file
+    footers. Otherwise each row group's device_id / timestamp statistics
+    either include it whole, exclude it, or (only then) get its two key
+    columns read and filtered. Nothing is sorted.
+    """
+    days = partitions(start, end)
+    if not days:
+        return 0
+
+    pa = require_pyarrow()
+    pc, pq = pa.compute, pa.parquet
+    total = 0
+    for day, path in days:
+        whole_day = (start is None or start <= day) and (end is None or day + timedelta(days=1) <= end)
+        for file in _parquet_files(path):
+            parquet = pq.ParquetFile(file)
+            metadata = parquet.metadata
+            if whole_day and device_id is None:
+                total += metadata.num_rows
+                continue
+            names = metadata.schema.names
+            device_column, ts_column = names.index("device_id"), names.index("timestamp")
+            for i in range(metadata.num_row_groups):
+                row_group = metadata.row_group(i)
+                devices = _row_group_range(row_group, device_column)
+                stamps = _row_group_range(row_group, ts_column)
+                if device_id is not None and devices is not None and not devices[0] <= device_id <= devices[1]:
+                    continue
+                if stamps is not None and (
+                        (start is not None and stamps[1] < start) or (end is not None and stamps[0] >= end)):
+                    continue
+                device_whole = device_id is None or devices == (device_id, device_id)
+                time_whole = whole_day or (stamps is not None and (start is None or stamps[0] >= start)
+                                           and (end is None or stamps[1] < end))
+                if device_whole and time_whole:
+                    total += row_group.num_rows
+                    continue
+                table = parquet.read_row_group(i, columns=["device_id", "timestamp"])
+                total += pc.sum(_mask(pc, table, device_id, start, end)).as_py() or 0
+    return total
+
+
+def find(keys):
+    """{(device_id, timestamp): id} for the given reading keys that are archived.
+
+    Archived rows are no longer in Monitoring_Data, so its unique index cannot
+    catch a retried upload of them; SQLStorage.append() asks here instead.
+    Only days that have a partition are read, and only their key columns.
+    """
+    if not keys or not os.path.isdir(ARCHIVE_DIR):
+        return {}
+    by_day = {}
+    for device_id, ts in keys:
+        by_day.setdefault(ts.replace(hour=0, minute=0, second=0, microsecond=0), []).append((device_id, ts))
+    days = [(day, path) for day, path in partitions(min(by_day), max(by_day) + timedelta(days=1))
+            if day in by_day]
+    if not days:
+        return {}
+
+    pa = require_pyarrow()
+    pc, pq = pa.compute, pa.parquet
+    found = {}
+    for day, path in days:
+        wanted = set(by_day[day])
+        devices = sorted({device_id for device_id, _ in wanted})
+        for file in _parquet_files(path):
+            table = pq.read_table(file, columns=["id", "device_id", "timestamp"])
+            table = table.filter(pc.is_in(table["device_id"], value_set=pa.array(devices)))
+            for stored_id, device_id, ts in zip(*(table[c].to_pylist() for c in ("id", "device_id", "timestamp"))):
+                if (device_id, ts) in wanted:
+                    found.setdefault((device_id, ts), stored_id)
+    return found
+
+
+# -------------------------
+# Archive job
+# -------------------------
+
+def _day_chunks(db, device_id, day, chunk_size):
+    """Keyset-read one device's rows for one day; no cursor stays open between chunks."""
+    query = (
+        select(MonitoringData)
+        .where(
+            MonitoringData.device_id == device_id,
+            MonitoringData.timestamp >= day,
+            MonitoringData.timestamp < day + timedelta(days=1),
+        )
+        .order_by(MonitoringData.timestamp, MonitoringData.id)
+        .limit(chunk_size)
+    )
+    after = None
+    while True:
+        page = query
+        if after is not None:
+            page = page.where(or_(
+                MonitoringData.timestamp > after[0],
+                and_(MonitoringData.timestamp == after[0], MonitoringData.id > after[1]),
+            ))
+        rows = db.scalars(page).all()
+        if not rows:
+            return
+        yield rows
+        after = (rows[-1].timestamp, rows[-1].id)
+
+
+def archive_day(db, day, device_ids, chunk_size=10000):
+    """Write one day to Parquet, then delete exactly the rows that were written."""
+    pa = require_pyarrow()
+    directory = os.path.join(ARCHIVE_DIR, f"date={day:%Y-%m-%d}")
+    tmp = os.path.join(directory, "part.parquet.tmp")
+
+    writer, low, high, written = None, None, None, 0
+    for device_id in device_ids:
+        for rows in _day_chunks(db, device_id, day, chunk_size):
+            if writer is None:
+                os.makedirs(directory, exist_ok=True)
+                writer = pa.parquet.ParquetWriter(tmp, schema(), compression="zstd")
+            writer.write_batch(rows_to_batch(rows))
+            ids = [r.id for r in rows]
+            low = min(ids) if low is None else min(low, min(ids))
+            high = max(ids) if high is None else max(high, max(ids))
+            written += len(rows)
+
+    if writer is None:
+        return 0
+    writer.close()
+
+    # Deterministic name: re-running after a crash overwrites, not duplicates
+    os.replace(tmp, os.path.join(directory, f"part-{low}-{high}.parquet"))
+
+    db.execute(delete(MonitoringData).where(
+        MonitoringData.device_id.in_(device_ids),
+        MonitoringData.timestamp >= day,
+        MonitoringData.timestamp < day + timedelta(days=1),
+        MonitoringData.id <= high,
+    ))
+    db.commit()
+    return written
+
+
+def archive_older_than(cutoff, chunk_size=10000):
+    """Move rows with timestamp < cutoff (a day boundary) into the archive, day by day."""
+    moved = 0
+    with SessionLocal() as db:
+        device_ids = list(db.scalars(select(Device.device_id).order_by(Device.device_id)))
+        first = db.scalar(select(func.min(Device.first_timestamp)))
+        if first is None:
+            return 0
+
+        day = first.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day < cutoff:
+            rows = archive_day(db, day, device_ids, chunk_size)
+            if rows:
+                print(f"Archived {rows} rows for {day:%Y-%m-%d}")
+            moved += rows
+            day += timedelta(days=1)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old readings into Parquet cold storage")
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS,
+                        help="keep this many days of raw rows in the database")
+    args = parser.parse_args()
+    if os.getenv("STORAGE_BACKEND", "sql") != "sql":
+        raise SystemExit("archive.py moves Monitoring_Data rows; it only applies to STORAGE_BACKEND=sql")
+
+    today = datetime.now(zambia_tz).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    cutoff = today - timedelta(days=args.retention_days)
+    moved = archive_older_than(cutoff)
+    print(f"Moved {moved} rows older than {cutoff:%Y-%m-%d} to {ARCHIVE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Cache coherence between worker processes on one machine.
+
+Each worker keeps its own in-memory caches (latest readings, chart days,
+derived metrics, alert state, recent keys, the site index) and its own live
+subscribers. With several workers, a reading stored by one must reach the
+others. When CACHE_BUS_DIR is set, every worker binds a UDP socket on
+127.0.0.1 and writes its port to <CACHE_BUS_DIR>/<pid>.port; send() delivers
+a JSON message to every other port listed there, and a receiver thread hands
+incoming messages to the handler given to start().
+
+Delivery is best effort, like any UDP: a lost message leaves one worker's
+cache stale until it is next refreshed. The database stays the source of
+truth. `python manage.py serve --workers N` sets the directory up.
+"""
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from encoding import dumps
+
+BUS_DIR = os.getenv("CACHE_BUS_DIR")
+# How long the list of peer ports is reused before the directory is read again
+PEER_REFRESH_SECONDS = 1.0
+# Rows per datagram, well under the 64 KB UDP limit
+CHUNK_ROWS = 200
+# Alert items per datagram (each about twice the size of a row)
+CHUNK_ALERTS = 50
+# Largest UDP payload over IPv4
+MAX_DATAGRAM = 65507
+
+logger = logging.getLogger("water_monitoring.bus")
+
+
+class CacheBus:
+    def __init__(self, directory=BUS_DIR):
+        self.directory = directory
+        self._sock = None
+        self._path = None
+        self._thread = None
+        self._peers = []
+        self._peers_read = 0.0
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+        self.oversize = 0
+
+    @property
+    def enabled(self):
+        return self._sock is not None
+
+    def start(self, handler):
+        if not self.directory or self._sock is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        self._sock = sock
+        self._path = os.path.join(self.directory, f"{os.getpid()}.port")
+        with open(self._path, "w") as f:
+            f.write(str(sock.getsockname()[1]))
+        self._thread = threading.Thread(target=self._receive, args=(sock, handler), name="cache-bus", daemon=True)
+        self._thread.start()
+        logger.info("cache bus listening port=%s dir=%s", sock.getsockname()[1], self.directory)
+
+    def stop(self):
+        sock, self._sock = self._sock, None
+        if sock is None:
+            return
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+        sock.close()
+
+    def _receive(self, sock, handler):
+        while True:
+            try:
+                data = sock.recv(65535)
+            except OSError:
+                return  # closed by stop()
+            try:
+                handler(json.loads(data))
+                self.received += 1
+            except Exception:
+                self.errors += 1
+                logger.exception("cache bus message failed")
+
+    def _peer_ports(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._peers_read < PEER_REFRESH_SECONDS:
+                return self._peers
+            own = os.path.basename(self._path)
+            ports = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".port") or name == own:
+                    continue
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        ports.append(int(f.read()))
+                except (OSError, ValueError):
+                    continue  # a worker starting or stopping
+            self._peers, self._peers_read = ports, now
+            return ports
+
+    def send(self, message):
+        """Deliver message (JSON types only) to every other worker.
+
+        Returns False, without sending, if the message does not fit in one
+        datagram: callers split what they send (see ingest.share()).
+        """
+        sock = self._sock
+        if sock is None:
+            return True
+        data = dumps(message)
+        if len(data) > MAX_DATAGRAM:
+            return self._oversize(message, len(data))
+        for port in self._peer_ports():
+            try:
+                sock.sendto(data, ("127.0.0.1", port))
+                self.sent += 1
+            except OSError as e:
+                if e.errno == errno.EMSGSIZE:
+                    return self._oversize(message, len(data))
+                # Most likely a worker that exited without removing its file
+                self.errors += 1
+                logger.warning("cache bus send to port %s failed: %s", port, e)
+        return True
+
+    def _oversize(self, message, size):
+        self.oversize += 1
+        logger.error("cache bus %s message of %d bytes not sent: over the datagram limit; peers' caches are stale",
+                     message.get("type"), size)
+        return False
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "peers": len(self._peer_ports()) if self.enabled else 0,
+            "sent": self.sent,
+            "received": self.received,
+            "errors": self.errors,
+            "oversize": self.oversize,
+        }
+
+
+cache_bus = CacheBus()
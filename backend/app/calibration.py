@@ -0,0 +1,537 @@
+"""Per-device calibration profiles and recalibration of stored readings.
+
+The ESP32 converts probe voltages with constants compiled into the
+firmware (PhSensor.h, TDSSensor.h):
+
+    pH  = 7 + (V7 - v) / slope
+    TDS = (133.42 v^3 - 255.86 v^2 + 857.39 v) * factor,  v compensated to 25 C if enabled
+
+Both are invertible, so a stored value and the calibration it was computed
+with give back the probe voltage, and the voltage gives the value under any
+other calibration. Every reading records the profile applied to it
+(Monitoring_Data.calibration_id, NULL = the firmware constants), which
+makes reprocessing idempotent and lets a run resume anywhere.
+
+New readings get the profile covering them at ingest. A reprocess job
+rewrites stored readings whose profile is not the one that covers them now,
+chunk by chunk with NumPy, commits its cursor with every chunk, and then
+rebuilds the rollups of the days it touched:
+
+    python calibration.py add --device device_001 --from 2026-01-01 --ph-v7 2.61 --ph-slope 0.171
+    python calibration.py reprocess --device device_001
+    python calibration.py resume 3
+    python calibration.py jobs
+
+Only STORAGE_BACKEND=sql is supported; archived days are not rewritten.
+Alerts raised from the old values are kept as they were.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from bus import cache_bus
+from chart_cache import chart_cache
+from database import SessionLocal
+from derived import derived_cache
+from latest import latest_cache
+from models import CalibrationProfile, Device, MonitoringData, ReprocessJob
+import rollups
+from storage import store
+
+# What the firmware applies (PhSensor.h / TDSSensor.h); override if boards
+# were flashed with other constants
+FIRMWARE = {
+    "id": None,
+    "ph_v7": float(os.getenv("FIRMWARE_PH_V7", "2.55")),
+    "ph_slope": float(os.getenv("FIRMWARE_PH_SLOPE", "0.18")),
+    "tds_factor": float(os.getenv("FIRMWARE_TDS_FACTOR", "1.0")),
+    "tds_temp_coefficient": 0.0,
+}
+# Readings read and rewritten per transaction by a reprocess job
+CHUNK_ROWS = int(os.getenv("RECALIBRATE_CHUNK_ROWS", "50000"))
+
+_TDS_CURVE = (133.42, -255.86, 857.39)  # v^3, v^2, v
+
+logger = logging.getLogger("water_monitoring.calibration")
+
+
+# -------------------------
+# Vectorized conversion
+# -------------------------
+def _tds_curve(v):
+    a, b, c = _TDS_CURVE
+    return ((a * v + b) * v + c) * v
+
+
+def _tds_voltage(y):
+    """Inverse of the TDS curve by Newton's method; the curve is strictly increasing."""
+    import numpy as np
+
+    a, b, c = _TDS_CURVE
+    v = y / c
+    for _ in range(8):
+        v = v - (_tds_curve(v) - y) / ((3 * a * v + 2 * b) * v + c)
+    return np.maximum(v, 0.0)
+
+
+def _compensation(temperature, coefficient):
+    """Divisor that brings a voltage to 25 C (1 where unknown or disabled)."""
+    import numpy as np
+
+    factor = 1.0 + coefficient * (temperature - 25.0)
+    return np.where(np.isnan(factor) | (factor <= 0), 1.0, factor)
+
+
+def _parameters(ids, profiles):
+    """Per-row parameter arrays for an array of profile ids (0 = firmware)."""
+    import numpy as np
+
+    columns = {name: np.empty(len(ids)) for name in ("ph_v7", "ph_slope", "tds_factor", "tds_temp_coefficient")}
+    for profile_id in np.unique(ids):
+        profile = profiles.get(int(profile_id)) if profile_id else FIRMWARE
+        mask = ids == profile_id
+        for name, column in columns.items():
+            column[mask] = profile[name]
+    return columns
+
+
+def recalibrate(ph, tds, temperature, current, target, profiles):
+    """Values computed with profile ids `current`, converted to profile ids `target`.
+
+    Arrays of equal length; NaN stays NaN. profiles maps id -> profile dict.
+    """
+    import numpy as np
+
+    old = _parameters(current, profiles)
+    new = _parameters(target, profiles)
+
+    voltage = old["ph_v7"] - (ph - 7.0) * old["ph_slope"]
+    new_ph = 7.0 + (new["ph_v7"] - voltage) / new["ph_slope"]
+
+    compensated = _tds_voltage(tds / old["tds_factor"])
+    voltage = compensated * _compensation(temperature, old["tds_temp_coefficient"])
+    new_tds = _tds_curve(voltage / _compensation(temperature, new["tds_temp_coefficient"])) * new["tds_factor"]
+    return new_ph, np.maximum(new_tds, 0.0)
+
+
+def _floats(values):
+    import numpy as np
+
+    return np.array(values, dtype=float)
+
+
+def _or_none(values):
+    return [None if v != v else v for v in values.tolist()]  # NaN -> NULL
+
+
+# -------------------------
+# Profiles
+# -------------------------
+_FIELDS = ("id", "device_id", "valid_from", "valid_to", "ph_v7", "ph_slope", "tds_factor",
+           "tds_temp_coefficient", "note", "created_at", "retired_at")
+
+
+def _as_dict(profile: CalibrationProfile):
+    return {field: getattr(profile, field) for field in _FIELDS}
+
+
+def to_item(profile):
+    item = dict(profile)
+    for field in ("valid_from", "valid_to", "created_at", "retired_at"):
+        item[field] = item[field].isoformat() if item[field] else None
+    return item
+
+
+class ProfileCache:
+    """Every calibration profile, retired ones included (readings may still refer to them)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._by_device = {}  # device_id -> active profiles, oldest first
+
+    def warm(self, db: Session):
+        profiles = {p.id: _as_dict(p) for p in db.scalars(select(CalibrationProfile))}
+        by_device = {}
+        for profile_id in sorted(profiles):
+            profile = profiles[profile_id]
+            if profile["retired_at"] is None:
+                by_device.setdefault(profile["device_id"], []).append(profile)
+        with self._lock:
+            self._profiles, self._by_device = profiles, by_device
+
+    def get(self, profile_id):
+        return self._profiles.get(profile_id)
+
+    def all(self, device_id=None):
+        with self._lock:
+            profiles = list(self._profiles.values())
+        if device_id is not None:
+            profiles = [p for p in profiles if p["device_id"] == device_id]
+        return sorted(profiles, key=lambda p: p["id"])
+
+    def devices(self):
+        """Devices with at least one active profile."""
+        return set(self._by_device)
+
+    def targets(self, device_id, timestamps):
+        """Profile id covering each timestamp (datetime64 array), 0 where none does."""
+        import numpy as np
+
+        target = np.zeros(len(timestamps), dtype=np.int64)
+        # Oldest first, so the newest profile covering a reading wins
+        for profile in self._by_device.get(device_id, ()):
+            covered = timestamps >= np.datetime64(profile["valid_from"])
+            if profile["valid_to"] is not None:
+                covered &= timestamps < np.datetime64(profile["valid_to"])
+            target[covered] = profile["id"]
+        return target
+
+
+calibration_profiles = ProfileCache()
+
+
+def create_profile(db: Session, device_id, valid_from, valid_to=None, ph_v7=None, ph_slope=None,
+                   tds_factor=None, tds_temp_coefficient=0.0, note=None):
+    """Add a profile (commits). Parameters left out keep the firmware's values."""
+    ph_v7 = FIRMWARE["ph_v7"] if ph_v7 is None else ph_v7
+    ph_slope = FIRMWARE["ph_slope"] if ph_slope is None else ph_slope
+    tds_factor = FIRMWARE["tds_factor"] if tds_factor is None else tds_factor
+    if ph_slope == 0:
+        raise ValueError("ph_slope must not be 0")
+    if tds_factor <= 0:
+        raise ValueError("tds_factor must be positive")
+    if valid_to is not None and valid_to <= valid_from:
+        raise ValueError("valid_to must be after valid_from")
+
+    profile = CalibrationProfile(
+        device_id=device_id, valid_from=valid_from, valid_to=valid_to, ph_v7=ph_v7, ph_slope=ph_slope,
+        tds_factor=tds_factor, tds_temp_coefficient=tds_temp_coefficient or 0.0, note=note,
+        created_at=datetime.now(),
+    )
+    db.add(profile)
+    db.commit()
+    calibration_profiles.warm(db)
+    cache_bus.send({"type": "calibration"})
+    return _as_dict(profile)
+
+
+def retire_profile(db: Session, profile_id):
+    """Withdraw a profile (commits); returns it, or None if there is no such profile."""
+    profile = db.get(CalibrationProfile, profile_id)
+    if profile is None:
+        return None
+    if profile.retired_at is None:
+        profile.retired_at = datetime.now()
+        db.commit()
+        calibration_profiles.warm(db)
+        cache_bus.send({"type": "calibration"})
+    return _as_dict(profile)
+
+
+def calibrate_rows(rows):
+    """Apply the covering profile to new readings before they are stored.
+
+    Sets row["calibration_id"] on every row once any profile exists, so a
+    batch always inserts the same columns.
+    """
+    devices = calibration_profiles.devices()
+    if not devices or store.name != "sql":
+        return
+    import numpy as np
+
+    by_device = {}
+    for row in rows:
+        row["calibration_id"] = None
+        if row["device_id"] in devices:
+            by_device.setdefault(row["device_id"], []).append(row)
+
+    for device_id, device_rows in by_device.items():
+        timestamps = np.array([row["timestamp"] for row in device_rows], dtype="datetime64[us]")
+        target = calibration_profiles.targets(device_id, timestamps)
+        picked = np.flatnonzero(target)
+        if not len(picked):
+            continue
+        chosen = [device_rows[i] for i in picked]
+        ph, tds = recalibrate(
+            _floats([row["ph_value"] for row in chosen]),
+            _floats([row["tds_value"] for row in chosen]),
+            _floats([row["temperature"] for row in chosen]),
+            np.zeros(len(chosen), dtype=np.int64), target[picked], calibration_profiles,
+        )
+        for row, ph_value, tds_value, profile_id in zip(chosen, _or_none(ph), _or_none(tds), target[picked].tolist()):
+            row["ph_value"] = ph_value
+            row["tds_value"] = tds_value
+            row["calibration_id"] = profile_id
+
+
+# -------------------------
+# Reprocess jobs
+# -------------------------
+_running = set()  # job ids running in this process
+
+
+def is_running(job_id):
+    return job_id in _running
+
+
+def _day(ts):
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def job_item(job: ReprocessJob):
+    elapsed = ((job.finished_at or job.updated_at) - job.started_at).total_seconds()
+    return {
+        "id": job.id,
+        "device_id": job.device_id,
+        "from": job.start.isoformat() if job.start else None,
+        "to": job.end.isoformat() if job.end else None,
+        "status": job.status,
+        "rows_total": job.rows_total,
+        "rows_scanned": job.rows_scanned,
+        "rows_updated": job.rows_updated,
+        "progress": round(job.rows_scanned / job.rows_total, 4) if job.rows_total else 1.0,
+        "current_device": job.current_device,
+        "elapsed_s": round(elapsed, 1),
+        "rows_per_second": round(job.rows_scanned / elapsed, 1) if elapsed > 0 else None,
+        "error": job.error,
+        "started_at": job.started_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _range(query, job):
+    if job.device_id is not None:
+        query = query.where(MonitoringData.device_id == job.device_id)
+    if job.start is not None:
+        query = query.where(MonitoringData.timestamp >= job.start)
+    if job.end is not None:
+        query = query.where(MonitoringData.timestamp < job.end)
+    return query
+
+
+def create_job(db: Session, device_id=None, start=None, end=None):
+    """Record a new job over the given readings (commits); run it with run_job()."""
+    if store.name != "sql":
+        raise RuntimeError("recalibration rewrites Monitoring_Data; it only applies to STORAGE_BACKEND=sql")
+    now = datetime.now()
+    job = ReprocessJob(device_id=device_id, start=start, end=end, status="running",
+                       started_at=now, updated_at=now)
+    job.rows_total = db.scalar(_range(select(func.count()).select_from(MonitoringData), job))
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+# One executemany per chunk, in Core: the ORM's bulk update bookkeeping costs more than SQLite does
+_table = MonitoringData.__table__
+_UPDATE = update(_table).where(_table.c.id == bindparam("row_id")).values(
+    ph_value=bindparam("ph"), tds_value=bindparam("tds"), calibration_id=bindparam("profile"),
+)
+
+
+def _rewrite(db: Session, device_id, rows):
+    """Recalibrate one chunk of (id, timestamp, ph, tds, temperature, calibration_id) rows.
+
+    Returns (rows updated, first and last timestamp updated).
+    """
+    import numpy as np
+
+    timestamps = np.array([r.timestamp for r in rows], dtype="datetime64[us]")
+    current = np.array([r.calibration_id or 0 for r in rows], dtype=np.int64)
+    target = calibration_profiles.targets(device_id, timestamps)
+    changed = np.flatnonzero(current != target)
+    if not len(changed):
+        return 0, None, None
+
+    picked = [rows[i] for i in changed]
+    ph, tds = recalibrate(
+        _floats([r.ph_value for r in picked]), _floats([r.tds_value for r in picked]),
+        _floats([r.temperature for r in picked]), current[changed], target[changed], calibration_profiles,
+    )
+    db.execute(_UPDATE, [
+        {"row_id": r.id, "ph": ph_value, "tds": tds_value, "profile": profile_id or None}
+        for r, ph_value, tds_value, profile_id in zip(picked, _or_none(ph), _or_none(tds), target[changed].tolist())
+    ])
+    return len(picked), picked[0].timestamp, picked[-1].timestamp
+
+
+def refresh_caches(db: Session, device_id, share=True):
+    """Drop what this process cached from a device's old values."""
+    chart_cache.invalidate(device_id)
+    derived_cache.invalidate()
+    latest_cache.observe(store.latest(db, device_id))
+    if share:
+        cache_bus.send({"type": "recalibrated", "device_id": device_id})
+
+
+def apply_shared(message):
+    """A profile change or recalibration made by another worker (see bus.py)."""
+    with SessionLocal() as db:
+        if message["type"] == "calibration":
+            calibration_profiles.warm(db)
+        else:
+            refresh_caches(db, message["device_id"], share=False)
+
+
+def run_job(job_id, chunk_size=CHUNK_ROWS, report=None):
+    """Run (or resume) a job to the end. report(job) is called after every chunk."""
+    if job_id in _running:
+        raise RuntimeError(f"job {job_id} is already running")
+    _running.add(job_id)
+    try:
+        with SessionLocal() as db:
+            calibration_profiles.warm(db)
+            job = db.get(ReprocessJob, job_id)
+            if job is None:
+                raise LookupError(f"no reprocess job {job_id}")
+            job.status, job.error = "running", None
+            db.commit()
+            try:
+                _run(db, job, chunk_size, report)
+            except Exception as e:
+                db.rollback()
+                job.status, job.error, job.updated_at = "failed", str(e), datetime.now()
+                db.commit()
+                raise
+            return job_item(job)
+    finally:
+        _running.discard(job_id)
+
+
+def _run(db: Session, job, chunk_size, report):
+    if job.device_id is not None:
+        devices = [job.device_id]
+    else:
+        devices = sorted(db.scalars(select(Device.device_id)))
+    if job.current_device is not None:
+        devices = [d for d in devices if d >= job.current_device]
+
+    for device_id in devices:
+        if job.current_device != device_id:
+            job.current_device, job.last_timestamp = device_id, None
+            job.dirty_from = job.dirty_to = None
+            db.commit()
+
+        while True:
+            # Keyset on the unique (device_id, timestamp) index
+            query = _range(select(
+                MonitoringData.id, MonitoringData.timestamp, MonitoringData.ph_value, MonitoringData.tds_value,
+                MonitoringData.temperature, MonitoringData.calibration_id,
+            ).where(MonitoringData.device_id == device_id), job)
+            if job.last_timestamp is not None:
+                query = query.where(MonitoringData.timestamp > job.last_timestamp)
+            rows = db.execute(query.order_by(MonitoringData.timestamp).limit(chunk_size)).all()
+            if not rows:
+                break
+
+            updated, first, last = _rewrite(db, device_id, rows)
+            job.rows_scanned += len(rows)
+            job.rows_updated += updated
+            job.last_timestamp = rows[-1].timestamp
+            if updated:
+                job.dirty_from = min(job.dirty_from or first, first)
+                job.dirty_to = max(job.dirty_to or last, last)
+            job.updated_at = datetime.now()
+            db.commit()  # the rows and the cursor together, so a crash resumes here
+            if report is not None:
+                report(job)
+
+        if job.dirty_from is not None:
+            rollups.rebuild(db, device_id=device_id, start=_day(job.dirty_from),
+                            end=_day(job.dirty_to) + timedelta(days=1))
+            job.dirty_from = job.dirty_to = None
+            db.commit()
+            refresh_caches(db, device_id)
+
+    job.status, job.current_device, job.last_timestamp = "done", None, None
+    job.updated_at = job.finished_at = datetime.now()
+    db.commit()
+
+
+def start_job_thread(job_id):
+    """Run a job in the background of the app; progress is read from reprocess_jobs."""
+    def target():
+        try:
+            run_job(job_id)
+        except Exception:
+            logger.exception("reprocess job %s failed", job_id)
+
+    threading.Thread(target=target, name=f"reprocess-{job_id}", daemon=True).start()
+
+
+# -------------------------
+# CLI
+# -------------------------
+def _print_progress(job):
+    item = job_item(job)
+    print(f"job {job.id} {job.current_device}: {job.rows_scanned}/{job.rows_total} rows "
+          f"({item['progress']:.1%}), {job.rows_updated} rewritten, {item['rows_per_second']} rows/s")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Calibration profiles and recalibration of stored readings")
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("profiles", help="list profiles")
+    listing.add_argument("--device")
+    add = commands.add_parser("add", help="add a profile")
+    add.add_argument("--device", required=True)
+    add.add_argument("--from", dest="valid_from", type=datetime.fromisoformat, required=True)
+    add.add_argument("--to", dest="valid_to", type=datetime.fromisoformat)
+    add.add_argument("--ph-v7", type=float, help=f"volts at pH 7 (firmware: {FIRMWARE['ph_v7']})")
+    add.add_argument("--ph-slope", type=float, help=f"volts per pH (firmware: {FIRMWARE['ph_slope']})")
+    add.add_argument("--tds-factor", type=float, help=f"TDS multiplier (firmware: {FIRMWARE['tds_factor']})")
+    add.add_argument("--tds-temp-coefficient", type=float, default=0.0,
+                     help="temperature compensation per degree C, e.g. 0.02 (firmware: none)")
+    add.add_argument("--note")
+    retire = commands.add_parser("retire", help="withdraw a profile")
+    retire.add_argument("profile_id", type=int)
+    reprocess = commands.add_parser("reprocess", help="rewrite stored readings to match the profiles")
+    reprocess.add_argument("--device")
+    reprocess.add_argument("--from", dest="start", type=datetime.fromisoformat)
+    reprocess.add_argument("--to", dest="end", type=datetime.fromisoformat)
+    reprocess.add_argument("--chunk-size", type=int, default=CHUNK_ROWS)
+    resume = commands.add_parser("resume", help="continue an interrupted job")
+    resume.add_argument("job_id", type=int)
+    resume.add_argument("--chunk-size", type=int, default=CHUNK_ROWS)
+    commands.add_parser("jobs", help="list reprocess jobs")
+    args = parser.parse_args(argv)
+
+    with SessionLocal() as db:
+        calibration_profiles.warm(db)
+        if args.command == "profiles":
+            for profile in calibration_profiles.all(args.device):
+                print(to_item(profile))
+        elif args.command == "add":
+            profile = create_profile(db, args.device, args.valid_from, args.valid_to, args.ph_v7, args.ph_slope,
+                                     args.tds_factor, args.tds_temp_coefficient, args.note)
+            print(f"Added profile {profile['id']}; run `python calibration.py reprocess --device {args.device}`")
+        elif args.command == "retire":
+            if retire_profile(db, args.profile_id) is None:
+                print(f"No profile {args.profile_id}")
+                return 1
+        elif args.command == "jobs":
+            for job in db.scalars(select(ReprocessJob).order_by(ReprocessJob.id)):
+                print(job_item(job))
+        elif args.command in ("reprocess", "resume"):
+            if args.command == "reprocess":
+                job_id = create_job(db, args.device, args.start, args.end)
+            else:
+                job_id = args.job_id
+            started = time.perf_counter()
+            item = run_job(job_id, args.chunk_size, _print_progress)
+            print(f"Job {job_id} {item['status']}: {item['rows_updated']} of {item['rows_scanned']} readings "
+                  f"rewritten in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from database import zambia_tz
+from encoding import uncoded_etag
+
+# Rendered chart days kept in memory (one entry per device, day and query)
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "512"))
+# How long browsers may reuse a closed day without asking again. Late or
+# backfilled readings can still change it, so this is not "immutable".
+CHART_MAX_AGE = int(os.getenv("CHART_MAX_AGE", "300"))
+
+
+def today():
+    return datetime.now(zambia_tz).date()
+
+
+def etag(body: bytes):
+    """Strong validator: the same bytes always get the same tag."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, tag):
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+    # If-None-Match uses weak comparison; a compressed copy carries the
+    # coding in its tag (see encoding.CompressionMiddleware)
+    return any(uncoded_etag(c[2:] if c.startswith("W/") else c) == tag for c in candidates)
+
+
+def cache_control(day):
+    if day < today():
+        return f"public, max-age={CHART_MAX_AGE}"
+    return "no-cache"
+
+
+class ChartDayCache:
+    """LRU of serialized chart responses for closed (past) days.
+
+    Keys are (device_id, day, *query) so different resolutions and point
+    budgets of the same day are separate entries. observe() is fed every
+    committed reading and drops exactly the entries for the device and day
+    the reading falls in, so a late or backfilled reading never leaves a
+    stale day behind. The current day is not cached: it changes with every
+    reading.
+    """
+
+    def __init__(self, max_entries=CHART_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (body, etag)
+        self._by_day = {}  # (device_id, day) -> set of keys
+        # Bumped whenever a past day receives readings, so a response built
+        # from data read before the reading landed is not stored after it
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, generation):
+        """Store body for a closed day unless readings landed in the past since generation."""
+        device_id, day = key[:2]
+        if day >= today():
+            return None
+        tag = etag(body)
+        with self._lock:
+            if generation != self._generation:
+                return None
+            self._entries[key] = (body, tag)
+            self._entries.move_to_end(key)
+            self._by_day.setdefault((device_id, day), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+        return tag
+
+    def _forget(self, key):
+        day_key = key[:2]
+        keys = self._by_day.get(day_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_day[day_key]
+
+    def observe(self, rows):
+        current = today()
+        touched = {(row["device_id"], row["timestamp"].date()) for row in rows}
+        late = {day_key for day_key in touched if day_key[1] < current}
+        if not late:
+            return
+        with self._lock:
+            self._generation += 1
+            for day_key in late:
+                for key in self._by_day.pop(day_key, ()):
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def invalidate(self, device_id=None):
+        """Drop every cached day, or every day of one device."""
+        with self._lock:
+            self._generation += 1
+            for day_key in [k for k in self._by_day if device_id is None or k[0] == device_id]:
+                for key in self._by_day.pop(day_key):
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+            size = sum(len(body) for body, _ in self._entries.values())
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "invalidations": self.invalidations,
+        }
+
+
+chart_cache = ChartDayCache()
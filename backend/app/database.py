@@ -1,13 +1,81 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 import os
+import pytz
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, echo=True)
+# SQL statement logging is opt-in: it writes every query to stdout
+SQL_ECHO = os.getenv("SQL_ECHO", "0").lower() in ("1", "true", "yes")
+
+# Connection pool. The pool, not the threadpool, bounds how many requests
+# can talk to the database at once, so it should be sized with it.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite: in WAL mode readers see the last commit while a writer holds the
+# lock instead of waiting for it; synchronous=NORMAL is durable across
+# application crashes and only a power loss can drop the last commits.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+if SQLITE_JOURNAL_MODE not in ("WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY"):
+    raise ValueError(f"SQLITE_JOURNAL_MODE must be WAL, DELETE, TRUNCATE, PERSIST or MEMORY, not {SQLITE_JOURNAL_MODE!r}")
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"SQLITE_SYNCHRONOUS must be OFF, NORMAL, FULL or EXTRA, not {SQLITE_SYNCHRONOUS!r}")
+
+# Async endpoints run their queries on an async engine (aiosqlite / asyncpg)
+# when this is set; otherwise they hand the sync session to the threadpool.
+DB_ASYNC = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "mysql": "mysql+aiomysql"}
+
+
+def _is_sqlite_file(url):
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _engine_options(url):
+    options = {"echo": SQL_ECHO}
+    if url.get_backend_name() != "sqlite" or _is_sqlite_file(url):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # The journal mode is stored in the file; switching it only takes
+    # effect once no other connection has the database open
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def _configure(sync_engine, url):
+    if _is_sqlite_file(url):
+        event.listen(sync_engine, "connect", _sqlite_pragmas)
+
+
+_url = make_url(DATABASE_URL)
+
+engine = create_engine(_url, **_engine_options(_url))
+_configure(engine, _url)
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -15,4 +83,37 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
-Base = declarative_base()
\ No newline at end of file
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    if _url.get_backend_name() not in _ASYNC_DRIVERS:
+        raise RuntimeError(f"DB_ASYNC is not supported for {_url.get_backend_name()} databases")
+    _async_url = _url.set(drivername=_ASYNC_DRIVERS[_url.get_backend_name()])
+    # Fails here, at startup, when the async driver is not installed
+    async_engine = create_async_engine(_async_url, **_engine_options(_async_url))
+    _configure(async_engine.sync_engine, _async_url)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def run_db(db, fn, *args):
+    """Await fn(session, *args) without blocking the event loop.
+
+    An AsyncSession runs fn through run_sync, so its queries go through the
+    async driver; a plain Session runs fn in the threadpool. Either way fn
+    is the same sync code the rest of the backend uses.
+    """
+    if not isinstance(db, Session):
+        return await db.run_sync(fn, *args)
+
+    from fastapi.concurrency import run_in_threadpool
+
+    return await run_in_threadpool(fn, db, *args)
+
+
+Base = declarative_base()
+
+# Readings are stored as naive Africa/Lusaka wall-clock times
+zambia_tz = pytz.timezone("Africa/Lusaka")
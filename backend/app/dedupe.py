@@ -0,0 +1,143 @@
+"""Duplicate and out-of-order detection for ingest.
+
+A reading's key is (device_id, timestamp). The gateway stamps each reading
+once, when it is read off the serial port, so a retried upload carries the
+same keys. The database enforces the key with a unique index. RecentKeys is
+a bounded LRU of keys already stored (key -> id) in front of it, so a retry
+of a recent batch is answered from memory without a database round trip.
+
+Device sequence numbers (binary frames carry one) restart at 0 when the
+firmware reboots and wrap at 2**32, so they are not part of the key. They
+are tracked per device to count reordered and missing readings and restarts.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+# Stored keys remembered for duplicate detection without a query
+DEDUPE_CACHE_SIZE = int(os.getenv("DEDUPE_CACHE_SIZE", "100000"))
+# A sequence number this far below the device's last one means it restarted
+SEQ_RESTART_GAP = int(os.getenv("SEQ_RESTART_GAP", "1000"))
+
+
+def reading_key(row):
+    return row["device_id"], row["timestamp"]
+
+
+class _DeviceCounters:
+    __slots__ = ("received", "duplicates", "reordered", "missing", "restarts", "last_seq", "newest")
+
+    def __init__(self):
+        self.received = self.duplicates = self.reordered = self.missing = self.restarts = 0
+        self.last_seq = None
+        self.newest = None
+
+    def stored(self, row):
+        self.received += 1
+        late = self.newest is not None and row["timestamp"] < self.newest
+        if not late:
+            self.newest = row["timestamp"]
+
+        seq = row.get("seq")
+        if seq is not None:
+            if self.last_seq is None or seq > self.last_seq:
+                if self.last_seq is not None:
+                    self.missing += seq - self.last_seq - 1
+                self.last_seq = seq
+            elif self.last_seq - seq > SEQ_RESTART_GAP:
+                self.restarts += 1
+                self.last_seq = seq
+            elif seq < self.last_seq:
+                # A late reading fills a gap counted as missing earlier
+                late = True
+                self.missing = max(self.missing - 1, 0)
+        if late:
+            self.reordered += 1
+
+    def as_dict(self):
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "reordered": self.reordered,
+            "missing": self.missing,
+            "restarts": self.restarts,
+            "last_seq": self.last_seq,
+        }
+
+
+class RecentKeys:
+    """LRU of recently stored reading keys plus per-device ingest counters.
+
+    Counters cover readings handled by this process since it started.
+    """
+
+    def __init__(self, max_entries=DEDUPE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()  # (device_id, timestamp) -> id
+        self._devices = {}
+        self.hits = 0
+        self.misses = 0
+        self.database_duplicates = 0
+
+    def lookup(self, keys):
+        """{key: id} for the keys known to be stored already."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                stored_id = self._keys.get(key)
+                if stored_id is None:
+                    self.misses += 1
+                    continue
+                self._keys.move_to_end(key)
+                found[key] = stored_id
+                self.hits += 1
+        return found
+
+    def remember(self, rows):
+        """Record the keys of committed rows (new or found to be duplicates)."""
+        with self._lock:
+            for row in rows:
+                key = reading_key(row)
+                self._keys[key] = row["id"]
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+
+    def observe(self, stored, duplicates, database_duplicates=0):
+        """Update the per-device counters with one ingest call's outcome."""
+        with self._lock:
+            self.database_duplicates += database_duplicates
+            for row in stored:
+                self._counters(row["device_id"]).stored(row)
+            for row in duplicates:
+                self._counters(row["device_id"]).duplicates += 1
+
+    def _counters(self, device_id):
+        counters = self._devices.get(device_id)
+        if counters is None:
+            counters = self._devices[device_id] = _DeviceCounters()
+        return counters
+
+    def device_stats(self, device_id=None):
+        with self._lock:
+            if device_id is not None:
+                counters = self._devices.get(device_id)
+                return {device_id: counters.as_dict()} if counters else {}
+            return {d: c.as_dict() for d, c in sorted(self._devices.items())}
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._keys)
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "database_duplicates": self.database_duplicates,
+        }
+
+
+recent_keys = RecentKeys()
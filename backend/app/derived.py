@@ -0,0 +1,172 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+
+from database import zambia_tz
+from models import Device, MonitoringData
+from storage import store
+
+# How far back the "change" metrics look
+REFERENCE_WINDOW = timedelta(hours=24)
+
+# How long a cached 24h-ago reference is reused before it is re-queried.
+# Latest values are updated on every ingest; only the reference drifts.
+REFRESH_SECONDS = 60
+
+
+def _reading(row):
+    return {
+        "timestamp": row.timestamp,
+        "ph_value": row.ph_value,
+        "tds_value": row.tds_value,
+        "temperature": row.temperature,
+    }
+
+
+def _closest(target, *candidates):
+    candidates = [c for c in candidates if c is not None]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda c: abs(c["timestamp"] - target))
+
+
+def query_references(db: Session, target):
+    """Latest reading and reading closest to target for every registered device.
+
+    Runs as one statement: per device, three correlated LIMIT 1 subqueries
+    (latest overall, last at/before target, first after target) that each
+    seek the (device_id, timestamp) index, like SQLStorage.latest(), so the
+    cost follows the number of devices rather than the length of history.
+    """
+    def nearest(order_by, where=None):
+        inner = aliased(MonitoringData)
+        stmt = select(inner.id).where(inner.device_id == Device.device_id)
+        if where is not None:
+            stmt = stmt.where(where(inner))
+        return stmt.order_by(*order_by(inner)).limit(1).scalar_subquery()
+
+    latest, before, after = aliased(MonitoringData), aliased(MonitoringData), aliased(MonitoringData)
+    stmt = (
+        select(Device.device_id, latest, before, after)
+        .select_from(Device)
+        .join(latest, latest.id == nearest(lambda m: (m.timestamp.desc(), m.id.desc())))
+        .outerjoin(before, before.id == nearest(lambda m: (m.timestamp.desc(), m.id.desc()),
+                                                lambda m: m.timestamp <= target))
+        .outerjoin(after, after.id == nearest(lambda m: (m.timestamp.asc(), m.id.asc()),
+                                              lambda m: m.timestamp > target))
+    )
+
+    return {
+        row.device_id: (
+            _reading(row[1]),
+            _closest(target, *(_reading(r) if r is not None else None for r in row[2:])),
+        )
+        for row in db.execute(stmt)
+    }
+
+
+def derive(device_id, latest, reference):
+    """Compute the dashboard's change / stability figures for one device."""
+    result = {
+        "device_id": device_id,
+        "latest_timestamp": latest["timestamp"].isoformat(),
+        "reference_timestamp": None,
+        "temperature_change_24h": None,
+        "ph_change_24h": None,
+        "tds_change_24h": None,
+        "tds_change_rate": None,
+        "stability": None,
+    }
+    if reference is None or reference["timestamp"] >= latest["timestamp"]:
+        return result
+
+    d_ph = latest["ph_value"] - reference["ph_value"]
+    d_tds = latest["tds_value"] - reference["tds_value"]
+    d_temp = latest["temperature"] - reference["temperature"]
+    days = (latest["timestamp"] - reference["timestamp"]).total_seconds() / 86400
+
+    result.update({
+        "reference_timestamp": reference["timestamp"].isoformat(),
+        "temperature_change_24h": round(d_temp, 2),
+        "ph_change_24h": round(d_ph, 3),
+        "tds_change_24h": round(d_tds, 2),
+        "tds_change_rate": round(d_tds / days, 2),  # ppm/day
+        # Same scaling the dashboard cards used client-side
+        "stability": {
+            "ph": round(max(0.0, 100 - abs(d_ph) * 20), 1),
+            "temp": round(max(0.0, 100 - abs(d_temp) * 10), 1),
+            "tds": round(max(0.0, 100 - abs(d_tds) * 0.2), 1),
+        },
+    })
+    return result
+
+
+class DerivedMetricsCache:
+    """Per-device latest reading + 24h-ago reference, kept between polls.
+
+    observe() is called for every stored reading and only touches that
+    device's entry; the reference readings are refreshed from the database at
+    most once every REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._refreshed_at = None
+
+    def _stale(self):
+        return self._refreshed_at is None or time.monotonic() - self._refreshed_at > REFRESH_SECONDS
+
+    def refresh(self, db: Session):
+        target = datetime.now(zambia_tz).replace(tzinfo=None) - REFERENCE_WINDOW
+        references = store.references(db, target)
+
+        with self._lock:
+            self._entries = {
+                device_id: {"latest": latest, "reference": reference}
+                for device_id, (latest, reference) in references.items()
+            }
+            self._refreshed_at = time.monotonic()
+
+    def invalidate(self):
+        """Reload from the database on the next snapshot (stored values were rewritten)."""
+        with self._lock:
+            self._refreshed_at = None
+
+    def observe(self, rows):
+        with self._lock:
+            if self._refreshed_at is None:
+                return
+            for row in rows:
+                reading = {
+                    "timestamp": row["timestamp"],
+                    "ph_value": row["ph_value"],
+                    "tds_value": row["tds_value"],
+                    "temperature": row["temperature"],
+                }
+                entry = self._entries.get(row["device_id"])
+                if entry is None:
+                    self._entries[row["device_id"]] = {"latest": reading, "reference": None}
+                elif reading["timestamp"] >= entry["latest"]["timestamp"]:
+                    entry["latest"] = reading
+
+    def snapshot(self, db: Session, device_id=None):
+        if self._stale():
+            self.refresh(db)
+
+        with self._lock:
+            entries = dict(self._entries)
+
+        if device_id is not None:
+            entries = {device_id: entries[device_id]} if device_id in entries else {}
+
+        return [
+            derive(device_id, entry["latest"], entry["reference"])
+            for device_id, entry in sorted(entries.items())
+        ]
+
+
+derived_cache = DerivedMetricsCache()
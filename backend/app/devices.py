@@ -0,0 +1,80 @@
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from database import zambia_tz
+from models import Device
+
+
+def summarize(rows):
+    """Per-device count and time span of a batch of rows."""
+    summary = {}
+    for row in rows:
+        ts = row["timestamp"]
+        entry = summary.get(row["device_id"])
+        if entry is None:
+            summary[row["device_id"]] = {"sample_count": 1, "first_timestamp": ts, "last_timestamp": ts}
+            continue
+        entry["sample_count"] += 1
+        entry["first_timestamp"] = min(entry["first_timestamp"], ts)
+        entry["last_timestamp"] = max(entry["last_timestamp"], ts)
+    return summary
+
+
+def record(db: Session, rows):
+    """Register new devices and bump counters inside the caller's transaction."""
+    summary = summarize(rows)
+    if not summary:
+        return
+
+    now = datetime.now(zambia_tz).replace(tzinfo=None)
+    dialect = db.get_bind().dialect.name
+
+    if dialect not in ("sqlite", "postgresql"):
+        for device_id, entry in summary.items():
+            device = db.execute(select(Device).filter_by(device_id=device_id)).scalar_one_or_none()
+            if device is None:
+                db.add(Device(device_id=device_id, last_seen=now, **entry))
+                continue
+            device.sample_count += entry["sample_count"]
+            device.first_timestamp = min(device.first_timestamp, entry["first_timestamp"])
+            device.last_timestamp = max(device.last_timestamp, entry["last_timestamp"])
+            device.last_seen = now
+        return
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        smallest, largest = func.least, func.greatest
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        smallest, largest = func.min, func.max
+
+    stmt = insert(Device)
+    table = Device.__table__.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["device_id"],
+        set_={
+            "sample_count": table.sample_count + stmt.excluded.sample_count,
+            "first_timestamp": smallest(table.first_timestamp, stmt.excluded.first_timestamp),
+            "last_timestamp": largest(table.last_timestamp, stmt.excluded.last_timestamp),
+            "last_seen": stmt.excluded.last_seen,
+        },
+    )
+    db.execute(stmt, [
+        {"device_id": device_id, "last_seen": now, **entry}
+        for device_id, entry in summary.items()
+    ])
+
+
+def list_devices(db: Session):
+    return [
+        {
+            "device_id": d.device_id,
+            "first_timestamp": d.first_timestamp.isoformat() if d.first_timestamp else None,
+            "last_timestamp": d.last_timestamp.isoformat() if d.last_timestamp else None,
+            "last_seen": d.last_seen.isoformat() if d.last_seen else None,
+            "sample_count": d.sample_count,
+        }
+        for d in db.scalars(select(Device).order_by(Device.device_id))
+    ]
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+def lttb_indices(x, ys, n_out):
+    """Largest-Triangle-Three-Buckets point selection.
+
+    x is a 1-D array of sample positions (e.g. epoch seconds), ys a 2-D array
+    of one row per series sharing that x. Each series is scaled to 0..1 and
+    the triangle areas are summed across series, so one index set keeps the
+    peaks of pH, TDS and temperature together. Returns sorted indices that
+    always include the first and last point.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])[:max(n_out, 1)]
+
+    ys = np.atleast_2d(np.asarray(ys, dtype=float))
+    low = ys.min(axis=1, keepdims=True)
+    span = ys.max(axis=1, keepdims=True) - low
+    span[span == 0] = 1.0
+    ys = (ys - low) / span
+
+    # n_out - 2 buckets over the interior points
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(int)
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = ys[:, end:next_end].mean(axis=1, keepdims=True)
+
+        xa, ya = x[a], ys[:, a:a + 1]
+        area = np.abs(
+            (xa - avg_x) * (ys[:, start:end] - ya) - (xa - x[start:end]) * (avg_y - ya)
+        ).sum(axis=0)
+
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+
+    selected[-1] = n - 1
+    return selected
@@ -0,0 +1,187 @@
+"""Response encoding: fast JSON and compression.
+
+orjson and brotli are optional. Without orjson, dumps() falls back to the
+standard library; without brotli, clients that offer it get gzip instead.
+"""
+import json
+import os
+import zlib
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/csv", "text/plain")
+
+
+def dumps(obj) -> bytes:
+    """Compact JSON bytes. Values must already be JSON types (no datetimes)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    """JSONResponse without validation or jsonable_encoder, for trusted rows."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def coded_etag(tag, coding):
+    """Tag of the `coding`-encoded body: a strong ETag must differ per representation."""
+    if tag.endswith('"'):
+        return f'{tag[:-1]}-{coding}"'
+    return tag
+
+
+def uncoded_etag(tag):
+    """Inverse of coded_etag(); other tags are returned unchanged."""
+    for coding in ("br", "gzip"):
+        suffix = f'-{coding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def negotiate(accept_encoding):
+    """Best content coding the client accepts: "br", "gzip" or None."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    wildcard = offered.get("*", 0.0)
+    if brotli is not None and offered.get("br", wildcard) > 0:
+        return "br"
+    if offered.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, coding):
+        if coding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._compress, self._flush, self._finish = self._c.process, self._c.flush, self._c.finish
+        else:
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+            self._compress = self._c.compress
+            self._flush = lambda: self._c.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._c.flush
+
+    def chunk(self, data, more):
+        """Compressed bytes for data; streamed chunks are flushed so clients see them."""
+        if more:
+            return self._compress(data) + self._flush()
+        return self._compress(data) + self._finish()
+
+
+class CompressionMiddleware:
+    """Plain ASGI middleware compressing JSON, NDJSON, CSV and text bodies.
+
+    Negotiates brotli or gzip from Accept-Encoding. Streamed responses are
+    compressed chunk by chunk. Responses that already have a
+    Content-Encoding, binary exports and event streams pass through.
+    A compressed response's ETag gets the coding appended (coded_etag()),
+    and a 304 repeats the coded tag the client asked with.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        if_none_match = b""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+            elif name == b"if-none-match":
+                if_none_match = value
+        coding = negotiate(accept) if accept else None
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            start = state["start"]
+            if state["compressor"] is None:
+                headers = {k.lower(): v for k, v in start["headers"]}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if (b"content-encoding" in headers
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)
+                        or (not more and len(body) < self.minimum_size)):
+                    state["passthrough"] = True
+                    if start["status"] == 304 and b"etag" in headers:
+                        start = _revalidated(start, headers[b"etag"], if_none_match, coding)
+                    await send(start)
+                    await send(message)
+                    return
+
+                state["compressor"] = _Compressor(coding)
+                raw = [(k, v) for k, v in start["headers"]
+                       if k.lower() not in (b"content-length", b"vary", b"etag")]
+                if b"etag" in headers:
+                    tag = coded_etag(headers[b"etag"].decode("latin-1"), coding)
+                    raw.append((b"etag", tag.encode("latin-1")))
+                vary = headers.get(b"vary")
+                raw.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+                raw.append((b"content-encoding", coding.encode()))
+                data = state["compressor"].chunk(body, more)
+                if not more:
+                    raw.append((b"content-length", str(len(data)).encode()))
+                await send({**start, "headers": raw})
+                await send({"type": "http.response.body", "body": data, "more_body": more})
+                return
+
+            await send({"type": "http.response.body", "body": state["compressor"].chunk(body, more),
+                        "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _revalidated(start, tag, if_none_match, coding):
+    """A 304 names the representation the client has: its coded tag if it sent that one."""
+    coded = coded_etag(tag.decode("latin-1"), coding)
+    candidates = [c.strip() for c in if_none_match.decode("latin-1").split(",")]
+    if coded not in candidates and f"W/{coded}" not in candidates:
+        return start
+    headers = [(k, v) for k, v in start["headers"] if k.lower() != b"etag"]
+    return {**start, "headers": headers + [(b"etag", coded.encode("latin-1"))]}
@@ -1,332 +1,579 @@
-import requests
-import time
+import argparse
 import json
+import logging
+import logging.handlers
+import queue
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import requests
 import serial
 import serial.tools.list_ports
-from datetime import datetime
-import traceback
+from requests.adapters import HTTPAdapter
+
+import frames
+from spool import Backoff, Spool
 
 # Configuration
 BASE_URL = "http://127.0.0.1:8000"  # Update if needed
-DATA_ENDPOINT = f"{BASE_URL}/data"
-SERIAL_PORT = "COM3"
+BATCH_ENDPOINT = f"{BASE_URL}/data/batch"
 BAUD_RATE = 115200  # Adjust to match your ESP32's baud rate
 
-# Log file for raw data (optional)
+# Ports to read. Leave empty to pick up every ESP32 USB bridge that is
+# plugged in (see ESP32_USB_IDS); either way ports are rescanned every
+# SCAN_INTERVAL seconds so boards can be unplugged and replugged.
+SERIAL_PORTS = []
+SCAN_INTERVAL = 5
+# (vendor id, product id) of USB-serial bridges found on ESP32 boards;
+# None matches any product from that vendor
+ESP32_USB_IDS = {
+    (0x10C4, 0xEA60),  # Silicon Labs CP210x
+    (0x1A86, 0x7523),  # WCH CH340
+    (0x1A86, 0x55D4),  # WCH CH9102
+    (0x0403, 0x6001),  # FTDI FT232R
+    (0x303A, None),    # Espressif native USB (S2/S3/C3)
+}
+
+# Readings held between the serial reader and the spool. When the spool
+# writer falls behind, the oldest readings are dropped first.
+READ_QUEUE_SIZE = 1000
+# Spool as soon as BATCH_SIZE readings are queued, or after BATCH_WAIT
+# seconds for whatever has arrived
+BATCH_SIZE = 50
+BATCH_WAIT = 1.0
+# Readings per request when draining the spool (backend limit is 5000)
+REPLAY_BATCH_SIZE = 1000
+RETRY_INITIAL_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+HTTP_TIMEOUT = 5
+# "frames" posts compact binary frames (see frames.py); "json" posts a JSON array
+UPLOAD_FORMAT = "frames"
+STATS_INTERVAL = 30
+
+# Log file for raw data (optional); rotated at RAW_LOG_MAX_BYTES
 RAW_DATA_LOG = "raw_esp32_data.log"
+RAW_LOG_MAX_BYTES = 10 * 1024 * 1024
+RAW_LOG_BACKUPS = 5
+# Raw log records buffered in memory before they are written out
+RAW_LOG_BUFFER = 200
 
-# Simulate multiple monitoring devices
+# Readings carrying their own "device_id" keep it. Otherwise the port is
+# looked up here, and unknown ports fall back to an id made from the
+# board's USB serial number (or the port name).
 DEVICES = [
-    {"id": "esp32_001", "name": "ESP32 Device 1"},
+    {"id": "esp32_001", "name": "ESP32 Device 1", "port": "COM3"},
 ]
 
-def setup_serial():
-    """Initialize serial connection to ESP32"""
+# ESP32 JSON key -> backend field
+FIELD_ALIASES = {
+    "ph": "ph_value", "ph_value": "ph_value",
+    "tds": "tds_value", "tds_value": "tds_value",
+    "temp": "temperature", "temperature": "temperature",
+}
+
+
+class RawLog:
+    """Buffered, size-rotated writer for the raw serial log.
+
+    Records are kept in memory and written RAW_LOG_BUFFER at a time (or
+    straight away for errors), so a busy port does not reopen the file for
+    every line.
+    """
+
+    def __init__(self, path=RAW_DATA_LOG, max_bytes=RAW_LOG_MAX_BYTES,
+                 backups=RAW_LOG_BACKUPS, capacity=RAW_LOG_BUFFER):
+        self._file = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True
+        )
+        self._file.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S"))
+        self._buffer = logging.handlers.MemoryHandler(capacity, logging.ERROR, self._file)
+
+        self.logger = logging.getLogger("esp32_reader.raw")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self._buffer)
+
+    def write(self, message):
+        self.logger.info(message)
+
+    def error(self, message):
+        self.logger.error(message)
+
+    def banner(self, *lines):
+        self.write("\n".join(["=" * 60, *lines, "=" * 60]))
+        self.flush()
+
+    def flush(self):
+        self._buffer.flush()
+
+    def close(self):
+        self.flush()
+        self.logger.removeHandler(self._buffer)
+        self._buffer.close()
+        self._file.close()
+
+
+class ReaderStats:
+    """Counters shared by the gateway threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lines = 0
+        self.invalid = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self.retries = 0
+        self._lag = deque(maxlen=1000)
+
+    def add(self, **counts):
+        with self._lock:
+            for name, amount in counts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def record_lag(self, seconds):
+        with self._lock:
+            self._lag.append(seconds)
+
+    def snapshot(self, queue_depth, spool):
+        with self._lock:
+            lag = sorted(self._lag)
+            counts = {
+                "lines": self.lines, "invalid": self.invalid, "dropped": self.dropped,
+                "sent": self.sent, "failed": self.failed, "batches": self.batches,
+                "retries": self.retries,
+            }
+        return {
+            "queue_depth": queue_depth,
+            "spool_depth": len(spool),
+            "spool_dropped": spool.dropped,
+            **counts,
+            "lag_ms": {
+                "p50": round(lag[len(lag) // 2] * 1000, 1) if lag else None,
+                "max": round(lag[-1] * 1000, 1) if lag else None,
+            },
+        }
+
+
+def detect_ports():
+    """Serial ports whose USB ids look like an ESP32 board."""
+    found = []
+    for port in serial.tools.list_ports.comports():
+        if port.vid is None:
+            continue
+        if (port.vid, port.pid) in ESP32_USB_IDS or (port.vid, None) in ESP32_USB_IDS:
+            found.append(port.device)
+    return found
+
+
+def default_device_id(port):
+    """Device id for readings from port that do not name their device."""
+    for device in DEVICES:
+        if device.get("port") == port:
+            return device["id"]
+    for info in serial.tools.list_ports.comports():
+        if info.device == port and info.serial_number:
+            return f"esp32_{info.serial_number}"
+    return "esp32_" + "".join(c if c.isalnum() else "_" for c in port).strip("_")
+
+
+def open_serial(port):
+    """Open port and discard whatever was buffered before we connected."""
+    ser = serial.Serial(port, BAUD_RATE, timeout=1)
+    ser.reset_input_buffer()
+    ser.reset_output_buffer()
+    return ser
+
+
+def parse_line(raw_line):
+    """Decode one serial line into (data, error); data is None on error."""
     try:
-        # Try to open the specified COM port
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-        print(f"✅ Connected to ESP32 on {SERIAL_PORT} at {BAUD_RATE} baud")
-        
-        # Flush any existing data in the buffer
-        ser.flushInput()
-        ser.flushOutput()
-        
-        # Wait for ESP32 to initialize
-        time.sleep(2)
-        return ser
-        
-    except serial.SerialException as e:
-        print(f"❌ Could not open serial port {SERIAL_PORT}: {e}")
-        print("\nAvailable COM ports:")
-        ports = serial.tools.list_ports.comports()
-        for port in ports:
-            print(f"  - {port.device}: {port.description}")
-        return None
-    except Exception as e:
-        print(f"⚠️ Unexpected error during serial setup: {e}")
-        traceback.print_exc()
-        return None
+        line = raw_line.decode("utf-8").strip()
+    except UnicodeDecodeError:
+        return None, f"BINARY DATA: {raw_line.hex()}"
+    if not line:
+        return None, None
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError as e:
+        return None, f"JSON ERROR: {e} | DATA: {line}"
+    if not isinstance(data, dict):
+        return None, f"NOT AN OBJECT: {line}"
+    return data, None
 
-def read_esp32_data(ser):
-    """Read and parse JSON data from ESP32 - accepts ALL data"""
-    if ser is None:
-        print("⚠️ No serial connection available")
+
+def to_payload(device_id, data, read_at):
+    """Map the ESP32's JSON onto a /data/batch item, or None if a metric is missing."""
+    payload = {"device_id": device_id, "timestamp": read_at.isoformat()}
+    for key, value in data.items():
+        field = FIELD_ALIASES.get(key)
+        if field is None or field in payload:
+            continue
+        try:
+            payload[field] = float(value)
+        except (TypeError, ValueError):
+            return None
+    if not all(field in payload for field in ("ph_value", "tds_value", "temperature")):
         return None
-    
+    return payload
+
+
+def encode_frames(payloads):
+    """Binary frames body for payloads, or None if one of them cannot be framed."""
     try:
-        # Check if data is available
-        if ser.in_waiting > 0:
-            # Read line from serial
-            raw_line = ser.readline()
-            
-            try:
-                # Try to decode as UTF-8
-                line = raw_line.decode('utf-8').strip()
-                
-                # Log raw data to file for debugging
-                with open(RAW_DATA_LOG, 'a') as log_file:
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    log_file.write(f"[{timestamp}] RAW: {raw_line.hex()} | DECODED: {line}\n")
-                
-                print(f"📥 Raw string received: {line}")
-                
-                # Try to parse JSON - even if it contains bad values
-                if line:
-                    try:
-                        data = json.loads(line)
-                        print(f"✅ JSON parsed successfully: {data}")
-                        
-                        # Log successful JSON parse
-                        with open(RAW_DATA_LOG, 'a') as log_file:
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            log_file.write(f"[{timestamp}] JSON: {json.dumps(data)}\n")
-                        
-                        return data
-                    except json.JSONDecodeError as je:
-                        print(f"⚠️ JSON decode error: {je}")
-                        print(f"   Problematic line: {line}")
-                        
-                        # Log JSON error
-                        with open(RAW_DATA_LOG, 'a') as log_file:
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            log_file.write(f"[{timestamp}] JSON ERROR: {je} | DATA: {line}\n")
-                        
-                        # Return the raw line as a special error entry
-                        return {"error": "json_decode_error", "raw_data": line}
-            except UnicodeDecodeError as ude:
-                # Handle non-UTF-8 data
-                print(f"⚠️ Unicode decode error: {ude}")
-                print(f"   Raw bytes: {raw_line.hex()}")
-                
-                # Log binary data
-                with open(RAW_DATA_LOG, 'a') as log_file:
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    log_file.write(f"[{timestamp}] BINARY DATA: {raw_line.hex()}\n")
-                
-                return {"error": "unicode_decode_error", "raw_bytes": raw_line.hex()}
-        else:
-            # No data available
-            return None
-            
-    except Exception as e:
-        print(f"⚠️ Error reading from serial: {e}")
-        traceback.print_exc()
-        
-        # Log the error
-        with open(RAW_DATA_LOG, 'a') as log_file:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_file.write(f"[{timestamp}] READ ERROR: {e}\n")
-        
-        return {"error": "serial_read_error", "message": str(e)}
-
-def send_device_data(device, sensor_data):
-    """Send ALL sensor data to FastAPI backend - accepts any data"""
-    if sensor_data is None:
-        print(f"⚠️ {device['name']} | No data received from ESP32")
-        
-        # Log the null data
-        with open(RAW_DATA_LOG, 'a') as log_file:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_file.write(f"[{timestamp}] {device['name']}: NO DATA\n")
-        
-        return
-    
-    print(f"📤 {device['name']} | Processing data: {sensor_data}")
-    
-    # Handle error entries
-    if "error" in sensor_data:
-        print(f"⚠️ {device['name']} | Data contains error: {sensor_data.get('error')}")
-        
-        # Send error data to backend anyway
-        payload = {
-            "device_id": device["id"],
-            "error": sensor_data.get("error"),
-            "raw_data": str(sensor_data.get("raw_data", "")),
-            "raw_bytes": sensor_data.get("raw_bytes", ""),
-            "is_error": True,
-            "timestamp": datetime.now().isoformat()
-        }
-    else:
-        # Extract data from ESP32 JSON - handle missing or malformed keys
-        payload = {
-            "device_id": device["id"],
-            "is_error": False,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        # Try to extract each value with fallbacks
+        return b"".join(
+            frames.pack(
+                p["device_id"], p.get("seq"),
+                int(datetime.fromisoformat(p["timestamp"]).timestamp() * 1000),
+                p["ph_value"], p["tds_value"], p["temperature"],
+            )
+            for p in payloads
+        )
+    except (frames.FrameError, OverflowError, struct.error):
+        return None
+
+
+class SerialReader(threading.Thread):
+    """Reads one port continuously and queues parsed readings.
+
+    The port is drained as fast as bytes arrive, and both JSON lines and
+    binary frames are accepted; nothing here waits on the network. Each
+    queued item is (payload, epoch seconds it was read). The
+    thread ends when the port goes away; PortManager starts a new one when
+    it comes back.
+    """
+
+    def __init__(self, port, readings, stats, raw_log, device_id=None):
+        super().__init__(name=f"reader-{port}", daemon=True)
+        self.port = port
+        self.device_id = device_id or default_device_id(port)
+        self.readings = readings
+        self.stats = stats
+        self.raw_log = raw_log
+        self.stopping = threading.Event()
+        self.connected = False
+        self.lines = 0
+
+    def run(self):
         try:
-            # pH value - accept any value including invalid ones
-            if "ph" in sensor_data:
-                payload["ph_value"] = float(sensor_data["ph"]) if isinstance(sensor_data["ph"], (int, float, str)) else 0.0
-            elif "ph_value" in sensor_data:
-                payload["ph_value"] = float(sensor_data["ph_value"]) if isinstance(sensor_data["ph_value"], (int, float, str)) else 0.0
-            else:
-                payload["ph_value"] = None
-                payload["ph_missing"] = True
-        except (ValueError, TypeError) as e:
-            payload["ph_value"] = None
-            payload["ph_error"] = str(e)
-            payload["ph_raw"] = str(sensor_data.get("ph", sensor_data.get("ph_value", "unknown")))
-        
+            ser = open_serial(self.port)
+        except (serial.SerialException, OSError) as e:
+            self.raw_log.write(f"{self.port}: OPEN FAILED: {e}")
+            return
+
+        self.connected = True
+        print(f"✅ Connected to {self.port} at {BAUD_RATE} baud")
+        self.raw_log.write(f"{self.port}: CONNECTED")
+        decoder = frames.FrameDecoder()
         try:
-            # TDS value - accept any value
-            if "tds" in sensor_data:
-                payload["tds_value"] = float(sensor_data["tds"]) if isinstance(sensor_data["tds"], (int, float, str)) else 0.0
-            elif "tds_value" in sensor_data:
-                payload["tds_value"] = float(sensor_data["tds_value"]) if isinstance(sensor_data["tds_value"], (int, float, str)) else 0.0
-            else:
-                payload["tds_value"] = None
-                payload["tds_missing"] = True
-        except (ValueError, TypeError) as e:
-            payload["tds_value"] = None
-            payload["tds_error"] = str(e)
-            payload["tds_raw"] = str(sensor_data.get("tds", sensor_data.get("tds_value", "unknown")))
-        
+            while not self.stopping.is_set():
+                data = ser.read(ser.in_waiting or 1)
+                if not data:
+                    continue
+                read_at = time.time()
+                for kind, value in decoder.feed(data):
+                    if kind == "frame":
+                        self.handle_frame(value, read_at)
+                    elif kind == "line":
+                        self.handle(value, read_at)
+                    else:
+                        self.stats.add(invalid=1)
+                        self.raw_log.write(f"{self.port}: BAD FRAME: {value}")
+        except (serial.SerialException, OSError) as e:
+            print(f"🔌 {self.port} disconnected: {e}")
+            self.raw_log.error(f"{self.port}: DISCONNECTED: {e}")
+        finally:
+            self.connected = False
+            ser.close()
+
+    def handle(self, raw_line, read_at):
+        self.lines += 1
+        self.stats.add(lines=1)
+        data, error = parse_line(raw_line)
+        if error:
+            self.stats.add(invalid=1)
+            self.raw_log.write(f"{self.port}: {error}")
+            return
+        if data is None:
+            return
+
+        line = raw_line.decode().strip()
+        self.raw_log.write(f"{self.port}: JSON: {line}")
+        if isinstance(data.get("device_id"), str) and data["device_id"]:
+            self.device_id = data["device_id"]
+        payload = to_payload(self.device_id, data, datetime.now().astimezone())
+        if payload is None:
+            self.stats.add(invalid=1)
+            self.raw_log.write(f"{self.port}: INCOMPLETE: {line}")
+            return
+        self.enqueue((payload, read_at))
+
+    def handle_frame(self, reading, read_at):
+        self.lines += 1
+        self.stats.add(lines=1)
+        if reading["device_id"]:
+            self.device_id = reading["device_id"]
+        self.raw_log.write(
+            f"{self.port}: FRAME: {self.device_id} #{reading['seq']} "
+            f"{reading['ph_value']} {reading['tds_value']} {reading['temperature']}"
+        )
+        if reading["timestamp_ms"]:
+            taken_at = datetime.fromtimestamp(reading["timestamp_ms"] / 1000).astimezone()
+        else:
+            taken_at = datetime.now().astimezone()
+        self.enqueue(({
+            "device_id": self.device_id,
+            "timestamp": taken_at.isoformat(),
+            "ph_value": reading["ph_value"],
+            "tds_value": reading["tds_value"],
+            "temperature": reading["temperature"],
+            "seq": reading["seq"],
+        }, read_at))
+
+    def enqueue(self, item):
+        while True:
+            try:
+                self.readings.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.readings.get_nowait()
+                    self.stats.add(dropped=1)
+                except queue.Empty:
+                    pass
+
+
+class PortManager(threading.Thread):
+    """Keeps one SerialReader running per connected board.
+
+    Every SCAN_INTERVAL seconds the port list (SERIAL_PORTS, or whatever
+    detect_ports finds) is compared with the running readers, and a reader
+    is started for each port without a live one. Readers for unplugged
+    boards end on their own, so replugging a board reconnects it.
+    """
+
+    def __init__(self, readings, stats, raw_log, ports=None, scan_interval=SCAN_INTERVAL):
+        super().__init__(name="port-manager", daemon=True)
+        self.readings = readings
+        self.stats = stats
+        self.raw_log = raw_log
+        self.ports = list(ports) if ports else None
+        self.scan_interval = scan_interval
+        self.readers = {}
+        self.stopping = threading.Event()
+
+    def scan(self):
+        for port in self.ports or detect_ports():
+            previous = self.readers.get(port)
+            if previous is not None and previous.is_alive():
+                continue
+            # A replugged board keeps the device id it announced before
+            device_id = previous.device_id if previous is not None else None
+            reader = SerialReader(port, self.readings, self.stats, self.raw_log, device_id)
+            self.readers[port] = reader
+            reader.start()
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.scan()
+            self.stopping.wait(self.scan_interval)
+
+    def status(self):
+        return {
+            port: {"device_id": reader.device_id, "connected": reader.connected, "lines": reader.lines}
+            for port, reader in self.readers.items()
+        }
+
+    def stop(self):
+        self.stopping.set()
+        for reader in self.readers.values():
+            reader.stopping.set()
+        for reader in self.readers.values():
+            reader.join(timeout=2)
+
+
+class Spooler(threading.Thread):
+    """Moves queued readings into the durable spool in small transactions."""
+
+    def __init__(self, readings, spool, batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT):
+        super().__init__(name="spooler", daemon=True)
+        self.readings = readings
+        self.spool = spool
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.stopping = threading.Event()
+
+    def next_batch(self):
+        """Block for the first reading, then gather more for up to batch_wait seconds."""
         try:
-            # Temperature - accept any value
-            if "temp" in sensor_data:
-                payload["temperature"] = float(sensor_data["temp"]) if isinstance(sensor_data["temp"], (int, float, str)) else 0.0
-            elif "temperature" in sensor_data:
-                payload["temperature"] = float(sensor_data["temperature"]) if isinstance(sensor_data["temperature"], (int, float, str)) else 0.0
+            batch = [self.readings.get(timeout=1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.readings.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while not self.stopping.is_set() or not self.readings.empty():
+            self.spool.append(self.next_batch())
+
+
+class Replayer(threading.Thread):
+    """Drains the spool to /data/batch over one keep-alive session.
+
+    Live traffic goes out in batches as small as one reading. After an
+    outage the backlog is sent REPLAY_BATCH_SIZE at a time with no pause
+    between batches; failed sends back off exponentially up to
+    RETRY_MAX_DELAY.
+    """
+
+    def __init__(self, spool, stats, raw_log, endpoint=BATCH_ENDPOINT,
+                 batch_size=REPLAY_BATCH_SIZE):
+        super().__init__(name="replayer", daemon=True)
+        self.spool = spool
+        self.stats = stats
+        self.raw_log = raw_log
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.backoff = Backoff(RETRY_INITIAL_DELAY, RETRY_MAX_DELAY)
+        self.stopping = threading.Event()
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+    def run(self):
+        while not self.stopping.is_set():
+            if not self.spool.readable.wait(timeout=1):
+                continue
+            batch = self.spool.peek(self.batch_size)
+            if not batch:
+                continue
+            if self.send(batch):
+                if self.backoff.delay:
+                    print(f"✅ Backend reachable again, {len(self.spool)} spooled readings left to replay")
+                self.backoff.succeeded()
             else:
-                payload["temperature"] = None
-                payload["temp_missing"] = True
-        except (ValueError, TypeError) as e:
-            payload["temperature"] = None
-            payload["temp_error"] = str(e)
-            payload["temp_raw"] = str(sensor_data.get("temp", sensor_data.get("temperature", "unknown")))
-        
-        # Include any additional fields from the ESP32
-        for key, value in sensor_data.items():
-            if key not in ["ph", "ph_value", "tds", "tds_value", "temp", "temperature"]:
-                payload[f"esp32_{key}"] = str(value)
-    
-    print(f"📦 {device['name']} | Sending payload: {payload}")
-    
-    try:
-        response = requests.post(DATA_ENDPOINT, json=payload, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ {device['name']} | Data sent successfully | ID: {data.get('id', 'N/A')}")
-            
-            # Log successful transmission
-            with open(RAW_DATA_LOG, 'a') as log_file:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                log_file.write(f"[{timestamp}] {device['name']}: SENT | RESPONSE: {data.get('id', 'N/A')}\n")
-        else:
-            print(f"❌ {device['name']} | HTTP {response.status_code}: {response.text}")
-            
-            # Log HTTP error
-            with open(RAW_DATA_LOG, 'a') as log_file:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                log_file.write(f"[{timestamp}] {device['name']}: HTTP ERROR {response.status_code} | {response.text[:100]}\n")
-    except requests.exceptions.ConnectionError:
-        print(f"🔌 {device['name']} | Connection failed - Is FastAPI running?")
-        
-        # Log connection error
-        with open(RAW_DATA_LOG, 'a') as log_file:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_file.write(f"[{timestamp}] {device['name']}: CONNECTION FAILED - FastAPI not reachable\n")
-    except Exception as e:
-        print(f"⚠️ {device['name']} | Error sending data: {e}")
-        traceback.print_exc()
-        
-        # Log send error
-        with open(RAW_DATA_LOG, 'a') as log_file:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_file.write(f"[{timestamp}] {device['name']}: SEND ERROR: {e}\n")
-
-def monitor_device(device, ser, interval=5):
-    """Monitor a device and send ALL data at intervals (seconds)"""
-    print(f"🔍 {device['name']} | Starting monitor (interval: {interval}s)")
-    
-    while True:
+                delay = self.backoff.failed()
+                self.stats.add(retries=1)
+                self.stopping.wait(delay)
+        self.session.close()
+
+    def post(self, payloads):
+        body = encode_frames(payloads) if UPLOAD_FORMAT == "frames" else None
+        if body is None:
+            return self.session.post(self.endpoint, json=payloads, timeout=HTTP_TIMEOUT)
+        return self.session.post(self.endpoint, data=body, timeout=HTTP_TIMEOUT,
+                                 headers={"Content-Type": frames.CONTENT_TYPE})
+
+    def send(self, batch):
+        """POST one batch; True once the backend has taken responsibility for it."""
+        payloads = [payload for _, payload, _ in batch]
         try:
-            # Read data from ESP32
-            sensor_data = read_esp32_data(ser)
-            
-            # Send whatever we got (even None or errors)
-            send_device_data(device, sensor_data)
-            
-            # Wait for next reading
-            time.sleep(interval)
-            
-        except Exception as e:
-            print(f"⚠️ {device['name']} | Monitor error: {e}")
-            traceback.print_exc()
-            
-            # Log monitor error
-            with open(RAW_DATA_LOG, 'a') as log_file:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                log_file.write(f"[{timestamp}] {device['name']}: MONITOR ERROR: {e}\n")
-            
-            # Wait before retrying
-            time.sleep(interval)
+            response = self.post(payloads)
+        except requests.exceptions.ConnectionError:
+            if not self.backoff.delay:
+                print("🔌 Connection failed - Is FastAPI running? Spooling readings locally")
+                self.raw_log.error("CONNECTION FAILED - spooling")
+            return False
+        except requests.exceptions.RequestException as e:
+            if not self.backoff.delay:
+                print(f"⚠️ Error sending batch: {e}")
+                self.raw_log.error(f"SEND ERROR: {e}")
+            return False
+
+        if response.status_code >= 500 or response.status_code in (408, 429):
+            if not self.backoff.delay:
+                print(f"❌ HTTP {response.status_code}: {response.text[:200]}")
+                self.raw_log.error(f"HTTP ERROR {response.status_code} | {response.text[:100]}")
+            return False
+
+        last_seq = batch[-1][0]
+        if response.status_code != 200:
+            # Retrying a request the backend refuses would block the spool forever
+            print(f"❌ HTTP {response.status_code}, discarding {len(batch)} readings: {response.text[:200]}")
+            self.raw_log.error(f"REJECTED {len(batch)} readings | HTTP {response.status_code} | {response.text[:100]}")
+            self.spool.ack(last_seq)
+            self.stats.add(failed=len(batch))
+            return True
+
+        self.spool.ack(last_seq)
+        acked = time.time()
+        for _, _, read_at in batch:
+            self.stats.record_lag(acked - read_at)
+        result = response.json()
+        self.stats.add(sent=result.get("saved", 0), failed=result.get("failed", 0), batches=1)
+        self.raw_log.write(f"SENT {result.get('saved', 0)}/{len(batch)} readings")
+        return True
+
 
 def main():
-    import threading
+    parser = argparse.ArgumentParser(description="Forward ESP32 serial readings to the backend")
+    parser.add_argument("--port", action="append", dest="ports",
+                        help="serial port to read (repeatable); default: SERIAL_PORTS or autodetect")
+    args = parser.parse_args()
+    ports = args.ports or SERIAL_PORTS
 
     print("💧 Starting Water Quality Monitoring - ESP32 Integration")
-    print("⚠️  ACCEPTING ALL DATA (including errors and invalid values)")
-    print(f"📡 Connecting to ESP32 on {SERIAL_PORT}...")
-    
-    # Initialize log file
-    with open(RAW_DATA_LOG, 'a') as log_file:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_file.write(f"\n{'='*60}\n")
-        log_file.write(f"ESP32 Monitoring Session Started: {timestamp}\n")
-        log_file.write(f"Serial Port: {SERIAL_PORT} | Baud Rate: {BAUD_RATE}\n")
-        log_file.write(f"{'='*60}\n\n")
-    
+    print(f"📡 Reading {', '.join(ports) if ports else 'every detected ESP32'}")
+
+    raw_log = RawLog()
+    raw_log.banner(
+        f"ESP32 Monitoring Session Started: {datetime.now():%Y-%m-%d %H:%M:%S}",
+        f"Serial Ports: {', '.join(ports) if ports else 'autodetect'} | Baud Rate: {BAUD_RATE}",
+    )
     print(f"📝 Raw data will be logged to: {RAW_DATA_LOG}")
-    
-    # Setup serial connection
-    ser = setup_serial()
-    
-    if ser is None:
-        print("❌ Failed to establish serial connection. Running in debug mode.")
-        print("⚠️  Will continue to log to file but no serial data will be received.")
-        
-        # You can still run without serial for testing
-        # Create a dummy serial object for the thread
-        ser = type('DummySerial', (), {
-            'in_waiting': 0,
-            'readline': lambda: b'',
-            'close': lambda: None
-        })()
-    
-    print("✅ Ready to receive ALL data from ESP32")
-    print("   - Valid JSON data")
-    print("   - Invalid JSON data")
-    print("   - Binary/garbage data")
-    print("   - Empty data")
-    print("   - Everything will be logged to file and sent to backend")
-    
-    threads = []
-    for device in DEVICES:
-        t = threading.Thread(target=monitor_device, args=(device, ser), daemon=True)
-        threads.append(t)
-        t.start()
-        time.sleep(0.5)  # Slight stagger
+
+    spool = Spool()
+    if len(spool):
+        print(f"📦 {len(spool)} readings left in the spool from a previous run will be replayed")
+
+    readings = queue.Queue(maxsize=READ_QUEUE_SIZE)
+    stats = ReaderStats()
+    manager = PortManager(readings, stats, raw_log, ports)
+    spooler = Spooler(readings, spool)
+    replayer = Replayer(spool, stats, raw_log)
+    manager.start()
+    spooler.start()
+    replayer.start()
+    print(f"✅ Spooling to {spool.path}")
 
     try:
         while True:
-            time.sleep(1)
+            time.sleep(STATS_INTERVAL)
+            if not manager.status():
+                print("⚠️ No ESP32 found yet; available ports:")
+                for port in serial.tools.list_ports.comports():
+                    print(f"  - {port.device}: {port.description}")
+            print(f"📊 {json.dumps({**stats.snapshot(readings.qsize(), spool), 'ports': manager.status()})}")
     except KeyboardInterrupt:
         print("\n🛑 Monitoring stopped by user")
     finally:
-        # Close serial connection
-        if hasattr(ser, 'close'):
-            ser.close()
-            print("🔌 Serial connection closed")
-        
-        # Log session end
-        with open(RAW_DATA_LOG, 'a') as log_file:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_file.write(f"\n{'='*60}\n")
-            log_file.write(f"ESP32 Monitoring Session Ended: {timestamp}\n")
-            log_file.write(f"{'='*60}\n\n")
+        # Everything read so far reaches the spool; unsent readings wait there for the next run
+        manager.stop()
+        manager.join(timeout=2)
+        print("🔌 Serial connections closed")
+        spooler.stopping.set()
+        spooler.join(timeout=BATCH_WAIT + 2)
+        replayer.stopping.set()
+        replayer.join(timeout=HTTP_TIMEOUT + 1)
+        spool.close()
+        print(f"📊 {json.dumps(stats.snapshot(readings.qsize(), spool))}")
+
+        raw_log.banner(f"ESP32 Monitoring Session Ended: {datetime.now():%Y-%m-%d %H:%M:%S}")
+        raw_log.close()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,121 @@
+"""Bulk export of readings as CSV, Parquet or Arrow IPC.
+
+Rows are read in chunks (archived days first, then the hot table) and each
+chunk is encoded and handed on before the next is read, so memory use does
+not grow with the size of the export. Used by GET /export and as a CLI:
+
+    python export.py --format parquet --device device_001 \\
+        --from 2026-01-01 --to 2026-02-01 -o device_001.parquet
+"""
+import argparse
+import csv
+import io
+from datetime import datetime
+
+import archive
+from storage import store
+
+# format -> (media type, file extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+
+def _chunks(device_id, start, end):
+    return store.stream(device_id, start, end)
+
+
+def _csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(archive.COLUMNS)
+    for rows in chunks:
+        writer.writerows(
+            (r.id, r.device_id, r.timestamp.isoformat(), r.ph_value, r.tds_value, r.temperature)
+            for r in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _arrow(chunks, fmt):
+    pa = archive.require_pyarrow()
+    import pyarrow.ipc
+
+    sink = _Sink()
+    if fmt == "parquet":
+        writer = pa.parquet.ParquetWriter(sink, archive.schema(), compression="zstd")
+    else:
+        writer = pyarrow.ipc.new_stream(sink, archive.schema())
+
+    for rows in chunks:
+        writer.write_batch(archive.rows_to_batch(rows))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def check_format(fmt):
+    """Raise ValueError / RuntimeError up front rather than mid-stream."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt != "csv":
+        archive.require_pyarrow()
+
+
+def stream(fmt, device_id=None, start=None, end=None):
+    """Encoded export as an iterator of byte chunks."""
+    check_format(fmt)
+    chunks = _chunks(device_id, start, end)
+    return _csv(chunks) if fmt == "csv" else _arrow(chunks, fmt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export readings to CSV, Parquet or Arrow IPC")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    parser.add_argument("--device", help="only this device_id")
+    parser.add_argument("--from", dest="start", type=datetime.fromisoformat, help="inclusive start time")
+    parser.add_argument("--to", dest="end", type=datetime.fromisoformat, help="exclusive end time")
+    parser.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+
+    with open(args.output, "wb") as out:
+        for data in stream(args.format, args.device, args.start, args.end):
+            out.write(data)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
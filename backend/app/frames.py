@@ -0,0 +1,140 @@
+"""Fixed-layout binary reading frames.
+
+One reading is 48 bytes, little-endian:
+
+    offset  size  field
+    0       2     magic b"WQ"
+    2       1     version (1)
+    3       1     flags       bit 0 (FLAG_NO_SEQ): the reading has no seq; others reserved, 0
+    4       16    device_id, UTF-8, NUL-padded
+    20      4     seq         uint32, per-device sequence number
+    24      8     timestamp   int64, Unix epoch milliseconds (0 = stamp on receipt)
+    32      4     ph_value    float32
+    36      4     tds_value   float32
+    40      4     temperature float32
+    44      4     CRC-32 of bytes 0..43
+
+The ESP32 firmware can write these on the serial line instead of JSON, and
+the gateway can POST them back to back to /data/batch with Content-Type
+CONTENT_TYPE. JSON stays accepted everywhere.
+"""
+import struct
+import zlib
+
+MAGIC = b"WQ"
+VERSION = 1
+# Magic plus version byte: what the stream decoder searches for, so text
+# that happens to contain "WQ" is not mistaken for a frame
+SYNC = MAGIC + bytes([VERSION])
+CONTENT_TYPE = "application/vnd.wqm.frames"
+# Set when the sender had no sequence number; seq is then 0 and decodes as None
+FLAG_NO_SEQ = 0x01
+
+_BODY = struct.Struct("<2sBB16sIqfff")
+_CRC = struct.Struct("<I")
+FRAME = struct.Struct("<2sBB16sIqfffI")
+FRAME_SIZE = FRAME.size  # 48
+
+# Longest line the stream decoder buffers while looking for a newline
+MAX_LINE = 4096
+
+
+class FrameError(ValueError):
+    pass
+
+
+def pack(device_id, seq, timestamp_ms, ph_value, tds_value, temperature):
+    """One frame; seq may be None for a reading without a sequence number."""
+    encoded = device_id.encode()
+    if len(encoded) > 16:
+        raise FrameError(f"device_id longer than 16 bytes: {device_id!r}")
+    flags = FLAG_NO_SEQ if seq is None else 0
+    body = _BODY.pack(MAGIC, VERSION, flags, encoded, (seq or 0) & 0xFFFFFFFF, timestamp_ms,
+                      ph_value, tds_value, temperature)
+    return body + _CRC.pack(zlib.crc32(body))
+
+
+def _decode(fields, crc_ok):
+    magic, version, flags, device_id, seq, timestamp_ms, ph, tds, temp, _ = fields
+    if magic != MAGIC:
+        raise FrameError("bad magic")
+    if version != VERSION:
+        raise FrameError(f"unsupported frame version {version}")
+    if not crc_ok:
+        raise FrameError("checksum mismatch")
+    return {
+        "device_id": device_id.rstrip(b"\0").decode(errors="replace"),
+        "seq": None if flags & FLAG_NO_SEQ else seq,
+        "timestamp_ms": timestamp_ms,
+        # float32 carries ~7 significant digits; drop the binary noise past them
+        "ph_value": float(f"{ph:.7g}"),
+        "tds_value": float(f"{tds:.7g}"),
+        "temperature": float(f"{temp:.7g}"),
+    }
+
+
+def unpack(frame):
+    """Decode one FRAME_SIZE-byte frame; raises FrameError."""
+    if len(frame) != FRAME_SIZE:
+        raise FrameError(f"frame must be {FRAME_SIZE} bytes, got {len(frame)}")
+    fields = FRAME.unpack(frame)
+    return _decode(fields, zlib.crc32(frame[:-4]) == fields[-1])
+
+
+def unpack_many(body):
+    """Decode back-to-back frames into a list of readings or FrameError instances."""
+    if len(body) % FRAME_SIZE:
+        raise FrameError(f"body length {len(body)} is not a multiple of {FRAME_SIZE}")
+    view = memoryview(body)
+    items = []
+    for offset, fields in zip(range(0, len(body), FRAME_SIZE), FRAME.iter_unpack(body)):
+        try:
+            crc_ok = zlib.crc32(view[offset:offset + FRAME_SIZE - 4]) == fields[-1]
+            items.append(_decode(fields, crc_ok))
+        except FrameError as e:
+            items.append(e)
+    return items
+
+
+class FrameDecoder:
+    """Splits a serial byte stream into binary frames and text lines.
+
+    feed() returns ("frame", reading), ("line", bytes) and ("error", message)
+    events. A frame that fails its checksum costs one byte, and the decoder
+    resynchronises on the next SYNC or newline.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        self._buffer += data
+        events = []
+        buf = self._buffer
+        while buf:
+            if buf[:3] == SYNC:
+                if len(buf) < FRAME_SIZE:
+                    break
+                try:
+                    events.append(("frame", unpack(bytes(buf[:FRAME_SIZE]))))
+                    del buf[:FRAME_SIZE]
+                except FrameError as e:
+                    events.append(("error", f"{e}: {bytes(buf[:FRAME_SIZE]).hex()}"))
+                    del buf[:1]
+                continue
+
+            newline = buf.find(b"\n")
+            magic = buf.find(SYNC)
+            if magic != -1 and (newline == -1 or magic < newline):
+                # Noise before a frame
+                events.append(("line", bytes(buf[:magic])))
+                del buf[:magic]
+            elif newline != -1:
+                events.append(("line", bytes(buf[:newline + 1])))
+                del buf[:newline + 1]
+            elif len(buf) > MAX_LINE:
+                events.append(("line", bytes(buf)))
+                buf.clear()
+            else:
+                break
+        return events
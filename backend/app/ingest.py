@@ -0,0 +1,253 @@
+import json
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+import pytz
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+import alerts
+from alerts import alert_engine
+from bus import CHUNK_ALERTS, CHUNK_ROWS, cache_bus
+from calibration import calibrate_rows
+from chart_cache import chart_cache
+from database import zambia_tz
+from dedupe import reading_key, recent_keys
+from derived import derived_cache
+from latest import latest_cache
+import frames
+from live import hub
+import metrics
+import devices
+import rollups
+from schemas import MonitoringDataSchema
+from storage import store
+
+# Upper bound on readings accepted by one /data/batch request
+MAX_BATCH_SIZE = 5000
+
+
+_EPOCH = datetime(1970, 1, 1)
+_HOUR_MS = 3_600_000
+_MS = timedelta(milliseconds=1)
+
+
+@lru_cache(maxsize=4096)
+def _local_offset(epoch_hour):
+    """Africa/Lusaka UTC offset in effect during one hour since the epoch.
+
+    A pytz conversion costs several microseconds, which adds up on bulk
+    ingest; offsets only change on hour boundaries, so one lookup per hour
+    is enough.
+    """
+    utc = pytz.utc.localize(_EPOCH + timedelta(hours=epoch_hour))
+    return utc.astimezone(zambia_tz).utcoffset()
+
+
+def local_timestamp(ts=None):
+    """Normalise a reading time to naive Africa/Lusaka wall time.
+
+    This is what SQLite hands back on read, so in-memory caches fed from the
+    ingest path compare equal to rows loaded from the database.
+    """
+    if ts is None:
+        ts = datetime.now(timezone.utc)
+    if ts.tzinfo is not None:
+        utc = ts.replace(tzinfo=None) - ts.utcoffset()
+        return utc + _local_offset(int(ts.timestamp() // 3600))
+    return ts
+
+
+def local_timestamp_ms(timestamp_ms):
+    """local_timestamp for Unix epoch milliseconds; 0 means now."""
+    if not timestamp_ms:
+        return local_timestamp()
+    return _EPOCH + timedelta(milliseconds=timestamp_ms) + _local_offset(timestamp_ms // _HOUR_MS)
+
+
+@lru_cache(maxsize=4096)
+def _offset_at_local(local_hour):
+    """Africa/Lusaka UTC offset in effect at one local wall-clock hour."""
+    return zambia_tz.localize(_EPOCH + timedelta(hours=local_hour)).utcoffset()
+
+
+def epoch_ms(ts):
+    """Unix epoch milliseconds for a stored (naive Africa/Lusaka) timestamp."""
+    local_ms = (ts - _EPOCH) // _MS
+    return local_ms - _offset_at_local(local_ms // _HOUR_MS) // _MS
+
+
+def to_row(data: MonitoringDataSchema) -> dict:
+    """Turn a validated reading into a Monitoring_Data row dict."""
+    return {
+        "device_id": data.device_id,
+        "ph_value": data.ph_value,
+        "tds_value": data.tds_value,
+        "temperature": data.temperature,
+        "timestamp": local_timestamp(data.timestamp),
+        "seq": data.seq,
+    }
+
+
+def parse_items(items):
+    """Validate raw batch items one by one.
+
+    Returns (rows, errors) where rows is a list of (index, row) for the items
+    that validated and errors is a list of {"index", "error"} dicts.
+    """
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        if isinstance(item, Exception):
+            errors.append({"index": index, "error": str(item)})
+            continue
+        try:
+            rows.append((index, to_row(MonitoringDataSchema.model_validate(item))))
+        except ValidationError as e:
+            errors.append({"index": index, "error": e.errors(include_url=False)})
+    return rows, errors
+
+
+def parse_ndjson(body: bytes):
+    """Split an NDJSON body into items; undecodable lines become exceptions."""
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            items.append(e)
+    return items
+
+
+def parse_frames(body: bytes):
+    """Decode a binary frames body into (rows, errors) like parse_items.
+
+    Frames are already typed, so they skip schema validation. Raises
+    frames.FrameError if the body is not a whole number of frames.
+    """
+    rows = []
+    errors = []
+    for index, item in enumerate(frames.unpack_many(body)):
+        if isinstance(item, Exception):
+            errors.append({"index": index, "error": str(item)})
+            continue
+        rows.append((index, {
+            "device_id": item["device_id"],
+            "ph_value": item["ph_value"],
+            "tds_value": item["tds_value"],
+            "temperature": item["temperature"],
+            "timestamp": local_timestamp_ms(item["timestamp_ms"]),
+            "seq": item["seq"],
+        }))
+    return rows, errors
+
+
+def insert_readings(db: Session, rows):
+    """Store rows through the configured storage backend and commit once.
+
+    Idempotent on (device_id, timestamp): a reading that is already stored
+    (a retried upload) is not stored again and gets the stored reading's
+    id, with row["duplicate"] set. Recent keys are checked in memory first;
+    the rest go to the database, where the unique index settles it.
+    New readings covered by a calibration profile are converted first.
+
+    With the SQL backend the new rows are one executemany statement, and the
+    device registry, the 1m/1h/1d rollups and the alert table are updated in
+    the same transaction. Returns ids in the same order as rows.
+    """
+    if not rows:
+        return []
+
+    known = recent_keys.lookup([reading_key(row) for row in rows])
+    fresh = {}
+    for row in rows:
+        key = reading_key(row)
+        if key in known:
+            row["id"] = known[key]
+            row["duplicate"] = True
+        elif key in fresh:
+            row["duplicate"] = True  # repeated within the batch
+        else:
+            fresh[key] = row
+
+    stored, alert_changes = [], None
+    if fresh:
+        calibrate_rows(fresh.values())
+        for row, new_id in zip(fresh.values(), store.append(db, list(fresh.values()))):
+            row["id"] = new_id
+        stored = [row for row in fresh.values() if not row.get("duplicate")]
+        if stored:
+            devices.record(db, stored)
+            rollups.apply(db, stored)
+            alert_changes = alert_engine.evaluate(db, stored)
+        try:
+            db.commit()
+        except BaseException:
+            if alert_changes is not None:
+                alert_engine.discard(alert_changes)
+            raise
+
+    for row in rows:
+        if "id" not in row:
+            row["id"] = fresh[reading_key(row)]["id"]
+    duplicates = [row for row in rows if row.get("duplicate")]
+    recent_keys.remember(fresh.values())
+    recent_keys.observe(stored, duplicates, len(fresh) - len(stored))
+    metrics.observe_duplicates(duplicates)
+    publish(stored, alert_changes)
+    return [row["id"] for row in rows]
+
+
+def publish(rows, alert_changes=None):
+    """Feed freshly committed rows to the in-process caches and live subscribers.
+
+    alert_changes is what alert_engine.evaluate() staged for the same commit.
+    """
+    alert_events = alert_engine.apply(alert_changes) if alert_changes is not None else []
+    latest_cache.observe(rows)
+    derived_cache.observe(rows)
+    chart_cache.observe(rows)
+    metrics.observe_ingest(rows)
+    hub.publish(rows)
+    items = [alerts.to_item(event) for event in alert_events]
+    if items:
+        metrics.observe_alerts(alert_events)
+        hub.publish_alerts(items)
+    if cache_bus.enabled:
+        share(rows, items)
+
+
+_SHARED_FIELDS = ("id", "device_id", "ph_value", "tds_value", "temperature")
+
+
+def share(rows, alert_items):
+    """Send committed rows and alert changes to the other workers (see bus.py).
+
+    Both are split so every datagram stays well under the UDP size limit.
+    """
+    messages = max(-(-len(rows) // CHUNK_ROWS), -(-len(alert_items) // CHUNK_ALERTS), 1)
+    for i in range(messages):
+        chunk = rows[i * CHUNK_ROWS:(i + 1) * CHUNK_ROWS]
+        cache_bus.send({
+            "type": "readings",
+            "rows": [{**{f: row[f] for f in _SHARED_FIELDS}, "timestamp": row["timestamp"].isoformat()}
+                     for row in chunk],
+            "alerts": alert_items[i * CHUNK_ALERTS:(i + 1) * CHUNK_ALERTS],
+        })
+
+
+def apply_shared(message):
+    """The receiving side of share(): what publish() does, minus the metrics."""
+    rows = message["rows"]
+    for row in rows:
+        row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+    recent_keys.remember(rows)
+    latest_cache.observe(rows)
+    derived_cache.observe(rows)
+    chart_cache.observe(rows)
+    alert_engine.replay(rows, message["alerts"])
+    hub.publish(rows)
+    if message["alerts"]:
+        hub.publish_alerts(message["alerts"])
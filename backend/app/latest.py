@@ -0,0 +1,109 @@
+import threading
+
+from sqlalchemy.orm import Session
+
+from storage import store
+
+
+def _reading(row):
+    return {
+        "id": row["id"],
+        "device_id": row["device_id"],
+        "ph_value": row["ph_value"],
+        "tds_value": row["tds_value"],
+        "temperature": row["temperature"],
+        "timestamp": row["timestamp"],
+    }
+
+
+class LatestReadingCache:
+    """Write-through cache of the newest reading per device.
+
+    warm() loads every device's latest row with one query, observe()
+    is fed each committed reading by the ingest path, and the read helpers
+    answer from memory. A device that is not cached yet (e.g. written by
+    another process) is looked up once and counted as a miss.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._readings = {}
+        self._warmed = False
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, db: Session):
+        readings = {row["device_id"]: _reading(row) for row in store.latest(db)}
+        with self._lock:
+            self._readings = readings
+            self._warmed = True
+
+    def observe(self, rows):
+        with self._lock:
+            for row in rows:
+                current = self._readings.get(row["device_id"])
+                if current is None or row["timestamp"] >= current["timestamp"]:
+                    self._readings[row["device_id"]] = _reading(row)
+
+    def _ensure_warm(self, db: Session):
+        if self._warmed:
+            self.hits += 1
+            return
+        self.misses += 1
+        self.warm(db)
+
+    def all(self, db: Session):
+        """Latest reading of every device, ordered by device_id."""
+        self._ensure_warm(db)
+        with self._lock:
+            return [self._readings[d] for d in sorted(self._readings)]
+
+    def device_ids(self, db: Session):
+        self._ensure_warm(db)
+        with self._lock:
+            return sorted(self._readings)
+
+    def newest(self, db: Session):
+        """The most recent reading across all devices, or None."""
+        self._ensure_warm(db)
+        with self._lock:
+            return max(self._readings.values(), key=lambda r: r["timestamp"], default=None)
+
+    def many(self, db: Session, device_ids):
+        """{device_id: latest reading} for the given devices, from memory only.
+
+        Devices without readings are left out rather than looked up one by
+        one, so a map of a thousand sites costs a single lock.
+        """
+        self._ensure_warm(db)
+        with self._lock:
+            return {d: self._readings[d] for d in device_ids if d in self._readings}
+
+    def get(self, db: Session, device_id):
+        with self._lock:
+            reading = self._readings.get(device_id)
+        if reading is not None:
+            self.hits += 1
+            return reading
+
+        self.misses += 1
+        found = store.latest(db, device_id)
+        if not found:
+            return None
+
+        self.observe(found)
+        return _reading(found[0])
+
+    def stats(self):
+        with self._lock:
+            devices = len(self._readings)
+        total = self.hits + self.misses
+        return {
+            "devices": devices,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+
+latest_cache = LatestReadingCache()
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+# Messages buffered per client before the oldest are dropped
+QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+
+
+class Subscriber:
+    """One connected client: a bounded queue that drops its oldest entries when full."""
+
+    def __init__(self, loop, devices=None, maxlen=QUEUE_SIZE):
+        self.loop = loop
+        self.devices = set(devices) if devices else None
+        self._queue = deque(maxlen=maxlen)
+        self._ready = asyncio.Event()
+        self.delivered = 0
+        self.dropped = 0
+
+    def wants(self, device_id):
+        return self.devices is None or device_id in self.devices
+
+    def push(self, message):
+        """Runs on the subscriber's event loop (via call_soon_threadsafe)."""
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(message)
+        self._ready.set()
+
+    async def get(self, timeout=None):
+        """Next message, or None if nothing arrived within timeout seconds."""
+        while not self._queue:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self.delivered += 1
+        return self._queue.popleft()
+
+
+class LiveHub:
+    """Fans out committed readings to WebSocket / SSE subscribers.
+
+    publish() is called from the ingest path, which runs in worker threads,
+    so messages are handed to each subscriber's loop thread-safely.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.published = 0
+        self._delivered_closed = 0
+        self._dropped_closed = 0
+        self._latency_ms = deque(maxlen=1000)
+
+    def subscribe(self, devices=None):
+        subscriber = Subscriber(asyncio.get_running_loop(), devices)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.discard(subscriber)
+                self._delivered_closed += subscriber.delivered
+                self._dropped_closed += subscriber.dropped
+
+    def _fan_out(self, messages):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+
+        for message in messages:
+            self.published += 1
+            for subscriber in subscribers:
+                if subscriber.wants(message["device_id"]):
+                    try:
+                        subscriber.loop.call_soon_threadsafe(subscriber.push, message)
+                    except RuntimeError:  # loop already closed
+                        self.unsubscribe(subscriber)
+
+    def publish(self, rows):
+        if not self._subscribers:
+            return
+        ingested_at = int(time.time() * 1000)
+        self._fan_out({
+            "type": "reading",
+            "id": row.get("id"),
+            "device_id": row["device_id"],
+            "ph_value": row["ph_value"],
+            "tds_value": row["tds_value"],
+            "temperature": row["temperature"],
+            "timestamp": row["timestamp"].isoformat(),
+            "ingested_at": ingested_at,
+        } for row in rows)
+
+    def publish_alerts(self, alerts):
+        """alerts are already in their JSON shape (alerts.to_item)."""
+        if not self._subscribers:
+            return
+        self._fan_out({
+            "type": "alert",
+            "status": "resolved" if alert["resolved_at"] else "raised",
+            **alert,
+        } for alert in alerts)
+
+    def sent(self, message):
+        """Record ingest-to-send latency for a message about to go out."""
+        now = int(time.time() * 1000)
+        if "ingested_at" in message:
+            self._latency_ms.append(now - message["ingested_at"])
+        return dict(message, sent_at=now)
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            delivered, dropped = self._delivered_closed, self._dropped_closed
+        latencies = sorted(self._latency_ms)
+        return {
+            "subscribers": len(subscribers),
+            "published": self.published,
+            "delivered": delivered + sum(s.delivered for s in subscribers),
+            "dropped": dropped + sum(s.dropped for s in subscribers),
+            "send_latency_ms": {
+                "p50": latencies[len(latencies) // 2] if latencies else None,
+                "p99": latencies[int(len(latencies) * 0.99)] if latencies else None,
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+
+
+hub = LiveHub()
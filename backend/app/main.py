@@ -1,17 +1,93 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
-from typing import List
-from sqlalchemy import desc
-from database import SessionLocal, engine
-from models import Base, MonitoringData, User, WaterBody
-from schemas import MonitoringDataSchema, UserLogin
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from database import AsyncSessionLocal, SessionLocal, async_engine, engine, run_db, zambia_tz
+from models import Alert, Device, ReprocessJob, User, WaterBody
+from schemas import CalibrationProfileSchema, MonitoringDataSchema, ReprocessRequest, UserLogin
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timedelta
-import pytz  # add this
+import json
+import logging
+import os
+import time
+import devices
+import encoding
+import frames
+import ingest
+import manage
+import metrics
+import migrations
+import pagination
+import rollups
+import alerts
+from alerts import alert_engine
+from bus import cache_bus
+import calibration
+from calibration import calibration_profiles
+from chart_cache import cache_control, chart_cache, etag, etag_matches
+from dedupe import recent_keys
+from derived import derived_cache
+from encoding import FastJSONResponse, dumps
+from latest import latest_cache
+from storage import store
+from sites import cluster, parse_bbox, parse_point, site_index
+from writebehind import INGEST_MODE, QueueFull, write_buffer
+from live import hub
+import asyncio
+from contextlib import asynccontextmanager
+
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s level=%(levelname)s logger=%(name)s %(message)s",
+)
+logger = logging.getLogger("water_monitoring")
+
+# -------------------------
+# Startup and shutdown
+# -------------------------
+# Importing this module does no database work, so workers and reloads start
+# fast; setup and cache warming run in the lifespan instead.
+DB_AUTO_SETUP = os.getenv("DB_AUTO_SETUP", "1").lower() in ("1", "true", "yes")
+
+
+def on_bus_message(message):
+    """Writes committed by another worker (see bus.py)."""
+    if message["type"] == "readings":
+        ingest.apply_shared(message)
+    elif message["type"] == "site":
+        site_index.set(message["device_id"], message["latitude"], message["longitude"])
+    elif message["type"] in ("calibration", "recalibrated"):
+        calibration.apply_shared(message)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    started = time.perf_counter()
+    if DB_AUTO_SETUP:
+        manage.setup()
+    else:
+        pending = migrations.pending(engine)
+        if pending:
+            raise RuntimeError(f"Database migrations {pending} are pending: run python manage.py migrate")
+
+    with SessionLocal() as db:
+        latest_cache.warm(db)
+        alert_engine.warm(db)
+        site_index.warm(db)
+        calibration_profiles.warm(db)
+    cache_bus.start(on_bus_message)
+    logger.info("startup complete in %.0f ms", (time.perf_counter() - started) * 1000)
+    yield
+    # Store readings still queued by POST /data before the process exits
+    write_buffer.stop()
+    cache_bus.stop()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -24,13 +100,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-zambia_tz = pytz.timezone("Africa/Lusaka")
-
-# -------------------------
-# Database Initialization
-# -------------------------
-Base.metadata.create_all(bind=engine)
+app.add_middleware(encoding.CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+if async_engine is not None:
+    metrics.instrument_engine(async_engine.sync_engine)
 
 def get_db():
     db = SessionLocal()
@@ -39,80 +113,241 @@ def get_db():
     finally:
         db.close()
 
+async def get_session():
+    """Session for async endpoints: an AsyncSession with DB_ASYNC, else a sync one (see run_db)."""
+    if AsyncSessionLocal is None:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # -------------------------
 # Monitoring Data Endpoints
 # -------------------------
 
+# Ingest always writes through a sync session in the threadpool, also with
+# DB_ASYNC: the write transaction is mostly Python (registry, rollups,
+# alerts), and run on the event loop it would hold SQLite's single write
+# lock across every other request's turn on the loop.
+#
+# With INGEST_MODE=buffered/durable the reading is group-committed by the
+# writer thread in writebehind.py instead (202, or 200 once committed), and
+# the request never opens a session of its own.
 @app.post("/data")
-def add_data(data: MonitoringDataSchema, db: Session = Depends(get_db)):
-    print("ENTERED /data ENDPOINT")
-    print("RAW DATA:", data)
-
-    record = MonitoringData(
-        device_id=data.device_id,
-        ph_value=data.ph_value,
-        tds_value=data.tds_value,
-        temperature=data.temperature,
-        timestamp=data.timestamp or datetime.now(zambia_tz)
-    )
+async def add_data(data: MonitoringDataSchema):
+    row = ingest.to_row(data)
+    if INGEST_MODE == "direct":
+        with SessionLocal() as db:
+            (record_id,) = await run_db(db, ingest.insert_readings, [row])
+    else:
+        try:
+            committed = write_buffer.submit(row)
+        except QueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e),
+                                headers={"Retry-After": "1"})
+        if INGEST_MODE == "buffered":
+            return JSONResponse({"status": "accepted"}, status_code=202)
+        record_id = await asyncio.wrap_future(committed)
+
+    if row.get("duplicate"):
+        logger.debug("duplicate reading id=%s device_id=%s", record_id, data.device_id)
+        return {"status": "duplicate", "id": record_id}
+    logger.debug("reading stored id=%s device_id=%s", record_id, data.device_id)
+    return {"status": "saved", "id": record_id}
 
-    db.add(record)
-    db.commit()
-    db.refresh(record)
+# -------------------------
+# Bulk ingest (JSON array, NDJSON or binary frames)
+# -------------------------
+@app.post("/data/batch")
+async def add_data_batch(request: Request, db: Session = Depends(get_db)):
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+
+    if frames.CONTENT_TYPE in content_type:
+        received = len(body) // frames.FRAME_SIZE
+    elif "ndjson" in content_type:
+        items = ingest.parse_ndjson(body)
+        received = len(items)
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body is not valid JSON")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of readings")
+        received = len(items)
+
+    if received > ingest.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large ({received} > {ingest.MAX_BATCH_SIZE} readings)"
+        )
 
-    print(f"SAVED ID {record.id}")
-    return {"status": "saved", "id": record.id}
+    if frames.CONTENT_TYPE in content_type:
+        try:
+            rows, errors = ingest.parse_frames(body)
+        except frames.FrameError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        rows, errors = ingest.parse_items(items)
+
+    started = time.perf_counter()
+    ids = await run_db(db, ingest.insert_readings, [row for _, row in rows])
+    elapsed = time.perf_counter() - started
+
+    # A retried batch is answered with the ids stored the first time
+    results = []
+    duplicates = 0
+    for (index, row), new_id in zip(rows, ids):
+        if row.get("duplicate"):
+            duplicates += 1
+            results.append({"index": index, "id": new_id, "duplicate": True})
+        else:
+            results.append({"index": index, "id": new_id})
+    results.extend(errors)
+    results.sort(key=lambda r: r["index"])
 
-@app.get("/data", response_model=List[MonitoringDataSchema])
-def get_data(db: Session = Depends(get_db)):
-    return db.query(MonitoringData).all()
+    return {
+        "status": "saved" if not errors else ("partial" if ids else "failed"),
+        "received": received,
+        "saved": len(ids) - duplicates,
+        "duplicates": duplicates,
+        "failed": len(errors),
+        "results": results,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "rows_per_second": round(len(ids) / elapsed, 1) if ids and elapsed > 0 else 0.0,
+    }
 
 # -------------------------
-# Latest reading per device
+# Keyset pagination / streaming helpers
 # -------------------------
-@app.get("/data/latest", response_model=List[MonitoringDataSchema])
-def get_latest_data(db: Session = Depends(get_db)):
-    device_ids = db.query(MonitoringData.device_id).distinct().all()
-    latest_records = []
-
-    for (device_id,) in device_ids:
-        record = (
-            db.query(MonitoringData)
-            .filter(MonitoringData.device_id == device_id)
-            .order_by(desc(MonitoringData.timestamp))
-            .first()
+def reading_range(device_id: Optional[str], start: Optional[datetime],
+                  end: Optional[datetime], cursor: Optional[str]):
+    """Normalised (device_id, start, end, cursor); a malformed cursor is a 400.
+
+    An empty cursor (`?cursor=`) is the first page, like no cursor at all.
+    """
+    start = ingest.local_timestamp(start) if start else None
+    end = ingest.local_timestamp(end) if end else None
+    if not cursor:
+        return device_id, start, end, None
+    try:
+        pagination.decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return device_id, start, end, cursor
+
+async def paged_response(db: Session, source, to_item, limit: Optional[int], format: str, columns=None):
+    """NDJSON stream, one keyset page (next cursor in X-Next-Cursor), or a streamed array.
+
+    format=columnar is always paged (MAX_PAGE_SIZE rows when no limit is given)
+    and returns parallel arrays built by `columns` instead of one object per row.
+    """
+    if format == "ndjson":
+        return StreamingResponse(
+            pagination.stream_ndjson(store.stream(*source, limit=limit), to_item),
+            media_type="application/x-ndjson"
+        )
+    if limit is None and format != "columnar":
+        return StreamingResponse(
+            pagination.stream_json_array(store.stream(*source), to_item),
+            media_type="application/json"
         )
-        if record:
-            latest_records.append(record)
 
-    return latest_records
+    rows, next_cursor = await run_db(db, store.page, *source, limit or pagination.MAX_PAGE_SIZE)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    if format == "columnar":
+        return FastJSONResponse({**columns(rows), "next_cursor": next_cursor}, headers=headers)
+    return FastJSONResponse([to_item(r) for r in rows], headers=headers)
+
+def columnar_rows(rows, with_device=True):
+    """Parallel arrays for readings; timestamps as Unix epoch milliseconds."""
+    columns = {
+        "timestamp": [ingest.epoch_ms(r.timestamp) for r in rows],
+        "ph_value": [r.ph_value for r in rows],
+        "tds_value": [r.tds_value for r in rows],
+        "temperature": [r.temperature for r in rows],
+    }
+    if with_device:
+        columns["device_id"] = [r.device_id for r in rows]
+    return columns
+
+def data_item(r):
+    return {
+        "device_id": r.device_id,
+        "ph_value": r.ph_value,
+        "tds_value": r.tds_value,
+        "temperature": r.temperature,
+        "timestamp": r.timestamp.isoformat() if r.timestamp else None,
+    }
+
+@app.get("/data", response_model=List[MonitoringDataSchema], response_model_exclude={"__all__": {"seq"}})
+async def get_data(start: Optional[datetime] = Query(None, alias="from"),
+             end: Optional[datetime] = Query(None, alias="to"),
+             limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_PAGE_SIZE),
+             cursor: Optional[str] = None,
+             format: str = Query("json", pattern="^(json|ndjson|columnar)$"),
+             db: Session = Depends(get_session)):
+    source = reading_range(None, start, end, cursor)
+    return await paged_response(db, source, data_item, limit, format, columnar_rows)
+
+# -------------------------
+# Bulk export (CSV / Parquet / Arrow IPC)
+# -------------------------
+@app.get("/export")
+def export_readings(format: str = "csv", device_id: Optional[str] = None,
+                    start: Optional[datetime] = Query(None, alias="from"),
+                    end: Optional[datetime] = Query(None, alias="to")):
+    import export  # only needed here, so not loaded at startup
+
+    try:
+        export.check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    start = ingest.local_timestamp(start) if start else None
+    end = ingest.local_timestamp(end) if end else None
+    media_type, extension = export.FORMATS[format]
+    return StreamingResponse(
+        export.stream(format, device_id, start, end),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{device_id or "readings"}.{extension}"'},
+    )
+
+# -------------------------
+# Latest reading per device
+# -------------------------
+@app.get("/data/latest", response_model=List[MonitoringDataSchema], response_model_exclude={"__all__": {"seq"}})
+async def get_latest_data(db: Session = Depends(get_session)):
+    return await run_db(db, latest_cache.all)
 
 # -------------------------
 # List monitoring devices
 # -------------------------
 @app.get("/monitoring/list")
-def get_monitoring_list(db: Session = Depends(get_db)):
-    devices = db.query(MonitoringData.device_id).distinct().all()
-    return [{"id": t[0]} for t in devices]
+async def get_monitoring_list(db: Session = Depends(get_session)):
+    return [{"id": device_id} for device_id in await run_db(db, latest_cache.device_ids)]
 
 # -------------------------
 # GLOBAL LATEST WATER QUALITY (FOR DASHBOARD)
 # -------------------------
 @app.get("/monitoring_data/latest")
-def get_global_latest(db: Session = Depends(get_db)):
-    record = (
-        db.query(MonitoringData)
-        .order_by(desc(MonitoringData.timestamp))
-        .first()
-    )
+async def get_global_latest(db: Session = Depends(get_session)):
+    record = await run_db(db, latest_cache.newest)
 
     if not record:
         raise HTTPException(status_code=404, detail="No monitoring data found")
 
     return {
-        "ph_value": record.ph_value,
-        "tds_value": record.tds_value,
-        "temperature": record.temperature
+        "ph_value": record["ph_value"],
+        "tds_value": record["tds_value"],
+        "temperature": record["temperature"]
     }
 
 
@@ -120,25 +355,173 @@ def get_global_latest(db: Session = Depends(get_db)):
 # Latest location + water quality
 # -------------------------
 @app.get("/monitoring_data/{device_id}")
-def get_monitoring_location(device_id: str, db: Session = Depends(get_db)):
-    record = (
-        db.query(MonitoringData)
-        .filter(MonitoringData.device_id == device_id)
-        .order_by(desc(MonitoringData.timestamp))
-        .first()
-    )
+async def get_monitoring_location(device_id: str, db: Session = Depends(get_session)):
+    record = await run_db(db, latest_cache.get, device_id)
 
     if not record:
         return JSONResponse(status_code=404, content={"detail": "Not Found"})
 
     return {
-        "device_id": record.device_id,
-        "ph_value": record.ph_value,
-        "tds_value": record.tds_value,
-        "temperature": record.temperature,
-        "created_at": record.timestamp.isoformat() if record.timestamp else None
+        "device_id": record["device_id"],
+        "ph_value": record["ph_value"],
+        "tds_value": record["tds_value"],
+        "temperature": record["temperature"],
+        "created_at": record["timestamp"].isoformat() if record["timestamp"] else None
     }
 
+# -------------------------
+# Live feed (WebSocket / Server-Sent Events)
+# -------------------------
+def parse_devices(devices: Optional[str]):
+    return [d for d in devices.split(",") if d] if devices else None
+
+@app.websocket("/ws/live")
+async def live_socket(websocket: WebSocket, devices: Optional[str] = None):
+    """Pushes every stored reading; send {"devices": [...]} to change the filter."""
+    await websocket.accept()
+    subscriber = hub.subscribe(parse_devices(devices))
+
+    async def sender():
+        while True:
+            message = await subscriber.get()
+            await websocket.send_json(hub.sent(message))
+
+    send_task = asyncio.create_task(sender())
+    try:
+        while True:
+            request = await websocket.receive_json()
+            if isinstance(request, dict) and "devices" in request:
+                subscriber.devices = set(request["devices"]) if request["devices"] else None
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        send_task.cancel()
+        hub.unsubscribe(subscriber)
+
+@app.get("/stream")
+async def live_stream(request: Request, devices: Optional[str] = None):
+    subscriber = hub.subscribe(parse_devices(devices))
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                message = await subscriber.get(timeout=15)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(hub.sent(message))}\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/live/stats")
+def get_live_stats():
+    return hub.stats()
+
+# -------------------------
+# Alerts
+# -------------------------
+def query_alerts(db: Session, device_id, active, since, limit):
+    query = select(Alert)
+    if device_id:
+        query = query.where(Alert.device_id == device_id)
+    if active is not None:
+        query = query.where(Alert.resolved_at.is_(None) if active else Alert.resolved_at.is_not(None))
+    if since:
+        query = query.where(Alert.raised_at >= ingest.local_timestamp(since))
+    query = query.order_by(Alert.raised_at.desc(), Alert.id.desc()).limit(limit)
+    return [alerts.to_item(alert) for alert in db.scalars(query)]
+
+@app.get("/alerts")
+async def get_alerts(device_id: Optional[str] = None,
+               active: Optional[bool] = None,
+               since: Optional[datetime] = None,
+               limit: int = Query(100, ge=1, le=1000),
+               db: Session = Depends(get_session)):
+    """Alert history, newest first."""
+    return await run_db(db, query_alerts, device_id, active, since, limit)
+
+@app.get("/alerts/active")
+def get_active_alerts(device_id: Optional[str] = None):
+    """Currently unresolved alerts, from memory."""
+    return [alerts.to_item(alert) for alert in alert_engine.active(device_id)]
+
+@app.get("/alerts/stats")
+def get_alert_stats(device_id: Optional[str] = None):
+    stats = alert_engine.stats()
+    if device_id:
+        stats["state"] = alert_engine.state(device_id)
+    return stats
+
+# -------------------------
+# Device registry
+# -------------------------
+@app.get("/devices")
+async def get_devices(db: Session = Depends(get_session)):
+    return await run_db(db, devices.list_devices)
+
+# -------------------------
+# Prometheus metrics
+# -------------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(db: Session = Depends(get_db)):
+    rows_stored = db.scalar(select(func.coalesce(func.sum(Device.sample_count), 0)))
+    cache = latest_cache.stats()
+    live = hub.stats()
+
+    body = metrics.render([
+        metrics.gauge("wqm_rows_stored", "Readings stored across all devices", [({}, rows_stored)]),
+        metrics.gauge("wqm_db_pool_connections", "Connection pool usage",
+                      metrics.pool_samples(engine, {"engine": "sync"})
+                      + (metrics.pool_samples(async_engine, {"engine": "async"}) if async_engine else [])),
+        metrics.counter("wqm_latest_cache_requests_total", "Latest-reading cache lookups",
+                        [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+        metrics.gauge("wqm_live_subscribers", "Connected live-feed clients", [({}, live["subscribers"])]),
+        metrics.counter("wqm_live_dropped_total", "Live messages dropped for slow clients",
+                        [({}, live["dropped"])]),
+        metrics.gauge("wqm_alerts_active", "Unresolved alerts", [({}, alert_engine.stats()["active"])]),
+        metrics.counter("wqm_ingest_buffer_lost_total", "Queued POST /data readings that were never stored",
+                        [({"mode": INGEST_MODE}, write_buffer.stats()["lost"])]),
+    ])
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+# -------------------------
+# Cache statistics
+# -------------------------
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {"latest": latest_cache.stats(), "chart": chart_cache.stats(), "bus": cache_bus.stats()}
+
+# -------------------------
+# Storage backend
+# -------------------------
+@app.get("/storage/stats")
+def get_storage_stats():
+    stats = {"backend": store.name}
+    if hasattr(store, "stats"):
+        stats.update(store.stats())
+    return stats
+
+# -------------------------
+# Ingest duplicates and sequence gaps
+# -------------------------
+@app.get("/ingest/stats")
+def get_ingest_stats(device_id: Optional[str] = None):
+    return {
+        "recent_keys": recent_keys.stats(),
+        "write_buffer": write_buffer.stats(),
+        "devices": recent_keys.device_stats(device_id),
+    }
+
+# -------------------------
+# Derived metrics (24h change, stability, TDS change rate)
+# -------------------------
+@app.get("/metrics/derived")
+async def get_derived_metrics(device_id: Optional[str] = None, db: Session = Depends(get_session)):
+    return await run_db(db, derived_cache.snapshot, device_id)
+
 # -------------------------
 # Login Endpoint
 # -------------------------
@@ -152,25 +535,78 @@ def login(request: UserLogin, db: Session = Depends(get_db)):
 # -------------------------
 # History Endpoint
 # -------------------------
-@app.get("/history/{device_id}")
-def get_history(device_id: str, db: Session = Depends(get_db)):
-    records = (
-        db.query(MonitoringData)
-        .filter(MonitoringData.device_id == device_id)
-        .order_by(MonitoringData.timestamp)
-        .all()
-    )
+def resolve_resolution(db: Session, device_id: str, resolution: Optional[str],
+                       max_points: Optional[int], start=None, end=None):
+    """Explicit resolution wins; otherwise pick the finest tier that fits max_points."""
+    if resolution is not None:
+        if resolution != "raw" and resolution not in rollups.RESOLUTIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"resolution must be one of raw, {', '.join(rollups.RESOLUTIONS)}"
+            )
+        return resolution
+    if max_points is None:
+        return "raw"
+    return rollups.pick_resolution(db, device_id, max_points, start, end)
+
+def history_item(r):
+    return {
+        "device_id": r.device_id,
+        "timestamp": r.timestamp.astimezone(zambia_tz).isoformat(),
+        "ph_value": r.ph_value,
+        "tds_value": r.tds_value,
+        "temperature": r.temperature,
+    }
+
+def history_points(db: Session, device_id, resolution, max_points, start, end):
+    tier = resolve_resolution(db, device_id, resolution, max_points, start, end)
+    return tier, rollups.downsample(rollups.series(db, device_id, tier, start, end), max_points)
 
-    return [
-        {
-            "device_id": r.device_id,
-            "timestamp": r.timestamp.astimezone(zambia_tz).isoformat(),
-            "ph_value": r.ph_value,
-            "tds_value": r.tds_value,
-            "temperature": r.temperature,
+@app.get("/history/{device_id}")
+async def get_history(device_id: str, resolution: Optional[str] = None,
+                max_points: Optional[int] = Query(None, ge=3),
+                start: Optional[datetime] = Query(None, alias="from"),
+                end: Optional[datetime] = Query(None, alias="to"),
+                limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_PAGE_SIZE),
+                cursor: Optional[str] = None,
+                format: str = Query("json", pattern="^(json|ndjson|columnar)$"),
+                db: Session = Depends(get_session)):
+    # Raw rows: keyset pages or a stream, never one big list
+    if max_points is None and resolution in (None, "raw"):
+        source = reading_range(device_id, start, end, cursor)
+        return await paged_response(db, source, history_item, limit, format,
+                              lambda rows: {"device_id": device_id, **columnar_rows(rows, with_device=False)})
+
+    start = ingest.local_timestamp(start) if start else None
+    end = ingest.local_timestamp(end) if end else None
+    tier, points = await run_db(db, history_points, device_id, resolution, max_points, start, end)
+
+    if format == "columnar":
+        columns = {
+            "device_id": device_id,
+            "resolution": tier,
+            "timestamp": [ingest.epoch_ms(p["timestamp"]) for p in points],
+            "ph_value": [p["ph_value"] for p in points],
+            "tds_value": [p["tds_value"] for p in points],
+            "temperature": [p["temperature"] for p in points],
+        }
+        if points and "samples" in points[0]:
+            columns["samples"] = [p["samples"] for p in points]
+        return FastJSONResponse(columns)
+
+    history = []
+    for p in points:
+        item = {
+            "device_id": device_id,
+            "timestamp": p["timestamp"].astimezone(zambia_tz).isoformat(),
+            "ph_value": p["ph_value"],
+            "tds_value": p["tds_value"],
+            "temperature": p["temperature"],
         }
-        for r in records
-    ]
+        if "samples" in p:
+            item["samples"] = p["samples"]
+        history.append(item)
+    return FastJSONResponse(history)
 
 # -------------------------
 # Root Endpoint
@@ -179,49 +615,45 @@ def get_history(device_id: str, db: Session = Depends(get_db)):
 def read_root():
     return {"message": "Hello, FastAPI!"}
 
-# -------------------------
-# Create Test User
-# -------------------------
-def create_test_user():
-    db = SessionLocal()
-    if not db.query(User).filter(User.username == "admin").first():
-        user = User(username="admin", password="1234")
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-        print(f"SAVED TO DB WITH ID: {user.id}")
-    db.close()
-
-create_test_user()
-
 # ----------------------------
 # Chart data endpoint
 # ----------------------------
-@app.get("/monitoring_data/{device_id}/chart")
-def get_monitoring_chart(device_id: str, date: str, db: Session = Depends(get_db)):
-    start = datetime.strptime(date, "%Y-%m-%d")
-    end = start + timedelta(days=1)
-
-    points = db.query(MonitoringData)\
-        .filter(
-            MonitoringData.device_id == device_id,
-            MonitoringData.timestamp >= start,
-            MonitoringData.timestamp < end
-        )\
-        .order_by(MonitoringData.timestamp.asc())\
-        .all()
-
-    timeLabels = [p.timestamp.strftime("%H:%M") for p in points]
-    phValues = [p.ph_value for p in points]
-    tdsValues = [p.tds_value for p in points]
-    temperatureValues = [p.temperature for p in points]
+def chart_body(db: Session, device_id: str, start: datetime, resolution: Optional[str], max_points: Optional[int]):
+    tier, points = history_points(db, device_id, resolution, max_points, start, start + timedelta(days=1))
 
-    return {
+    timeLabels = [p["timestamp"].strftime("%H:%M") for p in points]
+    phValues = [p["ph_value"] for p in points]
+    tdsValues = [p["tds_value"] for p in points]
+    temperatureValues = [p["temperature"] for p in points]
+
+    return dumps({
         "timeLabels": timeLabels,
         "phValues": phValues,
         "tdsValues": tdsValues,
-        "temperatureValues": temperatureValues
-    }
+        "temperatureValues": temperatureValues,
+        "resolution": tier
+    })
+
+@app.get("/monitoring_data/{device_id}/chart")
+async def get_monitoring_chart(request: Request, device_id: str, date: str, resolution: Optional[str] = None,
+                         max_points: Optional[int] = Query(None, ge=3),
+                         db: Session = Depends(get_session)):
+    start = datetime.strptime(date, "%Y-%m-%d")
+    day = start.date()
+    key = (device_id, day, resolution, max_points)
+
+    cached = chart_cache.get(key)
+    if cached is not None:
+        body, tag = cached
+    else:
+        generation = chart_cache.generation()
+        body = await run_db(db, chart_body, device_id, start, resolution, max_points)
+        tag = chart_cache.put(key, body, generation) or etag(body)
+
+    headers = {"ETag": tag, "Cache-Control": cache_control(day)}
+    if etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 # ----------------------------
 # WATER BODY LOCATION ENDPOINTS
@@ -242,10 +674,18 @@ def set_location(device_id: str, latitude: float, longitude: float, db: Session
     
     db.commit()
     db.refresh(water_body)
+    site_index.set(water_body.device_id, water_body.latitude, water_body.longitude)
+    cache_bus.send({"type": "site", "device_id": water_body.device_id,
+                    "latitude": water_body.latitude, "longitude": water_body.longitude})
     
     return {"device_id": water_body.device_id, "latitude": water_body.latitude, "longitude": water_body.longitude}
 
 
+@app.get("/waterbody/list")
+def list_water_bodies(db: Session = Depends(get_db)):
+    bodies = db.query(WaterBody).all()
+    return [{"device_id": w.device_id, "latitude": w.latitude, "longitude": w.longitude} for w in bodies]
+
 @app.get("/waterbody/{device_id}")
 def get_location(device_id: str, db: Session = Depends(get_db)):
     water_body = db.query(WaterBody).filter(WaterBody.device_id == device_id).first()
@@ -255,7 +695,122 @@ def get_location(device_id: str, db: Session = Depends(get_db)):
     
     return {"device_id": water_body.device_id, "latitude": water_body.latitude, "longitude": water_body.longitude}
 
-@app.get("/waterbody/list")
-def list_water_bodies(db: Session = Depends(get_db)):
-    bodies = db.query(WaterBody).all()
-    return [{"device_id": w.device_id, "latitude": w.latitude, "longitude": w.longitude} for w in bodies]
+# -------------------------
+# Calibration profiles and reprocessing
+# -------------------------
+def _local(ts):
+    return None if ts is None else ingest.local_timestamp(ts)
+
+@app.get("/calibration/profiles")
+def get_calibration_profiles(device_id: Optional[str] = None):
+    """Every profile, retired ones included, from memory."""
+    return [calibration.to_item(p) for p in calibration_profiles.all(device_id)]
+
+@app.post("/calibration/profiles")
+def add_calibration_profile(body: CalibrationProfileSchema, db: Session = Depends(get_db)):
+    """Readings stored from now on use the new profile; POST /calibration/reprocess rewrites older ones."""
+    try:
+        profile = calibration.create_profile(
+            db, body.device_id, _local(body.valid_from), _local(body.valid_to), body.ph_v7, body.ph_slope,
+            body.tds_factor, body.tds_temp_coefficient, body.note,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return calibration.to_item(profile)
+
+@app.post("/calibration/profiles/{profile_id}/retire")
+def retire_calibration_profile(profile_id: int, db: Session = Depends(get_db)):
+    profile = calibration.retire_profile(db, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No such calibration profile")
+    return calibration.to_item(profile)
+
+@app.post("/calibration/reprocess")
+def start_reprocess(body: ReprocessRequest, db: Session = Depends(get_db)):
+    """Start a reprocess job in the background; poll GET /calibration/jobs/{id}."""
+    try:
+        job_id = calibration.create_job(db, body.device_id, _local(body.start), _local(body.end))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    calibration.start_job_thread(job_id)
+    return JSONResponse(calibration.job_item(db.get(ReprocessJob, job_id)), status_code=202)
+
+@app.get("/calibration/jobs")
+def list_reprocess_jobs(limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    jobs = db.scalars(select(ReprocessJob).order_by(ReprocessJob.id.desc()).limit(limit))
+    return [calibration.job_item(job) for job in jobs]
+
+@app.get("/calibration/jobs/{job_id}")
+def get_reprocess_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.get(ReprocessJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No such reprocess job")
+    return calibration.job_item(job)
+
+@app.post("/calibration/jobs/{job_id}/resume")
+def resume_reprocess_job(job_id: int, db: Session = Depends(get_db)):
+    """Continue a failed or interrupted job from its last committed chunk."""
+    job = db.get(ReprocessJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No such reprocess job")
+    if job.status == "done" or calibration.is_running(job_id):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {'done' if job.status == 'done' else 'running'}")
+    calibration.start_job_thread(job_id)
+    return JSONResponse(calibration.job_item(job), status_code=202)
+
+# -------------------------
+# Map: every site in a viewport with its latest reading
+# -------------------------
+def map_site(device_id, lat, lng, readings, alert_counts, distance=None):
+    reading = readings.get(device_id)
+    site = {
+        "device_id": device_id,
+        "latitude": lat,
+        "longitude": lng,
+        "latest": None if reading is None else {
+            "ph_value": reading["ph_value"],
+            "tds_value": reading["tds_value"],
+            "temperature": reading["temperature"],
+            "timestamp": reading["timestamp"].isoformat(),
+        },
+        "active_alerts": alert_counts.get(device_id, 0),
+    }
+    if distance is not None:
+        site["distance_km"] = round(distance, 3)
+    return site
+
+@app.get("/map")
+async def get_map(bbox: Optional[str] = None, near: Optional[str] = None,
+            limit: int = Query(20, ge=1, le=1000), zoom: Optional[int] = Query(None, ge=0, le=22),
+            db: Session = Depends(get_session)):
+    """Sites in bbox (or the limit nearest to near), joined with their latest reading.
+
+    With zoom, sites that would overlap on screen come back as clusters
+    (count, centroid, bounds) instead of individual markers.
+    """
+    try:
+        if near is not None:
+            lat, lng = parse_point(near)
+            ranked = site_index.nearest(lat, lng, limit)
+            found = [(device_id, s_lat, s_lng) for _, device_id, s_lat, s_lng in ranked]
+            distances = {device_id: d for d, device_id, _, _ in ranked}
+        else:
+            found = site_index.bbox(*parse_bbox(bbox)) if bbox else site_index.bbox(-90, -180, 90, 180)
+            distances = {}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    clusters = []
+    if zoom is not None:
+        found, clusters = cluster(found, zoom)
+
+    readings = await run_db(db, latest_cache.many, [device_id for device_id, _, _ in found])
+    alert_counts = {}
+    for alert in alert_engine.active():
+        alert_counts[alert["device_id"]] = alert_counts.get(alert["device_id"], 0) + 1
+
+    return FastJSONResponse({
+        "sites": [map_site(device_id, lat, lng, readings, alert_counts, distances.get(device_id))
+                  for device_id, lat, lng in found],
+        "clusters": clusters,
+    })
@@ -0,0 +1,100 @@
+"""Set up the database and serve the app. Run from backend/app:
+
+    python manage.py setup                  # apply migrations, create the test user
+    python manage.py migrate [status]       # same as python migrations.py
+    python manage.py create-test-user
+    python manage.py serve --port 8000 --workers 4
+
+Importing main does no database work. The app's lifespan runs setup() at
+startup unless DB_AUTO_SETUP=0, which is fine for one process. serve runs it
+once before starting the workers and turns it off for them, so N workers do
+not race to migrate the same database. With more than one worker it also
+gives them a cache bus directory (see bus.py), so their in-memory caches
+and live feeds see each other's writes.
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+from database import SessionLocal, engine
+import migrations
+from models import User
+
+logger = logging.getLogger("water_monitoring")
+
+
+def create_test_user():
+    with SessionLocal() as db:
+        if db.query(User).filter(User.username == "admin").first():
+            return
+        user = User(username="admin", password="1234")
+        db.add(user)
+        db.commit()
+        logger.info("test user created id=%s", user.id)
+
+
+def setup():
+    applied = migrations.upgrade(engine)
+    create_test_user()
+    return applied
+
+
+def serve(args):
+    import uvicorn
+
+    from storage import STORAGE_BACKEND
+
+    if args.workers > 1 and STORAGE_BACKEND == "tsdb":
+        raise SystemExit("the tsdb storage backend is written by one process: use --workers 1")
+
+    applied = setup()
+    if applied:
+        print(f"Applied migrations: {applied}")
+    os.environ["DB_AUTO_SETUP"] = "0"
+
+    bus_dir = None
+    if args.workers > 1:
+        bus_dir = tempfile.mkdtemp(prefix="wqm-bus-")
+        os.environ["CACHE_BUS_DIR"] = bus_dir
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, reload=args.reload,
+                    log_level=os.getenv("LOG_LEVEL", "info").lower())
+    finally:
+        if bus_dir is not None:
+            shutil.rmtree(bus_dir, ignore_errors=True)
+    return 0
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Water monitoring backend")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("setup", help="apply migrations and create the test user")
+    migrate = commands.add_parser("migrate", help="apply pending migrations, or list them")
+    migrate.add_argument("action", nargs="?", choices=("upgrade", "status"), default="upgrade")
+    commands.add_parser("create-test-user", help="create the admin/1234 login if it is missing")
+    run = commands.add_parser("serve", help="set up the database, then run the app under uvicorn")
+    run.add_argument("--host", default="127.0.0.1")
+    run.add_argument("--port", type=int, default=8000)
+    workers = run.add_mutually_exclusive_group()
+    workers.add_argument("--workers", type=int, default=1)
+    workers.add_argument("--reload", action="store_true", help="restart on code changes (one worker)")
+    args = parser.parse_args(argv)
+
+    if args.command == "setup":
+        applied = setup()
+        print(f"Applied migrations: {applied}" if applied else "Database is up to date")
+    elif args.command == "migrate":
+        return migrations.main(["migrations.py", args.action])
+    elif args.command == "create-test-user":
+        create_test_user()
+    elif args.command == "serve":
+        return serve(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""Minimal Prometheus-style metrics, rendered in the text exposition format.
+
+Everything is in-process and lock-protected: recording a sample is a dict
+lookup plus a bisect, so it can stay on in production. GET /metrics renders
+the registry together with a few gauges and counters read at scrape time.
+"""
+import bisect
+import threading
+import time
+
+from sqlalchemy import event
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{n}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _labels(self.labels + ("le",), values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + ('+Inf',))} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-1]:.6f}")
+        return lines
+
+
+def _scraped(kind, name, help, samples):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return lines
+
+
+def gauge(name, help, samples):
+    """Render a gauge from (label dict, value) pairs computed at scrape time."""
+    return _scraped("gauge", name, help, samples)
+
+
+def counter(name, help, samples):
+    """Render a monotonic total kept elsewhere (name ends in _total), read at scrape time."""
+    return _scraped("counter", name, help, samples)
+
+
+REQUEST_LATENCY = Histogram(
+    "wqm_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+DB_QUERY_LATENCY = Histogram(
+    "wqm_db_query_duration_seconds", "Database statement execution time", ("operation",)
+)
+READINGS_INGESTED = Counter(
+    "wqm_readings_ingested_total", "Readings stored per device", ("device_id",)
+)
+ALERTS = Counter(
+    "wqm_alerts_total", "Alerts raised and resolved", ("kind", "metric", "status")
+)
+
+READINGS_DUPLICATE = Counter(
+    "wqm_readings_duplicate_total", "Readings received again and not stored", ("device_id",)
+)
+
+REGISTRY = [REQUEST_LATENCY, DB_QUERY_LATENCY, READINGS_INGESTED, READINGS_DUPLICATE, ALERTS]
+
+
+def observe_ingest(rows):
+    for row in rows:
+        READINGS_INGESTED.inc(row["device_id"])
+
+
+def observe_duplicates(rows):
+    for row in rows:
+        READINGS_DUPLICATE.inc(row["device_id"])
+
+
+def observe_alerts(events):
+    for alert in events:
+        ALERTS.inc(alert["kind"], alert["metric"], "resolved" if alert["resolved_at"] else "raised")
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware timing each HTTP request by its route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status["code"],
+            )
+
+
+def instrument_engine(engine):
+    """Time every statement executed through engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("wqm_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["wqm_query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_LATENCY.observe(time.perf_counter() - started, operation)
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        stack = context.connection.info.get("wqm_query_start") if context.connection else None
+        if stack:
+            stack.pop()
+
+
+def pool_samples(engine, labels=None):
+    pool = engine.pool
+    samples = []
+    for name in ("size", "checkedout", "checkedin", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            samples.append(({**(labels or {}), "state": name}, method()))
+    return samples
+
+
+def render(extra=()):
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for block in extra:
+        lines.extend(block)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,166 @@
+"""Versioned schema migrations.
+
+Each migration runs once, in its own transaction, and is recorded in the
+schema_migrations table. Steps are written to be safe on databases that
+were created by the old Base.metadata.create_all() call as well as on empty
+ones. Run `python migrations.py` (or `python migrations.py status`) from
+backend/app. The app applies pending migrations when it starts unless
+DB_AUTO_SETUP=0 (see manage.py).
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.orm import Session
+
+from models import (
+    Alert, CalibrationProfile, Device, MonitoringData, MonitoringRollup, ReprocessJob, User, WaterBody,
+)
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _baseline(conn):
+    """Tables that existed before migrations were introduced."""
+    for table in (MonitoringData, User, WaterBody, MonitoringRollup):
+        table.__table__.create(conn, checkfirst=True)
+
+
+def _composite_index(conn):
+    # Created non-unique here; migration 6 removes duplicates and makes it unique
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS "ix_Monitoring_Data_device_id_timestamp" '
+        'ON "Monitoring_Data" (device_id, timestamp)'
+    ))
+
+    # The single-column index is a prefix of the composite one
+    existing = {i["name"] for i in inspect(conn).get_indexes("Monitoring_Data")}
+    if "ix_Monitoring_Data_device_id" in existing:
+        conn.execute(text('DROP INDEX "ix_Monitoring_Data_device_id"'))
+
+
+def _devices(conn):
+    Device.__table__.create(conn, checkfirst=True)
+    conn.execute(text(
+        'INSERT INTO devices (device_id, first_timestamp, last_timestamp, last_seen, sample_count) '
+        'SELECT device_id, MIN(timestamp), MAX(timestamp), MAX(timestamp), COUNT(*) '
+        'FROM "Monitoring_Data" WHERE device_id IS NOT NULL '
+        'AND device_id NOT IN (SELECT device_id FROM devices) '
+        'GROUP BY device_id'
+    ))
+
+
+def _backfill_rollups(conn):
+    import rollups
+
+    with Session(bind=conn) as db:
+        rollups.ensure_built(db)
+
+
+def _alerts(conn):
+    Alert.__table__.create(conn, checkfirst=True)
+
+
+def _idempotent_ingest(conn):
+    if "seq" not in {c["name"] for c in inspect(conn).get_columns("Monitoring_Data")}:
+        conn.execute(text('ALTER TABLE "Monitoring_Data" ADD COLUMN seq INTEGER'))
+
+    # Retries stored before the key existed: keep the first copy, then fix
+    # the counts and rollups that included the others
+    extra = conn.execute(text(
+        'SELECT device_id, COUNT(*) - COUNT(DISTINCT timestamp) FROM "Monitoring_Data" '
+        'WHERE timestamp IS NOT NULL GROUP BY device_id HAVING COUNT(*) > COUNT(DISTINCT timestamp)'
+    )).all()
+    if extra:
+        import rollups
+
+        conn.execute(text(
+            'DELETE FROM "Monitoring_Data" WHERE id NOT IN '
+            '(SELECT MIN(id) FROM "Monitoring_Data" GROUP BY device_id, timestamp) '
+            'AND timestamp IS NOT NULL'
+        ))
+        conn.execute(
+            text('UPDATE devices SET sample_count = sample_count - :n WHERE device_id = :device_id'),
+            [{"device_id": device_id, "n": n} for device_id, n in extra],
+        )
+        with Session(bind=conn) as db:
+            for device_id, _ in extra:
+                rollups.rebuild(db, device_id=device_id)
+
+    conn.execute(text('DROP INDEX IF EXISTS "ix_Monitoring_Data_device_id_timestamp"'))
+    for index in MonitoringData.__table__.indexes:
+        if index.name == "ix_Monitoring_Data_device_id_timestamp":
+            index.create(conn)
+
+
+def _calibration(conn):
+    if "calibration_id" not in {c["name"] for c in inspect(conn).get_columns("Monitoring_Data")}:
+        conn.execute(text('ALTER TABLE "Monitoring_Data" ADD COLUMN calibration_id INTEGER'))
+    CalibrationProfile.__table__.create(conn, checkfirst=True)
+    ReprocessJob.__table__.create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "composite (device_id, timestamp) index", _composite_index),
+    (3, "devices registry", _devices),
+    (4, "backfill rollups", _backfill_rollups),
+    (5, "alerts", _alerts),
+    (6, "seq column, unique (device_id, timestamp)", _idempotent_ingest),
+    (7, "calibration profiles and reprocess jobs", _calibration),
+]
+
+
+def applied_versions(engine):
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return set(conn.scalars(select(schema_migrations.c.version)))
+
+
+def pending(engine):
+    """Versions not applied yet."""
+    done = applied_versions(engine)
+    return [version for version, _, _ in MIGRATIONS if version not in done]
+
+
+def upgrade(engine):
+    """Apply every pending migration in order; returns the versions applied."""
+    done = applied_versions(engine)
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        applied.append(version)
+    return applied
+
+
+def main(argv):
+    from database import engine
+
+    command = argv[1] if len(argv) > 1 else "upgrade"
+    if command == "status":
+        done = applied_versions(engine)
+        for version, description, _ in MIGRATIONS:
+            print(f"{'[x]' if version in done else '[ ]'} {version:03d} {description}")
+    elif command == "upgrade":
+        applied = upgrade(engine)
+        print(f"Applied migrations: {applied}" if applied else "Database is up to date")
+    else:
+        print("usage: python migrations.py [upgrade|status]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
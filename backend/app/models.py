@@ -1,16 +1,34 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, UniqueConstraint
 from database import Base
 from datetime import datetime
 
 class MonitoringData(Base):
     __tablename__ = "Monitoring_Data"
+    __table_args__ = (
+        # Serves every per-device "latest", history and chart lookup, and is
+        # the idempotency key: a retried upload cannot store a reading twice
+        Index("ix_Monitoring_Data_device_id_timestamp", "device_id", "timestamp", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    device_id = Column(String, index=True)
+    device_id = Column(String)
     ph_value = Column(Float)
     tds_value = Column(Float)
     temperature = Column(Float)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    seq = Column(Integer)  # per-device sequence number, when the device sends one
+    calibration_id = Column(Integer)  # calibration profile applied; NULL = the firmware's own
+
+class Device(Base):
+    """One row per device, created on its first reading and updated on every ingest."""
+    __tablename__ = "devices"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, unique=True, index=True, nullable=False)
+    first_timestamp = Column(DateTime)  # earliest reading time
+    last_timestamp = Column(DateTime)  # newest reading time
+    last_seen = Column(DateTime)  # when the backend last stored a reading
+    sample_count = Column(Integer, nullable=False, default=0)
 
 class User(Base):
     __tablename__ = "users"
@@ -26,3 +44,86 @@ class WaterBody(Base):
     device_id = Column(String, unique=True, index=True, nullable=False)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+
+class MonitoringRollup(Base):
+    """Per-device min/max/sum/count of each metric over a fixed time bucket."""
+    __tablename__ = "Monitoring_Rollup"
+    __table_args__ = (
+        UniqueConstraint("resolution", "device_id", "bucket", name="uq_Monitoring_Rollup_bucket"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    resolution = Column(String, nullable=False)  # "1m", "1h" or "1d"
+    device_id = Column(String, nullable=False)
+    bucket = Column(DateTime, nullable=False)  # bucket start, local wall time
+    count = Column(Integer, nullable=False)
+    ph_min = Column(Float)
+    ph_max = Column(Float)
+    ph_sum = Column(Float)
+    tds_min = Column(Float)
+    tds_max = Column(Float)
+    tds_sum = Column(Float)
+    temperature_min = Column(Float)
+    temperature_max = Column(Float)
+    temperature_sum = Column(Float)
+
+class Alert(Base):
+    """An alert raised by the streaming alert engine; resolved_at is NULL while active."""
+    __tablename__ = "alerts"
+    __table_args__ = (
+        Index("ix_alerts_device_id_raised_at", "device_id", "raised_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, nullable=False)
+    metric = Column(String, nullable=False)  # "ph_value", "tds_value" or "temperature"
+    kind = Column(String, nullable=False)  # "threshold", "spike" or "stuck"
+    value = Column(Float)
+    message = Column(String, nullable=False)
+    raised_at = Column(DateTime, nullable=False)  # reading time, local wall time
+    resolved_at = Column(DateTime)
+
+class CalibrationProfile(Base):
+    """Probe calibration for one device over [valid_from, valid_to).
+
+    Profiles are never edited or deleted, because stored readings record the
+    profile they were computed with: a correction is a new profile (the
+    newest one covering a reading wins) and retired_at withdraws one.
+    """
+    __tablename__ = "calibration_profiles"
+    __table_args__ = (
+        Index("ix_calibration_profiles_device_id", "device_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, nullable=False)
+    valid_from = Column(DateTime, nullable=False)  # local wall time
+    valid_to = Column(DateTime)  # exclusive; NULL = open-ended
+    ph_v7 = Column(Float, nullable=False)  # probe voltage at pH 7
+    ph_slope = Column(Float, nullable=False)  # volts per pH unit
+    tds_factor = Column(Float, nullable=False)  # multiplier on the TDS curve
+    tds_temp_coefficient = Column(Float, nullable=False, default=0.0)  # per degree C from 25; 0 = none
+    note = Column(String)
+    created_at = Column(DateTime, nullable=False)
+    retired_at = Column(DateTime)
+
+class ReprocessJob(Base):
+    """Progress of a recalibration run, committed with every chunk so it can resume."""
+    __tablename__ = "reprocess_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String)  # NULL = every device
+    start = Column(DateTime)
+    end = Column(DateTime)
+    status = Column(String, nullable=False)  # "running", "done" or "failed"
+    rows_total = Column(Integer, nullable=False, default=0)
+    rows_scanned = Column(Integer, nullable=False, default=0)
+    rows_updated = Column(Integer, nullable=False, default=0)
+    current_device = Column(String)  # device being processed
+    last_timestamp = Column(DateTime)  # keyset cursor within current_device
+    dirty_from = Column(DateTime)  # range of rewritten readings whose rollups
+    dirty_to = Column(DateTime)  # still need rebuilding
+    error = Column(String)
+    started_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
@@ -0,0 +1,130 @@
+import base64
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import and_, or_, select
+
+import archive
+from database import SessionLocal
+from encoding import dumps
+from models import MonitoringData
+
+MAX_PAGE_SIZE = 10000
+
+# Rows fetched per round trip when streaming
+STREAM_CHUNK_SIZE = 1000
+
+# Same fields, in the same order, as archive.COLUMNS
+_COLUMNS = tuple(getattr(MonitoringData, c) for c in archive.COLUMNS)
+
+
+def encode_cursor(timestamp, row_id):
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_query(device_id=None, start=None, end=None, cursor=None):
+    """Readings ordered by (timestamp, id), resuming strictly after cursor.
+
+    Selects plain columns rather than ORM entities: these rows are only read
+    and serialized, and building an identity-mapped object per row cost more
+    than the query itself on long pages.
+    """
+    query = select(*_COLUMNS).order_by(MonitoringData.timestamp, MonitoringData.id)
+    if device_id is not None:
+        query = query.where(MonitoringData.device_id == device_id)
+    if start is not None:
+        query = query.where(MonitoringData.timestamp >= start)
+    if end is not None:
+        query = query.where(MonitoringData.timestamp < end)
+    if cursor is not None:
+        after_ts, after_id = decode_cursor(cursor)
+        query = query.where(or_(
+            MonitoringData.timestamp > after_ts,
+            and_(MonitoringData.timestamp == after_ts, MonitoringData.id > after_id),
+        ))
+    return query
+
+
+def archived(device_id=None, start=None, end=None, cursor=None):
+    """Archived rows for the same range/cursor, or None when no archived day overlaps."""
+    if not archive.partitions(start, end):
+        return None
+    return archive.iter_rows(device_id, start, end, decode_cursor(cursor) if cursor else None)
+
+
+def _key(row):
+    return row.timestamp, row.id
+
+
+def fetch_page(db, query, limit, archived_rows=None):
+    """One page of rows plus the cursor for the next one (None on the last page)."""
+    if archived_rows is None:
+        rows = db.execute(query.limit(limit + 1)).all()
+    else:
+        hot = db.execute(query.limit(limit + 1)).all()
+        rows = list(islice(heapq.merge(islice(archived_rows, limit + 1), hot, key=_key), limit + 1))
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+
+def iter_rows(query, limit=None, archived_rows=None, db=None):
+    """Yield lists of rows from a server-side cursor in STREAM_CHUNK_SIZE chunks.
+
+    Archived rows, if any, are merged in (timestamp, id) order. Opens its own
+    session unless db is given: a StreamingResponse body outlives the
+    request's dependency-managed session.
+    """
+    if db is None:
+        with SessionLocal() as db:
+            yield from iter_rows(query, limit, archived_rows, db)
+        return
+
+    if limit is not None:
+        query = query.limit(limit)
+    query = query.execution_options(stream_results=True, yield_per=STREAM_CHUNK_SIZE)
+
+    if archived_rows is None:
+        yield from db.execute(query).partitions()
+        return
+
+    merged = heapq.merge(archived_rows, db.execute(query), key=_key)
+    if limit is not None:
+        merged = islice(merged, limit)
+    while chunk := list(islice(merged, STREAM_CHUNK_SIZE)):
+        yield chunk
+
+
+def stream_ndjson(chunks, to_item):
+    for chunk in chunks:
+        yield b"".join(dumps(to_item(r)) + b"\n" for r in chunk)
+
+
+def stream_json_array(chunks, to_item):
+    """A JSON array written chunk by chunk instead of built in memory."""
+    yield b"["
+    first = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        # One encoder call per chunk; drop the chunk's own brackets
+        body = dumps([to_item(r) for r in chunk])[1:-1]
+        if not first:
+            body = b"," + body
+        first = False
+        yield body
+    yield b"]"
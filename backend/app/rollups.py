@@ -0,0 +1,238 @@
+from datetime import timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from models import MonitoringRollup
+from storage import store
+
+# Rollup tiers, finest first, with their bucket width
+RESOLUTIONS = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+# (rollup column prefix, Monitoring_Data column)
+METRICS = (("ph", "ph_value"), ("tds", "tds_value"), ("temperature", "temperature"))
+
+
+def bucket_start(ts, resolution):
+    if resolution == "1m":
+        return ts.replace(second=0, microsecond=0)
+    if resolution == "1h":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate(rows):
+    """Fold raw rows into {(resolution, device_id, bucket): stats} for every tier."""
+    buckets = {}
+    for row in rows:
+        for resolution in RESOLUTIONS:
+            key = (resolution, row["device_id"], bucket_start(row["timestamp"], resolution))
+            stats = buckets.get(key)
+            if stats is None:
+                stats = buckets[key] = {"count": 0}
+                for prefix, column in METRICS:
+                    value = row[column]
+                    stats[f"{prefix}_min"] = value
+                    stats[f"{prefix}_max"] = value
+                    stats[f"{prefix}_sum"] = 0.0
+            stats["count"] += 1
+            for prefix, column in METRICS:
+                value = row[column]
+                stats[f"{prefix}_min"] = min(stats[f"{prefix}_min"], value)
+                stats[f"{prefix}_max"] = max(stats[f"{prefix}_max"], value)
+                stats[f"{prefix}_sum"] += value
+    return buckets
+
+
+def aggregate_columns(rows):
+    """aggregate() with NumPy, for the large chunks read by rebuild().
+
+    rows have device_id, timestamp and metric attributes (stream rows).
+    """
+    import numpy as np
+
+    if not rows:
+        return {}
+    devices, device_index = np.unique(np.array([row.device_id for row in rows], dtype=object), return_inverse=True)
+    timestamps = np.array([row.timestamp for row in rows], dtype="datetime64[us]")
+    values = {column: np.array([getattr(row, column) for row in rows], dtype=float) for _, column in METRICS}
+
+    buckets = {}
+    for resolution, unit in (("1m", "m"), ("1h", "h"), ("1d", "D")):
+        starts = timestamps.astype(f"datetime64[{unit}]")
+        order = np.lexsort((starts, device_index))
+        device_sorted, start_sorted = device_index[order], starts[order]
+        first = np.flatnonzero(np.concatenate((
+            [True], (device_sorted[1:] != device_sorted[:-1]) | (start_sorted[1:] != start_sorted[:-1])
+        )))
+        stats = {"count": np.diff(np.append(first, len(order)))}
+        for prefix, column in METRICS:
+            sorted_values = values[column][order]
+            stats[f"{prefix}_min"] = np.minimum.reduceat(sorted_values, first)
+            stats[f"{prefix}_max"] = np.maximum.reduceat(sorted_values, first)
+            stats[f"{prefix}_sum"] = np.add.reduceat(sorted_values, first)
+
+        names = list(stats)
+        keys = zip(devices[device_sorted[first]].tolist(), start_sorted[first].astype("datetime64[us]").tolist())
+        for (device_id, bucket), row_stats in zip(keys, zip(*(stats[name].tolist() for name in names))):
+            buckets[(resolution, device_id, bucket)] = dict(zip(names, row_stats))
+    return buckets
+
+
+def _upsert_stmt(dialect):
+    """INSERT .. ON CONFLICT that merges a partial aggregate into a bucket."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        smallest, largest = func.least, func.greatest
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        smallest, largest = func.min, func.max  # two-argument scalar form
+
+    stmt = insert(MonitoringRollup.__table__)  # Core executemany, without ORM bulk bookkeeping
+    table = MonitoringRollup.__table__.c
+    values = {"count": table.count + stmt.excluded["count"]}
+    for prefix, _ in METRICS:
+        values[f"{prefix}_min"] = smallest(table[f"{prefix}_min"], stmt.excluded[f"{prefix}_min"])
+        values[f"{prefix}_max"] = largest(table[f"{prefix}_max"], stmt.excluded[f"{prefix}_max"])
+        values[f"{prefix}_sum"] = table[f"{prefix}_sum"] + stmt.excluded[f"{prefix}_sum"]
+
+    return stmt.on_conflict_do_update(
+        index_elements=["resolution", "device_id", "bucket"], set_=values
+    )
+
+
+def _merge_generic(db: Session, buckets):
+    """Read-modify-write fallback for dialects without ON CONFLICT."""
+    for (resolution, device_id, bucket), stats in buckets.items():
+        existing = db.execute(
+            select(MonitoringRollup).filter_by(resolution=resolution, device_id=device_id, bucket=bucket)
+        ).scalar_one_or_none()
+        if existing is None:
+            db.add(MonitoringRollup(resolution=resolution, device_id=device_id, bucket=bucket, **stats))
+            continue
+        existing.count += stats["count"]
+        for prefix, _ in METRICS:
+            setattr(existing, f"{prefix}_min", min(getattr(existing, f"{prefix}_min"), stats[f"{prefix}_min"]))
+            setattr(existing, f"{prefix}_max", max(getattr(existing, f"{prefix}_max"), stats[f"{prefix}_max"]))
+            setattr(existing, f"{prefix}_sum", getattr(existing, f"{prefix}_sum") + stats[f"{prefix}_sum"])
+
+
+def apply(db: Session, rows):
+    """Add rows to the rollups inside the caller's transaction."""
+    _merge(db, aggregate(rows))
+
+
+def _merge(db: Session, buckets):
+    if not buckets:
+        return
+
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        _merge_generic(db, buckets)
+        return
+
+    db.execute(
+        _upsert_stmt(dialect),
+        [
+            {"resolution": resolution, "device_id": device_id, "bucket": bucket, **stats}
+            for (resolution, device_id, bucket), stats in buckets.items()
+        ],
+    )
+
+
+def rebuild(db: Session, chunk_size=10000, device_id=None, start=None, end=None):
+    """Recompute rollups from the stored readings, optionally for one device / range.
+
+    start and end should sit on day boundaries so no bucket is cut in half.
+    """
+    clear = delete(MonitoringRollup)
+    if device_id is not None:
+        clear = clear.where(MonitoringRollup.device_id == device_id)
+    if start is not None:
+        clear = clear.where(MonitoringRollup.bucket >= start)
+    if end is not None:
+        clear = clear.where(MonitoringRollup.bucket < end)
+
+    db.execute(clear)
+    # Stored readings (archived days included), read on this session
+    for rows in store.stream(device_id, start, end, db=db):
+        _merge(db, aggregate_columns(rows))
+    db.commit()
+
+
+def ensure_built(db: Session):
+    """Backfill rollups once for databases created before they existed."""
+    has_rollups = db.execute(select(MonitoringRollup.id).limit(1)).first() is not None
+    has_data = store.has_data(db)
+    if has_data and not has_rollups:
+        rebuild(db)
+
+
+# -------------------------
+# Read side
+# -------------------------
+
+def _range(query, column, start, end):
+    if start is not None:
+        query = query.where(column >= start)
+    if end is not None:
+        query = query.where(column < end)
+    return query
+
+
+def count_points(db: Session, device_id, resolution, start=None, end=None):
+    if resolution == "raw":
+        return store.count(db, device_id, start, end)
+
+    query = select(func.count()).select_from(MonitoringRollup).where(
+        MonitoringRollup.resolution == resolution, MonitoringRollup.device_id == device_id
+    )
+    return db.scalar(_range(query, MonitoringRollup.bucket, start, end))
+
+
+def pick_resolution(db: Session, device_id, max_points, start=None, end=None):
+    """Finest tier whose point count fits max_points (coarsest if none do)."""
+    for resolution in ("raw", *RESOLUTIONS):
+        if count_points(db, device_id, resolution, start, end) <= max_points:
+            return resolution
+    return "1d"
+
+
+def series(db: Session, device_id, resolution, start=None, end=None):
+    """Points for one device in time order as dicts shaped like raw readings.
+
+    Rollup tiers report the bucket mean under the raw column names plus the
+    number of raw samples folded into it.
+    """
+    if resolution == "raw":
+        return store.series(db, device_id, start, end)
+
+    query = select(MonitoringRollup).where(
+        MonitoringRollup.resolution == resolution, MonitoringRollup.device_id == device_id
+    )
+    query = _range(query, MonitoringRollup.bucket, start, end).order_by(MonitoringRollup.bucket)
+
+    points = []
+    for r in db.scalars(query):
+        point = {"timestamp": r.bucket, "samples": r.count}
+        for prefix, column in METRICS:
+            point[column] = getattr(r, f"{prefix}_sum") / r.count
+        points.append(point)
+    return points
+
+
+def downsample(points, max_points):
+    """LTTB-reduce points to at most max_points, keeping all three metrics' shape."""
+    if max_points is None or len(points) <= max_points:
+        return points
+
+    import numpy as np
+    from downsample import lttb_indices
+
+    x = np.array([p["timestamp"].timestamp() for p in points])
+    ys = np.array([[p[column] for p in points] for _, column in METRICS], dtype=float)
+    return [points[i] for i in lttb_indices(x, ys, max_points)]
@@ -9,9 +9,25 @@ class MonitoringDataSchema(BaseModel):
     tds_value: float
     temperature: float
     timestamp: Optional[datetime] = None  # optional, backend can fill
+    seq: Optional[int] = None  # per-device sequence number, optional
 
     model_config = ConfigDict(from_attributes=True)
 
 class UserLogin(BaseModel):
     username: str
     password: str
+
+class CalibrationProfileSchema(BaseModel):
+    device_id: str
+    valid_from: datetime
+    valid_to: Optional[datetime] = None  # exclusive; open-ended if missing
+    ph_v7: Optional[float] = None  # left out = the firmware's constant
+    ph_slope: Optional[float] = None
+    tds_factor: Optional[float] = None
+    tds_temp_coefficient: float = 0.0
+    note: Optional[str] = None
+
+class ReprocessRequest(BaseModel):
+    device_id: Optional[str] = None  # every device if missing
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
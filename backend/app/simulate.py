@@ -1,73 +1,238 @@
-import requests
-import time
+"""Load generator for the ingest API.
+
+Drives any number of virtual devices from one asyncio client. Each device
+sends pH / TDS / temperature readings that follow a daily cycle, either
+one per POST /data or in groups through POST /data/batch. When the run
+ends (after --duration, or on Ctrl+C) a JSON report with throughput,
+error counts and latency percentiles is printed and optionally saved:
+
+    python simulate.py                                       # 4 devices, every 5 s
+    python simulate.py --devices 2000 --rate 1000 --ramp-up 30 \\
+        --batch-size 10 --duration 120 --report load.json
+"""
+import argparse
+import asyncio
+import json
+import math
 import random
-from datetime import datetime
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
 
 # Configuration
 BASE_URL = "http://127.0.0.1:8000"  # Update if needed
-DATA_ENDPOINT = f"{BASE_URL}/data"
-
-# Simulate multiple monitoring devices
-DEVICES = [
-    {"id": "device_001", "name": "Device 1"},
-    {"id": "device_002", "name": "Device 2"},
-    {"id": "device_003", "name": "Device 3"},
-    {"id": "device_004", "name": "Device 4"},
-]
-
-def generate_sensor_data():
-    """Generate random water quality sensor data"""
-    return {
-        "ph_value": round(random.uniform(5.0, 9.5), 2),
-        "tds_value": round(random.uniform(100, 1000), 1),  # ppm
-        "temperature": round(random.uniform(18, 35), 1)   # Celsius
-    }
-
-def send_device_data(device):
-    """Send sensor data to FastAPI backend"""
-    data = generate_sensor_data()
-    payload = {
-        "device_id": device["id"],
-        "ph_value": data["ph_value"],
-        "tds_value": data["tds_value"],
-        "temperature": data["temperature"],
-    }
+PROGRESS_INTERVAL = 10
+
+
+class DiurnalSignal:
+    """Per-device reading generator with a 24 h cycle plus noise.
+
+    Temperature peaks mid-afternoon; pH rises with daytime photosynthesis
+    and falls overnight; TDS drifts slowly and dips a little when the water
+    is warm. Each device gets its own baseline so series are distinguishable.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.ph_base = rng.uniform(6.8, 7.8)
+        self.tds_base = rng.uniform(150, 600)
+        self.temp_base = rng.uniform(18, 26)
+        self.phase = rng.uniform(-1.0, 1.0)  # hours
+        self.tds_drift = 0.0
+
+    def reading(self, at):
+        hour = at.hour + at.minute / 60 + at.second / 3600 + self.phase
+        day = math.sin(2 * math.pi * (hour - 9) / 24)  # peaks at 15:00
+        self.tds_drift += self.rng.gauss(0, 0.5)
+        return {
+            "ph_value": round(self.ph_base + 0.3 * day + self.rng.gauss(0, 0.03), 2),
+            "tds_value": round(max(self.tds_base + self.tds_drift - 15 * day + self.rng.gauss(0, 3), 0), 1),
+            "temperature": round(self.temp_base + 4 * day + self.rng.gauss(0, 0.2), 1),
+        }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+        self.requests = 0
+        self.readings_sent = 0
+        self.readings_saved = 0
+
+    def record(self, latency, sent, saved, error=None):
+        self.requests += 1
+        self.readings_sent += sent
+        self.readings_saved += saved
+        self.latencies.append(latency)
+        if error:
+            self.errors[error] += 1
+
+    def report(self, elapsed, config):
+        latencies = sorted(self.latencies)
+
+        def pct(p):
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2)
+
+        return {
+            "config": config,
+            "elapsed_s": round(elapsed, 2),
+            "requests": self.requests,
+            "readings_sent": self.readings_sent,
+            "readings_saved": self.readings_saved,
+            "errors": dict(self.errors),
+            "error_count": sum(self.errors.values()),
+            "throughput": {
+                "requests_per_s": round(self.requests / elapsed, 1) if elapsed else 0.0,
+                "readings_per_s": round(self.readings_saved / elapsed, 1) if elapsed else 0.0,
+            },
+            "latency_ms": {
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "p99": pct(0.99),
+                "max": round(latencies[-1] * 1000, 2) if latencies else None,
+                "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+            },
+        }
+
 
+async def send(client, recorder, device_id, readings):
+    """POST readings (one -> /data, several -> /data/batch) and record the outcome."""
+    if len(readings) == 1:
+        path, body = "/data", {"device_id": device_id, **readings[0]}
+    else:
+        path, body = "/data/batch", [{"device_id": device_id, **r} for r in readings]
+
+    started = time.perf_counter()
     try:
-        response = requests.post(DATA_ENDPOINT, json=payload, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ {device['name']} | Data sent | ID: {data.get('id', 'N/A')} | PH: {payload['ph_value']} | TDS: {payload['tds_value']} | Temp: {payload['temperature']}")
-        else:
-            print(f"❌ {device['name']} | HTTP {response.status_code}: {response.text}")
-    except requests.exceptions.ConnectionError:
-        print(f"🔌 {device['name']} | Connection failed - Is FastAPI running?")
-    except Exception as e:
-        print(f"⚠️ {device['name']} | Error: {e}")
-
-def simulate_device(device, interval=5):
-    """Simulate a device sending data at intervals (seconds)"""
+        response = await client.post(path, json=body)
+    except httpx.HTTPError as e:
+        recorder.record(time.perf_counter() - started, len(readings), 0, type(e).__name__)
+        return
+    latency = time.perf_counter() - started
+
+    if response.status_code != 200:
+        recorder.record(latency, len(readings), 0, f"HTTP {response.status_code}")
+    elif len(readings) == 1:
+        recorder.record(latency, 1, 1)
+    else:
+        result = response.json()
+        error = "rejected readings" if result.get("failed") else None
+        recorder.record(latency, len(readings), result.get("saved", 0), error)
+
+
+async def run_device(client, recorder, device_id, signal, args, start_delay, deadline, clock):
+    """Send one device's readings on a fixed schedule until deadline.
+
+    The schedule does not slip when the server is slow: a late request is
+    followed immediately by the next one, as a real fleet would behave.
+    """
+    if deadline is not None:
+        start_delay = min(start_delay, max(deadline - time.monotonic(), 0))
+    await asyncio.sleep(start_delay)
+    interval = args.interval
+    next_send = time.monotonic()
+    pending = []
+    seq = 0
+    while deadline is None or time.monotonic() < deadline:
+        at = clock()
+        reading = signal.reading(at)
+        reading["timestamp"] = at.isoformat()
+        reading["seq"] = seq
+        seq += 1
+        pending.append(reading)
+        if len(pending) >= args.batch_size:
+            await send(client, recorder, device_id, pending)
+            pending = []
+        next_send += interval
+        wake = next_send if deadline is None else min(next_send, deadline)
+        await asyncio.sleep(max(wake - time.monotonic(), 0))
+
+
+async def progress(recorder, started):
     while True:
-        send_device_data(device)
-        time.sleep(interval)
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        elapsed = time.monotonic() - started
+        print(f"📈 {elapsed:.0f}s | {recorder.requests} requests | "
+              f"{recorder.readings_saved / elapsed:.1f} readings/s | "
+              f"{sum(recorder.errors.values())} errors")
+
+
+async def simulate(args):
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    started = time.monotonic()
+    deadline = started + args.ramp_up + args.duration if args.duration else None
+
+    # --speedup compresses the day so the diurnal shape shows up in short runs
+    # and local time of day drives the cycle
+    wall_start = datetime.now().astimezone()
+
+    def clock():
+        return wall_start + timedelta(seconds=(time.monotonic() - started) * args.speedup)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        tasks = [
+            asyncio.create_task(run_device(
+                client, recorder, f"{args.prefix}{i + 1:0{len(str(args.devices))}d}",
+                DiurnalSignal(random.Random(rng.random())), args,
+                args.ramp_up * i / args.devices + rng.uniform(0, args.interval), deadline, clock,
+            ))
+            for i in range(args.devices)
+        ]
+        reporter = asyncio.create_task(progress(recorder, started))
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            reporter.cancel()
+            for task in tasks:
+                task.cancel()
+
+    config = {k: v for k, v in vars(args).items() if k != "report"}
+    return recorder.report(time.monotonic() - started, config)
+
 
 def main():
-    import threading
+    parser = argparse.ArgumentParser(description="Load-test the ingest API with virtual devices")
+    parser.add_argument("--url", default=BASE_URL)
+    parser.add_argument("--devices", type=int, default=4, help="number of virtual devices")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between readings per device")
+    parser.add_argument("--rate", type=float,
+                        help="total readings per second across all devices (overrides --interval)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="readings per request; above 1 uses /data/batch")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="seconds over which devices start")
+    parser.add_argument("--duration", type=float, help="seconds to run after ramp-up (default: until Ctrl+C)")
+    parser.add_argument("--concurrency", type=int, default=100, help="maximum open connections")
+    parser.add_argument("--timeout", type=float, default=10.0, help="request timeout in seconds")
+    parser.add_argument("--speedup", type=float, default=1.0, help="simulated seconds per real second")
+    parser.add_argument("--prefix", default="device_", help="device id prefix")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    if args.rate:
+        args.interval = args.devices / args.rate
 
-    print("💧 Starting Water Quality Monitoring Simulation")
-    
-    threads = []
-    for device in DEVICES:
-        t = threading.Thread(target=simulate_device, args=(device,), daemon=True)
-        threads.append(t)
-        t.start()
-        time.sleep(0.5)  # Slight stagger
+    print(f"💧 Simulating {args.devices} devices, one reading every {args.interval:g}s each "
+          f"({args.devices / args.interval:.1f} readings/s), batch size {args.batch_size}")
 
     try:
-        while True:
-            time.sleep(1)
+        report = asyncio.run(simulate(args))
     except KeyboardInterrupt:
         print("\n🛑 Simulation stopped by user")
+        return
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
 
 if __name__ == "__main__":
     main()
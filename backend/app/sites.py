@@ -0,0 +1,216 @@
+"""In-memory spatial index of water body locations for the map.
+
+Sites are bucketed into a uniform latitude/longitude grid (SITE_GRID_DEGREES
+per cell), so a viewport query only visits the cells it overlaps and a
+nearest-N query only the rings of cells around the point. The index is
+loaded from water_bodies at startup and updated when a location is saved.
+"""
+import heapq
+import math
+import os
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import WaterBody
+
+GRID_DEGREES = float(os.getenv("SITE_GRID_DEGREES", "0.5"))
+# Sites closer than this many screen pixels at the requested zoom are merged
+CLUSTER_PIXELS = int(os.getenv("MAP_CLUSTER_PIXELS", "60"))
+
+EARTH_RADIUS_KM = 6371.0088
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell(lat, lng):
+    return math.floor(lat / GRID_DEGREES), math.floor(lng / GRID_DEGREES)
+
+
+class SiteIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sites = {}  # device_id -> (lat, lng)
+        self._cells = {}  # (row, col) -> {device_id: (lat, lng)}
+
+    def warm(self, db: Session):
+        rows = db.execute(select(WaterBody.device_id, WaterBody.latitude, WaterBody.longitude)).all()
+        with self._lock:
+            self._sites = {}
+            self._cells = {}
+            for device_id, lat, lng in rows:
+                self._add(device_id, lat, lng)
+
+    def _add(self, device_id, lat, lng):
+        self._sites[device_id] = (lat, lng)
+        self._cells.setdefault(_cell(lat, lng), {})[device_id] = (lat, lng)
+
+    def _remove(self, device_id):
+        old = self._sites.pop(device_id, None)
+        if old is None:
+            return
+        key = _cell(*old)
+        cell = self._cells[key]
+        del cell[device_id]
+        if not cell:
+            del self._cells[key]
+
+    def set(self, device_id, lat, lng):
+        with self._lock:
+            self._remove(device_id)
+            self._add(device_id, lat, lng)
+
+    def __len__(self):
+        return len(self._sites)
+
+    def bbox(self, south, west, north, east):
+        """(device_id, lat, lng) inside the box; west > east crosses the antimeridian."""
+        if west > east:
+            return self.bbox(south, west, north, 180.0) + self.bbox(south, -180.0, north, east)
+
+        (r0, c0), (r1, c1) = _cell(south, west), _cell(north, east)
+        found = []
+        with self._lock:
+            if (r1 - r0 + 1) * (c1 - c0 + 1) <= len(self._cells):
+                cells = (self._cells.get((r, c)) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1))
+            else:
+                # A wide viewport: cheaper to walk the occupied cells
+                cells = (cell for (r, c), cell in self._cells.items() if r0 <= r <= r1 and c0 <= c <= c1)
+            for cell in cells:
+                if not cell:
+                    continue
+                for device_id, (lat, lng) in cell.items():
+                    if south <= lat <= north and west <= lng <= east:
+                        found.append((device_id, lat, lng))
+        return found
+
+    def nearest(self, lat, lng, n):
+        """The n closest sites as (distance_km, device_id, lat, lng), nearest first."""
+        with self._lock:
+            if len(self._cells) <= 64:
+                candidates = [(device_id, s_lat, s_lng) for device_id, (s_lat, s_lng) in self._sites.items()]
+                return _closest(lat, lng, candidates, n)
+
+            row, col = _cell(lat, lng)
+            half = math.ceil(180 / GRID_DEGREES)  # columns either side of the antimeridian
+            wanted = min(n, len(self._sites))
+            visited = set()
+            ranked = []
+            ring = 0
+            while True:
+                candidates = [(device_id, s_lat, s_lng) for _, device_id, s_lat, s_lng in ranked]
+                for r, c in _ring(row, col, ring):
+                    key = (r, (c + half) % (2 * half) - half)
+                    if key in visited:
+                        continue
+                    visited.add(key)
+                    cell = self._cells.get(key)
+                    if cell:
+                        candidates.extend((device_id, s_lat, s_lng) for device_id, (s_lat, s_lng) in cell.items())
+                ranked = _closest(lat, lng, candidates, n)
+                # Sites outside the rings searched so far are at least
+                # ring * GRID_DEGREES away in latitude or longitude, and a degree
+                # of longitude shrinks towards the poles
+                reach = ring * GRID_DEGREES * _KM_PER_DEGREE * math.cos(
+                    math.radians(min(89.0, abs(lat) + (ring + 1) * GRID_DEGREES)))
+                if len(ranked) >= wanted and (not ranked or ranked[-1][0] <= reach):
+                    return ranked
+                if ring > half:
+                    return ranked
+                ring += 1
+
+    def get(self, device_id):
+        with self._lock:
+            return self._sites.get(device_id)
+
+
+def _ring(row, col, k):
+    if k == 0:
+        yield row, col
+        return
+    for c in range(col - k, col + k + 1):
+        yield row - k, c
+        yield row + k, c
+    for r in range(row - k + 1, row + k):
+        yield r, col - k
+        yield r, col + k
+
+
+def _closest(lat, lng, candidates, n):
+    return heapq.nsmallest(
+        n, ((distance_km(lat, lng, s_lat, s_lng), device_id, s_lat, s_lng) for device_id, s_lat, s_lng in candidates)
+    )
+
+
+def cluster(sites, zoom):
+    """Merge sites that would overlap on screen at zoom into clusters.
+
+    sites are (device_id, lat, lng). Returns (singles, clusters): singles keep
+    their (device_id, lat, lng) tuples; clusters are dicts with the member
+    count, centroid and bounds (west, south, east, north).
+    """
+    # Degrees of longitude covered by CLUSTER_PIXELS on 256 px Web Mercator tiles
+    size = 360 / (256 * 2 ** zoom) * CLUSTER_PIXELS
+    groups = {}
+    for site in sites:
+        _, lat, lng = site
+        groups.setdefault((math.floor(lat / size), math.floor(lng / size)), []).append(site)
+
+    singles, clusters = [], []
+    for members in groups.values():
+        if len(members) == 1:
+            singles.append(members[0])
+            continue
+        lats = [lat for _, lat, _ in members]
+        lngs = [lng for _, _, lng in members]
+        clusters.append({
+            "count": len(members),
+            "latitude": sum(lats) / len(lats),
+            "longitude": sum(lngs) / len(lngs),
+            "bbox": [min(lngs), min(lats), max(lngs), max(lats)],
+        })
+    return singles, clusters
+
+
+def _wrap(lng):
+    return (lng + 180) % 360 - 180
+
+
+def parse_bbox(text):
+    """"west,south,east,north" (Leaflet's toBBoxString order) to (south, west, north, east).
+
+    Longitudes of a map panned past the antimeridian are wrapped back into
+    [-180, 180), and a viewport wider than the world covers all of it.
+    """
+    try:
+        west, south, east, north = (float(v) for v in text.split(","))
+    except ValueError:
+        raise ValueError("bbox must be west,south,east,north") from None
+    if south > north or west > east:
+        raise ValueError("bbox must be west,south,east,north")
+    south, north = max(south, -90.0), min(north, 90.0)
+    if east - west >= 360:
+        return south, -180.0, north, 180.0
+    return south, _wrap(west), north, _wrap(east)
+
+
+def parse_point(text):
+    """"lat,lng" to (lat, lng)."""
+    try:
+        lat, lng = (float(v) for v in text.split(","))
+    except ValueError:
+        raise ValueError("near must be lat,lng") from None
+    if not -90 <= lat <= 90:
+        raise ValueError("near is out of range")
+    return lat, _wrap(lng)
+
+
+site_index = SiteIndex()
@@ -0,0 +1,96 @@
+"""Durable store-and-forward spool for the serial gateway.
+
+Readings are appended to a local SQLite journal before anything is sent,
+and only deleted once the backend has acknowledged them, so a backend
+restart or network outage leaves no gaps. The rowid is the replay offset:
+acknowledging a batch deletes everything up to its last rowid in one
+transaction, which either happens completely or not at all.
+"""
+import json
+import sqlite3
+import threading
+
+SPOOL_PATH = "esp32_spool.db"
+# Oldest readings are discarded once the spool holds this many
+SPOOL_MAX_ROWS = 1_000_000
+
+
+class Spool:
+    def __init__(self, path=SPOOL_PATH, max_rows=SPOOL_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " read_at REAL NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        self._depth = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        self.readable = threading.Event()
+        if self._depth:
+            self.readable.set()
+
+    def __len__(self):
+        return self._depth
+
+    def append(self, items):
+        """Persist (payload, read_at epoch seconds) pairs in one transaction."""
+        if not items:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT INTO spool (read_at, payload) VALUES (?, ?)",
+                [(read_at, json.dumps(payload)) for payload, read_at in items],
+            )
+            overflow = self._depth + len(items) - self.max_rows
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM spool WHERE seq IN (SELECT seq FROM spool ORDER BY seq LIMIT ?)",
+                    (overflow,),
+                )
+            self._conn.execute("COMMIT")
+            self._depth += len(items) - max(overflow, 0)
+            self.dropped += max(overflow, 0)
+        self.readable.set()
+
+    def peek(self, limit):
+        """Oldest unacknowledged readings as [(seq, payload, read_at)]."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, payload, read_at FROM spool ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+            if not rows:
+                self.readable.clear()
+        return [(seq, json.loads(payload), read_at) for seq, payload, read_at in rows]
+
+    def ack(self, last_seq):
+        """Forget every reading up to and including last_seq."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM spool WHERE seq <= ?", (last_seq,)).rowcount
+            self._depth = max(self._depth - removed, 0)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Backoff:
+    """Exponential retry delay, reset after a success."""
+
+    def __init__(self, initial=1.0, maximum=60.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.delay = 0.0
+
+    def failed(self):
+        self.delay = min(self.delay * 2, self.maximum) if self.delay else self.initial
+        return self.delay
+
+    def succeeded(self):
+        self.delay = 0.0
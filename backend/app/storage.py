@@ -0,0 +1,293 @@
+"""Where raw readings are stored.
+
+STORAGE_BACKEND selects the engine behind every read and write of raw
+readings:
+
+- sql (default): the Monitoring_Data table, plus the Parquet archive
+- tsdb: the embedded time-series store in tsdb.py, under TSDB_PATH
+
+Everything else (users, water bodies, the devices registry, rollups,
+alerts) stays in SQL with either backend. Rows handed out by both backends
+have the attributes id, device_id, timestamp, ph_value, tds_value and
+temperature, and iterate in (timestamp, id) order. Both store at most one
+reading per (device_id, timestamp), with sql counting the archive too; see
+dedupe.py.
+"""
+import os
+
+from sqlalchemy import event, func, insert, select, tuple_
+from sqlalchemy.orm import Session, aliased
+
+import archive
+import pagination
+from dedupe import reading_key
+from models import Device, MonitoringData
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sql")
+
+_READING_COLUMNS = (
+    MonitoringData.id,
+    MonitoringData.device_id,
+    MonitoringData.ph_value,
+    MonitoringData.tds_value,
+    MonitoringData.temperature,
+    MonitoringData.timestamp,
+)
+
+
+def _range(query, start, end):
+    if start is not None:
+        query = query.where(MonitoringData.timestamp >= start)
+    if end is not None:
+        query = query.where(MonitoringData.timestamp < end)
+    return query
+
+
+class SQLStorage:
+    name = "sql"
+
+    def append(self, db: Session, rows):
+        """Insert rows in the caller's transaction; returns ids in input order.
+
+        Rows must have distinct keys. A row whose (device_id, timestamp) is
+        already stored is skipped (the first write wins), gets the stored
+        reading's id and is marked row["duplicate"] = True. That includes
+        readings of archived days, which the unique index no longer sees.
+        """
+        archived = archive.find([reading_key(row) for row in rows])
+        if not archived:
+            return self._insert(db, rows)
+        for row in rows:
+            if reading_key(row) in archived:
+                row["duplicate"] = True
+        ids = iter(self._insert(db, [row for row in rows if not row.get("duplicate")]))
+        return [archived[reading_key(row)] if reading_key(row) in archived else next(ids) for row in rows]
+
+    def _insert(self, db: Session, rows):
+        if not rows:
+            return []
+        dialect = db.get_bind().dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            stmt = (
+                dialect_insert(MonitoringData)
+                .on_conflict_do_nothing(index_elements=["device_id", "timestamp"])
+                .returning(MonitoringData.device_id, MonitoringData.timestamp, MonitoringData.id)
+            )
+            inserted = {(device_id, ts): new_id for device_id, ts, new_id in db.execute(stmt, rows)}
+        else:
+            existing = self._existing(db, rows)
+            new = [row for row in rows if reading_key(row) not in existing]
+            ids = db.scalars(
+                insert(MonitoringData).returning(MonitoringData.id, sort_by_parameter_order=True), new
+            ).all() if new else []
+            inserted = {reading_key(row): new_id for row, new_id in zip(new, ids)}
+
+        skipped = [row for row in rows if reading_key(row) not in inserted]
+        existing = self._existing(db, skipped) if skipped else {}
+        for row in skipped:
+            row["duplicate"] = True
+        return [inserted.get(reading_key(row)) or existing.get(reading_key(row)) for row in rows]
+
+    def _existing(self, db: Session, rows):
+        """{(device_id, timestamp): id} for the keys of rows that are stored."""
+        keys = [reading_key(row) for row in rows]
+        found = {}
+        for start in range(0, len(keys), 500):
+            query = select(MonitoringData.device_id, MonitoringData.timestamp, MonitoringData.id).where(
+                tuple_(MonitoringData.device_id, MonitoringData.timestamp).in_(keys[start:start + 500])
+            )
+            found.update({(device_id, ts): stored_id for device_id, ts, stored_id in db.execute(query)})
+        return found
+
+    def page(self, db: Session, device_id, start, end, cursor, limit):
+        """One keyset page and the cursor of the next (None on the last page)."""
+        query = pagination.keyset_query(device_id, start, end, cursor)
+        return pagination.fetch_page(db, query, limit, pagination.archived(device_id, start, end, cursor))
+
+    def stream(self, device_id=None, start=None, end=None, cursor=None, limit=None, db=None):
+        """Lists of rows, read in chunks; with a session of its own unless db is given."""
+        query = pagination.keyset_query(device_id, start, end, cursor)
+        return pagination.iter_rows(query, limit, pagination.archived(device_id, start, end, cursor), db)
+
+    def count(self, db: Session, device_id=None, start=None, end=None):
+        query = select(func.count()).select_from(MonitoringData)
+        if device_id is not None:
+            query = query.where(MonitoringData.device_id == device_id)
+        return db.scalar(_range(query, start, end)) + archive.count(device_id, start, end)
+
+    def has_data(self, db: Session):
+        return db.execute(select(MonitoringData.id).limit(1)).first() is not None
+
+    def series(self, db: Session, device_id, start=None, end=None):
+        """Raw points for one device as timestamp / metric dicts, in time order."""
+        query = select(
+            MonitoringData.timestamp, MonitoringData.ph_value,
+            MonitoringData.tds_value, MonitoringData.temperature,
+        ).where(MonitoringData.device_id == device_id)
+        query = _range(query, start, end).order_by(MonitoringData.timestamp)
+        points = [dict(row) for row in db.execute(query).mappings()]
+
+        # Days moved to cold storage come back from the Parquet archive
+        archived = [
+            {"timestamp": r.timestamp, "ph_value": r.ph_value,
+             "tds_value": r.tds_value, "temperature": r.temperature}
+            for r in archive.iter_rows(device_id, start, end)
+        ]
+        if archived:
+            points = sorted(archived + points, key=lambda p: p["timestamp"])
+        return points
+
+    def latest(self, db: Session, device_id=None):
+        """Newest reading of every registered device (or of one device), as row mappings."""
+        if device_id is not None:
+            row = db.execute(
+                select(*_READING_COLUMNS)
+                .where(MonitoringData.device_id == device_id)
+                .order_by(MonitoringData.timestamp.desc(), MonitoringData.id.desc())
+                .limit(1)
+            ).mappings().first()
+            return [] if row is None else [row]
+
+        # One seek on (device_id, timestamp) per registered device, so the
+        # cost follows the number of devices rather than the table size.
+        inner = aliased(MonitoringData)
+        newest_id = (
+            select(inner.id)
+            .where(inner.device_id == Device.device_id)
+            .order_by(inner.timestamp.desc(), inner.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        query = select(*_READING_COLUMNS).select_from(Device).join(MonitoringData, MonitoringData.id == newest_id)
+        return list(db.execute(query).mappings())
+
+    def references(self, db: Session, target):
+        """{device_id: (latest reading, reading closest to target)} for derived metrics."""
+        import derived
+
+        return derived.query_references(db, target)
+
+
+class TimeSeriesStorage:
+    """Raw readings in the embedded store; see tsdb.py."""
+
+    name = "tsdb"
+
+    def __init__(self, path=None):
+        import tsdb
+
+        self.db = tsdb.TimeSeriesDB(path or tsdb.TSDB_PATH)
+        if not event.contains(Session, "after_commit", _write_staged):
+            event.listen(Session, "after_commit", _write_staged)
+            event.listen(Session, "after_transaction_end", _release_staged)
+
+    def append(self, db: Session, rows):
+        """Ids now, readings written once the caller's transaction commits.
+
+        The registry, rollups and alerts go in the caller's SQL transaction;
+        holding the readings back until it commits (and dropping them if it
+        rolls back) keeps a failed batch out of the store, so a retry is
+        stored rather than taken for a duplicate. Duplicates are marked like
+        SQLStorage, counting readings staged by transactions still open.
+        """
+        if not db.in_transaction():
+            db.begin()  # so a rollback before any SQL still releases the batch
+        ids, staged = self.db.stage(rows)
+        db.info.setdefault(_STAGED, []).append((self.db, staged))
+        return ids
+
+    def page(self, db: Session, device_id, start, end, cursor, limit):
+        after = pagination.decode_cursor(cursor) if cursor else None
+        rows = []
+        for row in self.db.iter_readings(device_id, start, end, after):
+            rows.append(row)
+            if len(rows) > limit:
+                break
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, pagination.encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+    def stream(self, device_id=None, start=None, end=None, cursor=None, limit=None, db=None):
+        from itertools import islice
+
+        after = pagination.decode_cursor(cursor) if cursor else None
+        readings = self.db.iter_readings(device_id, start, end, after)
+        if limit is not None:
+            readings = islice(readings, limit)
+        while chunk := list(islice(readings, pagination.STREAM_CHUNK_SIZE)):
+            yield chunk
+
+    def count(self, db: Session, device_id=None, start=None, end=None):
+        return self.db.count(device_id, start, end)
+
+    def has_data(self, db: Session):
+        return self.db.count() > 0
+
+    def series(self, db: Session, device_id, start=None, end=None):
+        import tsdb
+
+        columns = self.db.read(device_id, start, end)
+        timestamps = tsdb.from_us(columns["timestamp"])
+        ph, tds, temp = (columns[m].tolist() for m in tsdb.METRICS)
+        return [
+            {"timestamp": t, "ph_value": p, "tds_value": d, "temperature": c}
+            for t, p, d, c in zip(timestamps, ph, tds, temp)
+        ]
+
+    def latest(self, db: Session, device_id=None):
+        return [r._asdict() for r in self.db.latest(device_id)]
+
+    def references(self, db: Session, target):
+        latest = {r.device_id: r._asdict() for r in self.db.latest()}
+        closest = self.db.closest(target)
+        return {
+            device_id: (
+                _metrics(reading),
+                _metrics(closest[device_id]._asdict()) if closest.get(device_id) else None,
+            )
+            for device_id, reading in latest.items()
+        }
+
+    def stats(self):
+        return self.db.stats()
+
+
+# Session.info key: (TimeSeriesDB, staged batch) pairs waiting for the commit
+_STAGED = "tsdb_staged"
+
+
+def _write_staged(session):
+    batches = session.info.pop(_STAGED, [])
+    for i, (target, staged) in enumerate(batches):
+        try:
+            target.write(staged)
+        except BaseException:
+            for other, rest in batches[i + 1:]:
+                other.release(rest)
+            raise
+
+
+def _release_staged(session, transaction):
+    if transaction.parent is None:
+        for target, staged in session.info.pop(_STAGED, []):
+            target.release(staged)
+
+
+def _metrics(reading):
+    return {k: reading[k] for k in ("timestamp", "ph_value", "tds_value", "temperature")}
+
+
+def open_storage(backend=STORAGE_BACKEND):
+    if backend == "sql":
+        return SQLStorage()
+    if backend == "tsdb":
+        return TimeSeriesStorage()
+    raise ValueError(f"STORAGE_BACKEND must be sql or tsdb, not {backend!r}")
+
+
+store = open_storage()
@@ -0,0 +1,542 @@
+"""Embedded append-only time-series store for readings.
+
+Layout: <TSDB_PATH>/
+    store.json                      chunk_rows the store was created with
+    <device id, URL-quoted>/
+        index.json                  one entry per chunk: capacity, rows, min/max timestamp, sorted
+        <number>.chunk              fixed-capacity column blocks, memory-mapped
+
+Each device's readings are split into chunks of TSDB_CHUNK_ROWS rows. A
+chunk file holds one little-endian array per column (id, timestamp,
+ph_value, tds_value, temperature), back to back, so the column offsets
+depend on the capacity: it is recorded per chunk, and a store refuses to
+open with a TSDB_CHUNK_ROWS other than the one it was created with.
+Timestamps are int64 microseconds of the stored (naive Africa/Lusaka) wall
+time. The per-chunk min/max timestamps are the time index: a range read
+opens only the chunks that overlap it and binary-searches inside them, and
+the result is a view on the mapped file rather than a copy. Readings that
+arrive out of order mark their chunk unsorted; such chunks are filtered
+and sorted on read instead. A device stores at most one reading per
+timestamp: appending a timestamp it already has is a no-op.
+
+A chunk's rows are written and flushed before index.json is replaced, so
+a crash can lose the last batch but never expose half of one. stage() and
+write() split an append so the SQL backend's caller can write only once
+its own transaction has committed (see storage.TimeSeriesStorage). One process
+writes a store at a time.
+
+    python tsdb.py import     # copy Monitoring_Data into TSDB_PATH
+    python tsdb.py stats
+"""
+import argparse
+import heapq
+import json
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import repeat
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+TSDB_PATH = os.getenv("TSDB_PATH", "tsdb")
+# Capacity of new stores' chunks; an existing store keeps its own (store.json)
+CHUNK_ROWS = int(os.getenv("TSDB_CHUNK_ROWS", "65536"))
+
+DTYPES = {
+    "id": np.dtype("<i8"),
+    "timestamp": np.dtype("<i8"),
+    "ph_value": np.dtype("<f8"),
+    "tds_value": np.dtype("<f8"),
+    "temperature": np.dtype("<f8"),
+}
+METRICS = ("ph_value", "tds_value", "temperature")
+_ROW_BYTES = sum(dtype.itemsize for dtype in DTYPES.values())
+
+COLUMNS = ("id", "device_id", "timestamp", "ph_value", "tds_value", "temperature")
+Reading = namedtuple("Reading", COLUMNS)
+
+# Rows converted to Python objects at a time when iterating
+_ITER_BLOCK = 1024
+
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+
+def to_us(ts):
+    return (ts - _EPOCH) // _US
+
+
+def from_us(values):
+    """int64 microsecond array -> list of naive datetimes."""
+    return np.asarray(values).astype("datetime64[us]").tolist()
+
+
+class _Chunk:
+    """meta["capacity"] rows in one file: one fixed-size block per column, mapped on first use."""
+
+    def __init__(self, directory, number, meta, create=False):
+        self.path = os.path.join(directory, f"{number:05d}.chunk")
+        self.meta = meta
+        self._columns = None
+        if create:
+            with open(self.path, "wb") as f:
+                f.truncate(meta["capacity"] * _ROW_BYTES)  # sparse until written
+        elif "capacity" not in meta:
+            # Written before capacities were recorded: the file was created at full size
+            meta["capacity"] = _file_capacity(self.path)
+
+    @property
+    def capacity(self):
+        return self.meta["capacity"]
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            capacity = self.capacity
+            if os.path.getsize(self.path) != capacity * _ROW_BYTES:
+                raise ValueError(f"{self.path} does not hold {capacity} rows; the store is damaged")
+            raw = np.memmap(self.path, dtype=np.uint8, mode="r+", shape=(capacity * _ROW_BYTES,))
+            self._raw = raw
+            self._columns = {}
+            offset = 0
+            for name, dtype in DTYPES.items():
+                size = capacity * dtype.itemsize
+                self._columns[name] = raw[offset:offset + size].view(dtype)
+                offset += size
+        return self._columns
+
+    def flush(self):
+        if self._columns is not None:
+            self._raw.flush()
+
+    @property
+    def rows(self):
+        return self.meta["rows"]
+
+    def view(self, lo=0, hi=None):
+        hi = self.rows if hi is None else hi
+        return {name: array[lo:hi] for name, array in self.columns.items()}
+
+    def select(self, start=None, end=None):
+        """Columns for start <= timestamp < end, in time order."""
+        rows = self.rows
+        if rows == 0 or (start is not None and self.meta["max"] < start) or \
+                (end is not None and self.meta["min"] >= end):
+            return None
+        ts = self.columns["timestamp"][:rows]
+        if self.meta["sorted"]:
+            lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+            hi = rows if end is None else int(np.searchsorted(ts, end, side="left"))
+            return self.view(lo, hi) if hi > lo else None
+
+        mask = np.ones(rows, dtype=bool)
+        if start is not None:
+            mask &= ts >= start
+        if end is not None:
+            mask &= ts < end
+        if not mask.any():
+            return None
+        selected = {name: array[:rows][mask] for name, array in self.columns.items()}
+        order = np.lexsort((selected["id"], selected["timestamp"]))
+        return {name: array[order] for name, array in selected.items()}
+
+
+def _file_capacity(path):
+    size = os.path.getsize(path)
+    if size % _ROW_BYTES:
+        raise ValueError(f"{path} is not a whole number of rows; the store is damaged")
+    return size // _ROW_BYTES
+
+
+class DeviceSeries:
+    def __init__(self, directory, chunk_rows=CHUNK_ROWS):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.device_id = unquote(os.path.basename(directory))
+        index_path = os.path.join(directory, "index.json")
+        metas = []
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                metas = json.load(f)["chunks"]
+        self.chunks = [_Chunk(directory, n, meta) for n, meta in enumerate(metas)]
+
+    def _write_index(self):
+        path = os.path.join(self.directory, "index.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"chunks": [c.meta for c in self.chunks]}, f)
+        os.replace(path + ".tmp", path)
+
+    def append(self, columns):
+        """Append equal-length column arrays; flushes data, then the index."""
+        total = len(columns["timestamp"])
+        done = 0
+        touched = []
+        while done < total:
+            if not self.chunks or self.chunks[-1].rows == self.chunks[-1].capacity:
+                meta = {"capacity": self.chunk_rows, "rows": 0, "min": None, "max": None, "sorted": True}
+                self.chunks.append(_Chunk(self.directory, len(self.chunks), meta, create=True))
+            chunk = self.chunks[-1]
+            take = min(chunk.capacity - chunk.rows, total - done)
+            lo, hi = chunk.rows, chunk.rows + take
+            for name in DTYPES:
+                chunk.columns[name][lo:hi] = columns[name][done:done + take]
+
+            ts = columns["timestamp"][done:done + take]
+            meta = chunk.meta
+            first, smallest, largest = int(ts[0]), int(ts.min()), int(ts.max())
+            in_order = meta["max"] is None or first >= meta["max"]
+            meta["sorted"] = bool(meta["sorted"] and in_order and (take == 1 or (np.diff(ts) >= 0).all()))
+            meta["min"] = smallest if meta["min"] is None else min(meta["min"], smallest)
+            meta["max"] = largest if meta["max"] is None else max(meta["max"], largest)
+            meta["rows"] = hi
+            touched.append(chunk)
+            done += take
+
+        for chunk in touched:
+            chunk.flush()
+        self._write_index()
+
+    def segments(self, start=None, end=None):
+        """Per-chunk column views overlapping [start, end), in chunk order."""
+        for chunk in self.chunks:
+            selected = chunk.select(start, end)
+            if selected is not None:
+                yield selected
+
+    def read(self, start=None, end=None):
+        """All columns for [start, end) in time order; a zero-copy view when one chunk covers it."""
+        parts = list(self.segments(start, end))
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in DTYPES.items()}
+        merged = {name: np.concatenate([p[name] for p in parts]) for name in DTYPES}
+        # Chunks only overlap in time when readings arrived late
+        ts = merged["timestamp"]
+        if (np.diff(ts) < 0).any():
+            order = np.lexsort((merged["id"], ts))
+            merged = {name: array[order] for name, array in merged.items()}
+        return merged
+
+    def find(self, timestamps):
+        """{timestamp: id} for those of the given timestamps (int64 us) already stored."""
+        newest = max((c.meta["max"] for c in self.chunks if c.rows), default=None)
+        if newest is None:
+            return {}
+        # Readings normally arrive newer than everything stored
+        candidates = timestamps[timestamps <= newest]
+        if not len(candidates):
+            return {}
+        lo, hi = int(candidates.min()), int(candidates.max())
+        found = {}
+        for chunk in self.chunks:
+            if not chunk.rows or chunk.meta["max"] < lo or chunk.meta["min"] > hi:
+                continue
+            view = chunk.view()
+            hits = np.isin(view["timestamp"], candidates)
+            for ts, stored_id in zip(view["timestamp"][hits].tolist(), view["id"][hits].tolist()):
+                found.setdefault(ts, stored_id)
+        return found
+
+    def count(self, start=None, end=None):
+        if start is None and end is None:
+            return sum(c.rows for c in self.chunks)
+        return sum(len(s["timestamp"]) for s in self.segments(start, end))
+
+    def last_id(self):
+        ids = [int(c.columns["id"][:c.rows].max()) for c in self.chunks if c.rows]
+        return max(ids, default=0)
+
+    def latest(self):
+        """Newest reading by (timestamp, id), or None."""
+        best = None
+        for chunk in self.chunks:
+            if not chunk.rows:
+                continue
+            if chunk.meta["sorted"]:
+                i = chunk.rows - 1
+            else:
+                view = chunk.view()
+                i = int(np.lexsort((view["id"], view["timestamp"]))[-1])
+            key = (int(chunk.columns["timestamp"][i]), int(chunk.columns["id"][i]))
+            if best is None or key > best[0]:
+                best = (key, chunk, i)
+        if best is None:
+            return None
+        _, chunk, i = best
+        return self._reading(chunk.view(i, i + 1), 0)
+
+    def closest(self, target):
+        """Reading whose timestamp is nearest target (earlier wins a tie), or None."""
+        before = self.read(None, target + 1)
+        after = self.read(target + 1, None)
+        candidates = []
+        if len(before["timestamp"]):
+            candidates.append(self._reading(before, -1))
+        if len(after["timestamp"]):
+            candidates.append(self._reading(after, 0))
+        if not candidates:
+            return None
+        target_dt = from_us([target])[0]
+        return min(candidates, key=lambda r: abs(r.timestamp - target_dt))
+
+    def _reading(self, columns, i):
+        return Reading(
+            int(columns["id"][i]), self.device_id, from_us(columns["timestamp"][i:i + 1 or None])[0],
+            *(float(columns[m][i]) for m in METRICS),
+        )
+
+    def iter_readings(self, start=None, end=None, after=None):
+        """Readings in (timestamp, id) order, strictly after the (timestamp, id) key after."""
+        if after is not None:
+            start = after[0] if start is None else max(start, after[0])
+        columns = self.read(start, end)
+        ts = columns["timestamp"]
+        skip = 0
+        if after is not None:
+            ids = columns["id"]
+            while skip < len(ts) and (ts[skip], ids[skip]) <= after:
+                skip += 1
+        # Convert block by block so a short page does not pay for the whole range
+        for lo in range(skip, len(ts), _ITER_BLOCK):
+            hi = lo + _ITER_BLOCK
+            yield from map(
+                Reading, columns["id"][lo:hi].tolist(), repeat(self.device_id), from_us(ts[lo:hi]),
+                *(columns[m][lo:hi].tolist() for m in METRICS),
+            )
+
+
+class TimeSeriesDB:
+    def __init__(self, path=TSDB_PATH, chunk_rows=None):
+        """chunk_rows defaults to TSDB_CHUNK_ROWS if set; an existing store must agree with it."""
+        if chunk_rows is None and os.getenv("TSDB_CHUNK_ROWS"):
+            chunk_rows = CHUNK_ROWS
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = {}  # device_id -> {timestamp: id} staged but not written yet
+        directories = [name for name in sorted(os.listdir(path)) if os.path.isdir(os.path.join(path, name))]
+        self.chunk_rows = self._chunk_rows(directories, chunk_rows)
+        self._series = {
+            unquote(name): DeviceSeries(os.path.join(path, name), self.chunk_rows) for name in directories
+        }
+        self._next_id = max((s.last_id() for s in self._series.values()), default=0) + 1
+
+    def _chunk_rows(self, directories, requested):
+        """The store's chunk capacity, recorded in store.json on first use."""
+        settings_path = os.path.join(self.path, "store.json")
+        stored = None
+        if os.path.exists(settings_path):
+            with open(settings_path) as f:
+                stored = json.load(f)["chunk_rows"]
+        else:
+            # A store created before store.json existed: its first chunk file has the size
+            for name in directories:
+                first = os.path.join(self.path, name, "00000.chunk")
+                if os.path.exists(first):
+                    stored = _file_capacity(first)
+                    break
+        if stored is not None and requested is not None and requested != stored:
+            raise ValueError(
+                f"{self.path} was created with TSDB_CHUNK_ROWS={stored}; it cannot be opened with {requested}"
+            )
+        chunk_rows = stored or requested or CHUNK_ROWS
+        if not os.path.exists(settings_path):
+            with open(settings_path + ".tmp", "w") as f:
+                json.dump({"chunk_rows": chunk_rows}, f)
+            os.replace(settings_path + ".tmp", settings_path)
+        return chunk_rows
+
+    def _device(self, device_id):
+        series = self._series.get(device_id)
+        if series is None:
+            directory = os.path.join(self.path, quote(device_id, safe=""))
+            os.makedirs(directory, exist_ok=True)
+            series = self._series[device_id] = DeviceSeries(directory, self.chunk_rows)
+        return series
+
+    def append(self, rows):
+        """Store reading dicts; returns their ids in input order.
+
+        Rows that carry an "id" (e.g. copied from Monitoring_Data) keep it.
+        Rows must have distinct keys. A row whose (device_id, timestamp) is
+        already stored is skipped, gets the stored id and is marked
+        row["duplicate"] = True.
+        """
+        ids, staged = self.stage(rows)
+        self.write(staged)
+        return ids
+
+    def stage(self, rows):
+        """append() in two steps: ids and duplicates now, the data on write(staged).
+
+        Staged keys count as stored for later stage() calls until the batch is
+        written or release()d, so a caller can hold the write back until its
+        own transaction commits. Returns (ids, staged).
+        """
+        with self._lock:
+            by_device = {}
+            for position, row in enumerate(rows):
+                by_device.setdefault(row["device_id"], []).append(position)
+            stamps = {}
+            stored = {}
+            for device_id, positions in by_device.items():
+                ts = np.array([rows[i]["timestamp"] for i in positions], dtype="datetime64[us]").astype(np.int64)
+                stamps[device_id] = ts
+                series = self._series.get(device_id)
+                if series is not None:
+                    for i, stored_id in _positions(positions, ts, series.find(ts)):
+                        stored[i] = stored_id
+                for i, stored_id in _positions(positions, ts, self._pending.get(device_id)):
+                    stored[i] = stored_id
+
+            ids = []
+            for position, row in enumerate(rows):
+                if position in stored:
+                    row["duplicate"] = True
+                    ids.append(stored[position])
+                    continue
+                new_id = row.get("id")
+                if new_id is None:
+                    new_id = self._next_id
+                self._next_id = max(self._next_id, new_id + 1)
+                ids.append(new_id)
+
+            staged = {}
+            for device_id, positions in by_device.items():
+                keep = np.fromiter((i not in stored for i in positions), bool, len(positions))
+                if not keep.any():
+                    continue
+                items = [(ids[i], rows[i]) for i, k in zip(positions, keep) if k]
+                columns = staged[device_id] = {
+                    "id": np.fromiter((i for i, _ in items), DTYPES["id"], len(items)),
+                    "timestamp": stamps[device_id][keep],
+                    **{m: np.fromiter((r[m] for _, r in items), DTYPES[m], len(items)) for m in METRICS},
+                }
+                self._pending.setdefault(device_id, {}).update(
+                    zip(columns["timestamp"].tolist(), columns["id"].tolist())
+                )
+            return ids, staged
+
+    def write(self, staged):
+        """Store a batch returned by stage(); flushed when this returns."""
+        with self._lock:
+            try:
+                for device_id, columns in staged.items():
+                    self._device(device_id).append(columns)
+            finally:
+                self._unstage(staged)
+
+    def release(self, staged):
+        """Forget a staged batch that will not be written."""
+        with self._lock:
+            self._unstage(staged)
+
+    def _unstage(self, staged):
+        for device_id, columns in staged.items():
+            pending = self._pending.get(device_id, {})
+            for ts in columns["timestamp"].tolist():
+                pending.pop(ts, None)
+            if not pending:
+                self._pending.pop(device_id, None)
+
+    def device_ids(self):
+        return sorted(self._series)
+
+    def series(self, device_id):
+        return self._series.get(device_id)
+
+    def read(self, device_id, start=None, end=None):
+        """Column arrays for one device and [start, end) (datetimes or None)."""
+        series = self._series.get(device_id)
+        start, end = _bounds(start, end)
+        if series is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in DTYPES.items()}
+        return series.read(start, end)
+
+    def count(self, device_id=None, start=None, end=None):
+        start, end = _bounds(start, end)
+        targets = list(self._series.values()) if device_id is None else [self._series.get(device_id)]
+        return sum(s.count(start, end) for s in targets if s is not None)
+
+    def iter_readings(self, device_id=None, start=None, end=None, after=None):
+        """Readings in (timestamp, id) order across one or all devices."""
+        start, end = _bounds(start, end)
+        if after is not None:
+            after = (to_us(after[0]), after[1])
+        if device_id is not None:
+            series = self._series.get(device_id)
+            return iter(()) if series is None else series.iter_readings(start, end, after)
+        return heapq.merge(
+            *(s.iter_readings(start, end, after) for s in list(self._series.values())),
+            key=lambda r: (r.timestamp, r.id),
+        )
+
+    def latest(self, device_id=None):
+        targets = list(self._series.values()) if device_id is None else [self._series.get(device_id)]
+        return [r for r in (s.latest() for s in targets if s is not None) if r is not None]
+
+    def closest(self, target):
+        """{device_id: reading nearest target} for every device."""
+        target = to_us(target)
+        return {device_id: s.closest(target) for device_id, s in list(self._series.items())}
+
+    def stats(self):
+        series = list(self._series.values())
+        chunks = sum(len(s.chunks) for s in series)
+        return {
+            "path": os.path.abspath(self.path),
+            "devices": len(series),
+            "chunks": chunks,
+            "chunk_rows": self.chunk_rows,
+            "rows": self.count(),
+            "unsorted_chunks": sum(1 for s in series for c in s.chunks if not c.meta["sorted"]),
+            # Allocated blocks: chunk files are sparse until filled
+            "bytes_on_disk": sum(
+                os.stat(os.path.join(root, f)).st_blocks * 512 for root, _, files in os.walk(self.path) for f in files
+            ),
+        }
+
+
+def _positions(positions, timestamps, found):
+    """(row position, stored id) for the rows whose timestamp is in found."""
+    if not found:
+        return []
+    return [(i, found[ts]) for i, ts in zip(positions, timestamps.tolist()) if ts in found]
+
+
+def _bounds(start, end):
+    return (None if start is None else to_us(start)), (None if end is None else to_us(end))
+
+
+def import_sql(db_path=TSDB_PATH, chunk_size=10000):
+    """Copy every Monitoring_Data row (ids kept) into the store at db_path."""
+    import pagination
+
+    store = TimeSeriesDB(db_path)
+    if store.count():
+        raise SystemExit(f"{db_path} already holds readings; import into an empty store")
+    copied = 0
+    query = pagination.keyset_query()
+    for chunk in pagination.iter_rows(query, archived_rows=pagination.archived()):
+        store.append([r._asdict() for r in chunk])
+        copied += len(chunk)
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedded time-series store for readings")
+    parser.add_argument("command", choices=("import", "stats"))
+    parser.add_argument("--path", default=TSDB_PATH)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        print(f"Copied {import_sql(args.path)} readings into {args.path}")
+    else:
+        print(json.dumps(TimeSeriesDB(args.path).stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
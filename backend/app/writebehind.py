@@ -0,0 +1,202 @@
+"""Group commit for single-reading ingest (POST /data).
+
+With INGEST_MODE=buffered or durable, POST /data does not commit on its
+own: the validated row is queued and a writer thread stores everything
+queued so far with one insert_readings() call (one transaction) every
+INGEST_FLUSH_MS, or sooner once INGEST_FLUSH_ROWS rows are waiting.
+
+- buffered: the request returns 202 as soon as the row is queued. A crash
+  loses what was queued but not yet flushed (at most one flush interval).
+- durable: the request waits for the flush that stores its row and then
+  returns as in direct mode, so a 200 still means committed.
+
+The queue holds at most INGEST_QUEUE_SIZE rows; submit() raises QueueFull
+beyond that and the endpoint answers 429. stop() flushes what is queued, so
+a graceful shutdown loses nothing.
+
+A flush that fails is retried in halves, down to single readings, so one
+bad reading fails only its own future and the rest of its group is still
+stored. Readings that could not be stored are counted in `lost`: in
+buffered mode nobody is waiting for them any more.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from database import SessionLocal
+import ingest
+
+INGEST_MODE = os.getenv("INGEST_MODE", "direct").lower()
+FLUSH_MS = float(os.getenv("INGEST_FLUSH_MS", "50"))
+FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "500"))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+
+if INGEST_MODE not in ("direct", "buffered", "durable"):
+    raise ValueError(f"INGEST_MODE must be direct, buffered or durable, not {INGEST_MODE!r}")
+
+logger = logging.getLogger("water_monitoring.writebehind")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_ms=FLUSH_MS, flush_rows=FLUSH_ROWS, max_rows=QUEUE_SIZE):
+        self.flush_interval = flush_ms / 1000
+        self.flush_rows = flush_rows
+        self.max_rows = max_rows
+        self._cond = threading.Condition()
+        self._queue = deque()  # (row, future)
+        self._thread = None
+        self._stopping = False
+        self.accepted = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_rows = 0
+        self.split_flushes = 0
+        self.abandoned_rows = 0
+        self.largest_flush = 0
+        self.flush_seconds = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        """Queue row; the returned Future resolves to its id once committed."""
+        if self._thread is None:
+            self.start()
+        future = Future()
+        with self._cond:
+            if self._stopping:
+                raise QueueFull("shutting down")
+            if len(self._queue) >= self.max_rows:
+                self.rejected += 1
+                raise QueueFull(f"ingest queue is full ({self.max_rows} readings)")
+            self._queue.append((row, future))
+            self.accepted += 1
+            if len(self._queue) == 1 or len(self._queue) >= self.flush_rows:
+                self._cond.notify()
+        return future
+
+    def _take(self):
+        """Wait for the next batch; None once stopped and drained."""
+        with self._cond:
+            deadline = None
+            while True:
+                if len(self._queue) >= self.flush_rows or (self._stopping and self._queue):
+                    break
+                if self._stopping:
+                    return None
+                if self._queue:
+                    # The interval runs from the first row waiting, so a
+                    # lone reading is not held longer than INGEST_FLUSH_MS
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+            return [self._queue.popleft() for _ in range(min(self.flush_rows, len(self._queue)))]
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            ids = self._insert([row for row, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                self.failed_rows += 1
+                logger.exception("reading from %s could not be stored", batch[0][0].get("device_id"))
+                batch[0][1].set_exception(e)
+                return
+            # Find the reading(s) at fault instead of failing the whole group
+            logger.warning("group commit of %d readings failed (%s); retrying in halves", len(batch), e)
+            self.split_flushes += 1
+            middle = len(batch) // 2
+            self._flush(batch[:middle])
+            self._flush(batch[middle:])
+            return
+
+        elapsed = time.perf_counter() - started
+        self.flushes += 1
+        self.flushed_rows += len(batch)
+        self.largest_flush = max(self.largest_flush, len(batch))
+        self.flush_seconds += elapsed
+        for (_, future), new_id in zip(batch, ids):
+            future.set_result(new_id)
+
+    def _insert(self, rows):
+        """insert_readings() on copies, so a failed attempt leaves rows as submitted.
+
+        insert_readings() fills in ids and duplicate flags and calibrates
+        values in place; a retry must start from the reading as received.
+        """
+        attempt = [dict(row) for row in rows]
+        db = SessionLocal()
+        try:
+            ids = ingest.insert_readings(db, attempt)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        for row, stored in zip(rows, attempt):
+            row.update(stored)
+        return ids
+
+    def stop(self, timeout=30):
+        """Flush everything queued and stop the writer thread."""
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                with self._cond:
+                    self.abandoned_rows = len(self._queue)
+                logger.error("ingest writer did not finish within %ss; %d readings not stored",
+                             timeout, self.abandoned_rows)
+        with self._cond:
+            self._thread = None
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._queue)
+        return {
+            "mode": INGEST_MODE,
+            "queued": queued,
+            "max_rows": self.max_rows,
+            "flush_ms": self.flush_interval * 1000,
+            "flush_rows": self.flush_rows,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_rows": self.failed_rows,
+            "split_flushes": self.split_flushes,
+            "lost": self.failed_rows + self.abandoned_rows,
+            "largest_flush": self.largest_flush,
+            "mean_flush_rows": round(self.flushed_rows / self.flushes, 1) if self.flushes else None,
+            "mean_flush_ms": round(self.flush_seconds / self.flushes * 1000, 3) if self.flushes else None,
+        }
+
+
+write_buffer = WriteBehindBuffer()
@@ -0,0 +1,128 @@
+"""Shared helpers for the benchmark scripts in this directory.
+
+The app modules read DATABASE_URL when they are imported, so every script
+calls use_database() before importing anything from backend/app.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "app")
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def use_database(url):
+    """Point the app at url and make its flat imports resolvable."""
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+
+
+def start_server(env, port, label):
+    """Run the app under uvicorn with env on top of os.environ; waits until it answers."""
+    import httpx
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=APP_DIR, env={**os.environ, "LOG_LEVEL": "WARNING", **env},
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"server for {label} exited with {server.returncode}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1).raise_for_status()
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f"server for {label} did not start")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def summarize(samples):
+    """Timing summary in milliseconds for a list of durations in seconds."""
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def pct(p):
+        return round(ordered[min(int(n * p), n - 1)] * 1000, 3)
+
+    return {
+        "n": n,
+        "min_ms": round(ordered[0] * 1000, 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "mean_ms": round(sum(ordered) / n * 1000, 3),
+    }
+
+
+def timed(fn, repeat, warmup=2):
+    """Call fn warmup + repeat times; returns (summary, last result)."""
+    result = None
+    for _ in range(warmup):
+        result = fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples), result
+
+
+def write_results(results, name, output=None):
+    """Save results as JSON; defaults to results/<name>-<revision>.json."""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{results['revision']}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    return output
+
+
+def compare(baseline_path, results, threshold):
+    """Print p50 changes against a saved baseline; returns the regressed case names."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressed = []
+    print(f"\n{'case':<40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results["cases"].items():
+        before = baseline.get("cases", {}).get(name)
+        if before is None:
+            print(f"{name:<40} {'-':>10} {current['p50_ms']:>10.2f}      new")
+            continue
+        change = (current["p50_ms"] - before["p50_ms"]) / before["p50_ms"] if before["p50_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed.append(name)
+        if before.get("plans") is not None and before.get("plans") != current.get("plans"):
+            flag += "  PLAN CHANGED"
+        print(f"{name:<40} {before['p50_ms']:>10.2f} {current['p50_ms']:>10.2f} {change:>+8.0%}{flag}")
+    return regressed
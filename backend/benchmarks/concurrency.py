@@ -0,0 +1,186 @@
+"""Concurrency benchmark: read latency while ingest is writing.
+
+Starts the app under uvicorn once per database mode, against a copy of a
+seeded database, and drives it from one asyncio client. Each run has two
+phases of --duration seconds: readers alone, then readers plus writers
+posting /data/batch. If reads stall behind writes, the second phase shows
+it as a jump in read latency.
+
+    python concurrency.py --devices 5 --days 10 --interval 60
+    python concurrency.py --modes wal,wal-async --writers 8 --readers 16
+
+Modes:
+- delete: SQLite's defaults (rollback journal, synchronous=FULL), sync sessions
+- wal: WAL journal, synchronous=NORMAL, sync sessions in the threadpool
+- wal-async: as wal, with DB_ASYNC=1 (aiosqlite, needs the driver installed)
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import httpx
+
+import common
+from common import environment, git_revision, summarize, write_results
+import seed
+
+MODES = {
+    "delete": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "DB_ASYNC": "0"},
+    "wal": {"SQLITE_JOURNAL_MODE": "WAL", "SQLITE_SYNCHRONOUS": "NORMAL", "DB_ASYNC": "0"},
+    "wal-async": {"SQLITE_JOURNAL_MODE": "WAL", "SQLITE_SYNCHRONOUS": "NORMAL", "DB_ASYNC": "1"},
+}
+
+READ_PATHS = [
+    "/history/device_001?limit=100",
+    "/alerts?limit=50",
+    "/data/latest",
+]
+
+
+def start_server(path, mode, port):
+    env = {**MODES[mode], "DATABASE_URL": seed.sqlite_url(path)}
+    return common.start_server(env, port, f"mode {mode}")
+
+
+async def reader(client, path, pause, until, samples, errors):
+    # Paced rather than back to back, like dashboards polling: latency then
+    # reflects waiting on the database, not a queue of our own requests
+    while time.monotonic() < until:
+        started = time.perf_counter()
+        try:
+            (await client.get(path)).raise_for_status()
+            samples.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            errors.append(path)
+        await asyncio.sleep(pause)
+
+
+async def writer(client, number, devices, batch_size, pause, until, samples, counts, errors):
+    # New readings start after the seeded range, one clock per writer
+    at = seed.SEED_END + timedelta(days=number)
+    next_batch = time.monotonic()
+    while time.monotonic() < until:
+        # A fixed schedule, so a slow write does not lower the offered load
+        await asyncio.sleep(max(0.0, next_batch - time.monotonic()))
+        next_batch += pause
+        batch = []
+        for i in range(batch_size):
+            at += timedelta(seconds=1)
+            batch.append({
+                "device_id": f"device_{i % devices + 1:03d}",
+                "timestamp": at.isoformat(),
+                "ph_value": 7.2, "tds_value": 300.0, "temperature": 21.5,
+            })
+        started = time.perf_counter()
+        try:
+            response = await client.post("/data/batch", json=batch)
+            response.raise_for_status()
+            samples.append(time.perf_counter() - started)
+            counts.append(response.json()["saved"])
+        except httpx.HTTPError:
+            errors.append("/data/batch")
+
+
+async def phase(base_url, args, devices, with_writers):
+    until = time.monotonic() + args.duration
+    reads = {path: [] for path in READ_PATHS}
+    writes, saved, errors = [], [], []
+    limits = httpx.Limits(max_connections=args.readers + args.writers)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        tasks = []
+        for i in range(args.readers):
+            path = READ_PATHS[i % len(READ_PATHS)]
+            tasks.append(reader(client, path, args.read_pause, until, reads[path], errors))
+        if with_writers:
+            pause = args.writers * args.batch_size / args.write_rate
+            tasks += [writer(client, n, devices, args.batch_size, pause, until, writes, saved, errors)
+                      for n in range(args.writers)]
+        started = time.monotonic()
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    result = {
+        "reads": {path: summarize(samples) for path, samples in reads.items() if samples},
+        "all_reads": summarize([s for samples in reads.values() for s in samples]),
+        "errors": len(errors),
+    }
+    if with_writers:
+        result["writes"] = summarize(writes) if writes else None
+        result["rows_per_second"] = round(sum(saved) / elapsed, 1)
+    return result
+
+
+def run_mode(source, mode, args, devices, port):
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "concurrency.db")
+        shutil.copy(source, path)
+        # The journal mode is stored in the file: set it before the server opens it
+        with sqlite3.connect(path) as conn:
+            conn.execute(f"PRAGMA journal_mode={MODES[mode]['SQLITE_JOURNAL_MODE']}")
+
+        server = start_server(path, mode, port)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            return {
+                "reads_only": asyncio.run(phase(base_url, args, devices, with_writers=False)),
+                "reads_and_writes": asyncio.run(phase(base_url, args, devices, with_writers=True)),
+            }
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark read latency under concurrent ingest")
+    seed.add_arguments(parser)
+    parser.add_argument("--modes", default="delete,wal,wal-async", help="comma-separated, see the module docstring")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--read-pause", type=float, default=0.05, help="seconds each reader waits between requests")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--write-rate", type=float, default=1000, help="rows per second offered by all writers")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="results file (default: results/concurrency-<revision>.json)")
+    args = parser.parse_args()
+
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(sorted(unknown))}")
+    if args.storage != "sql" or args.database_url:
+        parser.error("the concurrency benchmark runs against a seeded SQLite file (--storage sql)")
+
+    url = seed.resolve_url(args)
+    data_set = seed.seed(url, args.devices, args.days, args.interval, args.seed)
+    source = seed.default_path(args.devices, args.days, args.interval)
+
+    results = {
+        "benchmark": "concurrency",
+        "revision": git_revision(),
+        "environment": environment(),
+        "data_set": data_set,
+        "load": {"duration_s": args.duration, "readers": args.readers, "read_pause_s": args.read_pause,
+                 "writers": args.writers, "batch_size": args.batch_size, "write_rate": args.write_rate},
+        "modes": {},
+    }
+    print(f"{'mode':<10} {'phase':<17} {'read p50':>9} {'read p95':>9} {'read max':>9} {'rows/s':>9} {'errors':>7}")
+    for mode in modes:
+        outcome = run_mode(source, mode, args, args.devices, args.port)
+        results["modes"][mode] = outcome
+        for name, result in outcome.items():
+            reads = result["all_reads"]
+            print(f"{mode:<10} {name:<17} {reads['p50_ms']:>9.2f} {reads['p95_ms']:>9.2f} {reads['max_ms']:>9.2f} "
+                  f"{result.get('rows_per_second', 0):>9} {result['errors']:>7}")
+    print(f"Results written to {write_results(results, 'concurrency', args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Ingest benchmark: POST /data throughput with and without group commit.
+
+Starts the app under uvicorn once per INGEST_MODE, against a copy of a
+seeded database, and has --clients concurrent clients post one reading per
+request, back to back, for --duration seconds. The server is then stopped
+gracefully (which flushes the write-behind queue) and the rows that reached
+the database are counted.
+
+    python ingest_modes.py --devices 5 --days 1 --interval 60
+    python ingest_modes.py --modes direct,durable --clients 64 --flush-ms 20
+
+Modes:
+- direct: one transaction per request (the default)
+- buffered: 202 once queued, group-committed every --flush-ms / --flush-rows
+- durable: as buffered, but the response waits for the group commit
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import httpx
+
+import common
+from common import environment, git_revision, summarize, write_results
+import seed
+
+MODES = ("direct", "buffered", "durable")
+
+
+async def client(http, number, devices, until, samples, statuses):
+    # New readings start after the seeded range, one clock per client
+    at = seed.SEED_END + timedelta(days=number)
+    i = 0
+    while time.monotonic() < until:
+        at += timedelta(seconds=1)
+        reading = {
+            "device_id": f"device_{(number + i) % devices + 1:03d}",
+            "timestamp": at.isoformat(),
+            "ph_value": 7.2, "tds_value": 300.0, "temperature": 21.5,
+        }
+        i += 1
+        started = time.perf_counter()
+        try:
+            response = await http.post("/data", json=reading)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code in (200, 202):
+                samples.append(time.perf_counter() - started)
+            elif response.status_code == 429:
+                await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+        except httpx.HTTPError:
+            statuses["error"] = statuses.get("error", 0) + 1
+
+
+async def load(base_url, args, devices):
+    samples, statuses = [], {}
+    limits = httpx.Limits(max_connections=args.clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        started = time.monotonic()
+        until = started + args.duration
+        await asyncio.gather(*(client(http, n, devices, until, samples, statuses) for n in range(args.clients)))
+        elapsed = time.monotonic() - started
+        stats = (await http.get("/ingest/stats")).json()["write_buffer"]
+    return samples, statuses, elapsed, stats
+
+
+def count_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT COUNT(*) FROM "Monitoring_Data"').fetchone()[0]
+
+
+def run_mode(source, mode, args, port):
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "ingest.db")
+        shutil.copy(source, path)
+        before = count_rows(path)
+
+        env = {
+            "DATABASE_URL": seed.sqlite_url(path),
+            "INGEST_MODE": mode,
+            "INGEST_FLUSH_MS": str(args.flush_ms),
+            "INGEST_FLUSH_ROWS": str(args.flush_rows),
+            "INGEST_QUEUE_SIZE": str(args.queue_size),
+        }
+        server = common.start_server(env, port, f"mode {mode}")
+        try:
+            samples, statuses, elapsed, stats = asyncio.run(load(f"http://127.0.0.1:{port}", args, args.devices))
+        finally:
+            # SIGTERM is a graceful shutdown: queued readings are flushed first
+            server.terminate()
+            server.wait()
+        stored = count_rows(path) - before
+
+    accepted = statuses.get(200, 0) + statuses.get(202, 0)
+    return {
+        "requests_per_second": round(accepted / elapsed, 1),
+        "stored_per_second": round(stored / elapsed, 1),
+        "accepted": accepted,
+        "stored": stored,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "latency": summarize(samples) if samples else None,
+        "write_buffer": stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark POST /data per-request commit against group commit")
+    seed.add_arguments(parser)
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated, see the module docstring")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--flush-ms", type=float, default=50)
+    parser.add_argument("--flush-rows", type=int, default=500)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", help="results file (default: results/ingest_modes-<revision>.json)")
+    args = parser.parse_args()
+
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(sorted(unknown))}")
+    if args.storage != "sql" or args.database_url:
+        parser.error("the ingest benchmark runs against a seeded SQLite file (--storage sql)")
+
+    url = seed.resolve_url(args)
+    data_set = seed.seed(url, args.devices, args.days, args.interval, args.seed)
+    source = seed.default_path(args.devices, args.days, args.interval)
+
+    results = {
+        "benchmark": "ingest_modes",
+        "revision": git_revision(),
+        "environment": environment(),
+        "data_set": data_set,
+        "load": {"duration_s": args.duration, "clients": args.clients, "flush_ms": args.flush_ms,
+                 "flush_rows": args.flush_rows, "queue_size": args.queue_size},
+        "modes": {},
+    }
+    print(f"{'mode':<9} {'req/s':>9} {'stored/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'rows/flush':>11} {'429s':>6}")
+    for mode in modes:
+        result = run_mode(source, mode, args, args.port)
+        results["modes"][mode] = result
+        latency = result["latency"] or {"p50_ms": 0, "p95_ms": 0}
+        per_flush = result["write_buffer"]["mean_flush_rows"] or 1
+        print(f"{mode:<9} {result['requests_per_second']:>9} {result['stored_per_second']:>9} "
+              f"{latency['p50_ms']:>8.2f} {latency['p95_ms']:>8.2f} {per_flush:>11} "
+              f"{result['statuses'].get('429', 0):>6}")
+    print(f"Results written to {write_results(results, 'ingest_modes', args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Parse benchmark: JSON readings versus binary frames.
+
+Times the two places a reading is decoded, for both formats:
+
+- gateway: one serial message -> upload payload (esp32_reader / frames.FrameDecoder)
+- backend: one /data/batch body -> insertable rows (ingest.parse_items / parse_frames)
+
+    python parse.py --readings 5000
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from common import environment, git_revision, summarize, use_database, write_results
+
+
+def sample_readings(n):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "device_id": f"device_{i % 20 + 1:03d}",
+            "seq": i,
+            "timestamp": start + timedelta(seconds=i),
+            "ph_value": round(7 + (i % 50) / 100, 2),
+            "tds_value": round(300 + (i % 200) / 10, 1),
+            "temperature": round(20 + (i % 80) / 10, 1),
+        }
+        for i in range(n)
+    ]
+
+
+def best_of(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and binary frame parsing")
+    parser.add_argument("--readings", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="results file (default: results/parse-<revision>.json)")
+    args = parser.parse_args()
+
+    # The backend modules import database, which wants a URL even though nothing is queried
+    use_database("sqlite://")
+    import esp32_reader
+    import frames
+    import ingest
+
+    readings = sample_readings(args.readings)
+    json_lines = [
+        (json.dumps({k: r[k] for k in ("device_id", "ph_value", "tds_value", "temperature")}) + "\n").encode()
+        for r in readings
+    ]
+    frame_stream = [
+        frames.pack(r["device_id"], r["seq"], int(r["timestamp"].timestamp() * 1000),
+                    r["ph_value"], r["tds_value"], r["temperature"])
+        for r in readings
+    ]
+    json_body = json.dumps([{**r, "timestamp": r["timestamp"].isoformat()} for r in readings]).encode()
+    frames_body = b"".join(frame_stream)
+
+    def gateway_json():
+        decoder = frames.FrameDecoder()
+        now = datetime.now().astimezone()
+        for line in json_lines:
+            for _, raw in decoder.feed(line):
+                data, _ = esp32_reader.parse_line(raw)
+                esp32_reader.to_payload(data["device_id"], data, now)
+
+    def gateway_frames():
+        decoder = frames.FrameDecoder()
+        for frame in frame_stream:
+            decoder.feed(frame)
+
+    def backend_json():
+        ingest.parse_items(json.loads(json_body))
+
+    def backend_frames():
+        ingest.parse_frames(frames_body)
+
+    cases = {
+        "gateway_json": (gateway_json, sum(map(len, json_lines))),
+        "gateway_frames": (gateway_frames, len(frames_body)),
+        "backend_json": (backend_json, len(json_body)),
+        "backend_frames": (backend_frames, len(frames_body)),
+    }
+    results = {
+        "benchmark": "parse",
+        "revision": git_revision(),
+        "environment": environment(),
+        "readings": args.readings,
+        "cases": {},
+    }
+    for name, (fn, size) in cases.items():
+        summary = best_of(fn, args.repeat)
+        summary["bytes"] = size
+        summary["bytes_per_reading"] = round(size / args.readings, 1)
+        summary["us_per_reading"] = round(summary["p50_ms"] * 1000 / args.readings, 3)
+        results["cases"][name] = summary
+        print(f"{name:<16} {summary['us_per_reading']:>8.2f} us/reading  "
+              f"{summary['bytes_per_reading']:>6.1f} bytes/reading")
+
+    for side in ("gateway", "backend"):
+        speedup = results["cases"][f"{side}_json"]["p50_ms"] / results["cases"][f"{side}_frames"]["p50_ms"]
+        results[f"{side}_speedup"] = round(speedup, 2)
+        print(f"{side}: frames parse {speedup:.1f}x faster than JSON")
+
+    print(f"Results written to {write_results(results, 'parse', args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
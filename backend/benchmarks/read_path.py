@@ -0,0 +1,147 @@
+"""Read-path benchmark: time the query endpoints in-process against a seeded database.
+
+Each case is a request sent through the ASGI app with TestClient, so
+routing, validation, the ORM and JSON encoding are all measured, with no
+network in between. Results (timings plus the query plan of every SELECT
+a case issues) are written as JSON so runs can be compared across commits:
+
+    python read_path.py --devices 20 --days 30 --interval 60
+    python read_path.py --compare results/read_path-abc1234.json
+"""
+import argparse
+import os
+import sys
+from datetime import timedelta
+
+from common import compare, environment, git_revision, timed, write_results
+import seed
+
+
+def cases(days):
+    """(name, path) pairs; device_001 exists in every seeded data set."""
+    last_day = seed.SEED_END - timedelta(days=1)
+    week_ago = seed.SEED_END - timedelta(days=min(days, 7))
+    day = last_day.strftime("%Y-%m-%d")
+    return [
+        ("data_latest", "/data/latest"),
+        ("monitoring_list", "/monitoring/list"),
+        ("monitoring_data_device", "/monitoring_data/device_001"),
+        ("devices", "/devices"),
+        ("metrics_derived", "/metrics/derived"),
+        ("history_page_1000", "/history/device_001?limit=1000"),
+        ("history_page_10000", "/history/device_001?limit=10000"),
+        ("history_page_10000_columnar", "/history/device_001?limit=10000&format=columnar"),
+        ("history_last_day_raw", f"/history/device_001?from={last_day.isoformat()}&to={seed.SEED_END.isoformat()}"),
+        ("history_week_500_points", f"/history/device_001?max_points=500&from={week_ago.isoformat()}&to={seed.SEED_END.isoformat()}"),
+        ("history_all_1d", "/history/device_001?resolution=1d"),
+        ("chart_day", f"/monitoring_data/device_001/chart?date={day}"),
+        ("chart_day_300_points", f"/monitoring_data/device_001/chart?date={day}&max_points=300"),
+        ("data_page_1000", "/data?limit=1000"),
+        ("data_page_1000_columnar", "/data?limit=1000&format=columnar"),
+    ]
+
+
+class StatementLog:
+    """Collects the SQL a request executes, to explain it afterwards."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.statements = []
+        self.active = False
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            self.statements.append((statement, parameters))
+
+    def capture(self, fn):
+        self.statements = []
+        self.active = True
+        try:
+            fn()
+        finally:
+            self.active = False
+        return self.statements
+
+
+def explain(engine, statements):
+    """Query plan for each distinct statement, as lists of plan lines."""
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    plans = []
+    seen = set()
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+            lines = [str(row[-1]) for row in rows]
+            plans.append({"sql": " ".join(statement.split()), "plan": lines})
+    return plans
+
+
+def run(url, data_set, repeat):
+    seed.seed(url, **data_set)
+
+    from fastapi.testclient import TestClient
+
+    import main
+    from database import engine
+
+    # Entering the client runs the app lifespan (migrations, cache warm-up)
+    with TestClient(main.app) as client:
+        log = StatementLog(engine)
+        results = {
+            "benchmark": "read_path",
+            "revision": git_revision(),
+            "environment": environment(),
+            "database": engine.dialect.name,
+            "storage": os.environ.get("STORAGE_BACKEND", "sql"),
+            "data_set": data_set,
+            "cases": {},
+        }
+
+        for name, path in cases(data_set["days"]):
+            def request():
+                response = client.get(path)
+                response.raise_for_status()
+                return response
+
+            statements = log.capture(request)
+            summary, response = timed(request, repeat)
+            summary["bytes"] = len(response.content)
+            # After Content-Encoding (TestClient offers gzip like a browser does)
+            summary["wire_bytes"] = response.num_bytes_downloaded
+            summary["path"] = path
+            summary["plans"] = explain(engine, statements)
+            results["cases"][name] = summary
+            print(f"{name:<28} p50 {summary['p50_ms']:>9.2f} ms  p95 {summary['p95_ms']:>9.2f} ms  "
+                  f"{summary['bytes']:>9} bytes  {summary['wire_bytes']:>9} on the wire  {len(statements)} queries")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the read endpoints")
+    seed.add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=20, help="timed requests per case")
+    parser.add_argument("--output", help="results file (default: results/read_path-<revision>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a saved results file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="p50 slowdown reported as a regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    data_set = {"devices": args.devices, "days": args.days, "interval": args.interval, "seed_value": args.seed}
+    results = run(seed.resolve_url(args), data_set, args.repeat)
+    print(f"Results written to {write_results(results, 'read_path', args.output)}")
+
+    if args.compare:
+        regressed = compare(args.compare, results, args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} regression(s): {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Recalibration benchmark: rewrite stored readings under a new calibration profile.
+
+Against a copy of a seeded database, adds one profile per device covering
+every reading and times a reprocess job over all of them (rewrite plus
+rollup rebuild), then the same job again (every reading already matches,
+so it only scans), and on its own the rollup rebuild the first job ran.
+
+    python recalibrate.py --devices 1 --days 365 --interval 60     # a year of one device, ~526k rows
+    python recalibrate.py --devices 5 --days 10 --chunk-size 10000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from common import environment, git_revision, use_database, write_results
+import seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recalibrating stored readings")
+    seed.add_arguments(parser)
+    parser.set_defaults(devices=1, days=365)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--output", help="results file (default: results/recalibrate-<revision>.json)")
+    args = parser.parse_args()
+    if args.storage != "sql" or args.database_url:
+        parser.error("the recalibration benchmark runs against a seeded SQLite file (--storage sql)")
+
+    url = seed.resolve_url(args)
+    data_set = seed.seed(url, args.devices, args.days, args.interval, args.seed)
+    source = seed.default_path(args.devices, args.days, args.interval)
+
+    results = {
+        "benchmark": "recalibrate",
+        "revision": git_revision(),
+        "environment": environment(),
+        "data_set": data_set,
+        "chunk_size": args.chunk_size,
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "recalibrate.db")
+        shutil.copy(source, path)
+        use_database(seed.sqlite_url(path))
+        import migrations
+        from database import SessionLocal, engine
+        import calibration
+        import rollups
+
+        migrations.upgrade(engine)  # the seeded file may predate the calibration tables
+        start = seed.SEED_END.replace(year=seed.SEED_END.year - 10)
+        with SessionLocal() as db:
+            for d in range(args.devices):
+                calibration.create_profile(db, f"device_{d + 1:03d}", start, ph_v7=2.61, ph_slope=0.171,
+                                           tds_factor=1.08, tds_temp_coefficient=0.02, note="benchmark")
+
+        for case in ("rewrite", "rerun"):
+            with SessionLocal() as db:
+                job_id = calibration.create_job(db)
+            started = time.perf_counter()
+            item = calibration.run_job(job_id, args.chunk_size)
+            elapsed = time.perf_counter() - started
+            results["cases"][case] = {
+                "rows_scanned": item["rows_scanned"],
+                "rows_updated": item["rows_updated"],
+                "seconds": round(elapsed, 2),
+                "rows_per_second": round(item["rows_scanned"] / elapsed),
+            }
+
+        with SessionLocal() as db:
+            rows = data_set["rows"]
+            started = time.perf_counter()
+            rollups.rebuild(db)
+            elapsed = time.perf_counter() - started
+        results["cases"]["rollups_only"] = {"rows_scanned": rows, "rows_updated": 0, "seconds": round(elapsed, 2),
+                                            "rows_per_second": round(rows / elapsed)}
+
+    print(f"{'case':<13} {'scanned':>9} {'rewritten':>10} {'seconds':>8} {'rows/s':>9}")
+    for name, case in results["cases"].items():
+        print(f"{name:<13} {case['rows_scanned']:>9} {case['rows_updated']:>10} {case['seconds']:>8} "
+              f"{case['rows_per_second']:>9}")
+    print(f"Results written to {write_results(results, 'recalibrate', args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
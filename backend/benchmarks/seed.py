@@ -0,0 +1,140 @@
+"""Seed a database with synthetic readings for benchmarking.
+
+Rows go through the same devices registry and rollup maintenance as the
+ingest path, so the seeded database looks like one that grew naturally.
+The same arguments always produce the same rows.
+
+    python seed.py --devices 20 --days 30 --interval 60     # ~864k rows
+    python seed.py --database-url postgresql://... --devices 50 --days 30
+"""
+import argparse
+import json
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from common import DATA_DIR, use_database
+
+CHUNK_SIZE = 20000
+# Data sets end here rather than "now" so reruns produce identical rows
+SEED_END = datetime(2026, 1, 1)
+
+
+def default_path(devices, days, interval, storage="sql"):
+    suffix = "" if storage == "sql" else f"_{storage}"
+    return os.path.join(DATA_DIR, f"bench_{devices}x{days}d_{interval}s{suffix}.db")
+
+
+def sqlite_url(path):
+    return f"sqlite:///{os.path.abspath(path)}"
+
+
+def expected_rows(devices, days, interval):
+    return devices * int(days * 86400 // interval)
+
+
+def generate(devices, days, interval, seed=0, end=SEED_END):
+    """Yield reading dicts device by device, oldest first, ending just before end."""
+    rng = random.Random(seed)
+    start = end - timedelta(days=days)
+    per_device = int(days * 86400 // interval)
+
+    for d in range(devices):
+        device_id = f"device_{d + 1:03d}"
+        ph_base, tds_base, temp_base = rng.uniform(6.8, 7.8), rng.uniform(150, 600), rng.uniform(18, 26)
+        for i in range(per_device):
+            ts = start + timedelta(seconds=i * interval)
+            day = math.sin(2 * math.pi * (ts.hour + ts.minute / 60 - 9) / 24)
+            yield {
+                "device_id": device_id,
+                "timestamp": ts,
+                "ph_value": round(ph_base + 0.3 * day + rng.gauss(0, 0.03), 2),
+                "tds_value": round(tds_base - 15 * day + rng.gauss(0, 3), 1),
+                "temperature": round(temp_base + 4 * day + rng.gauss(0, 0.2), 1),
+            }
+
+
+def seed(url, devices, days, interval, seed_value=0):
+    """Create the schema at url and fill it unless it already holds this data set.
+
+    Returns a description of the data set.
+    """
+    use_database(url)
+    import migrations
+    from database import SessionLocal, engine
+    from storage import store
+
+    migrations.upgrade(engine)
+    expected = expected_rows(devices, days, interval)
+    info = {"devices": devices, "days": days, "interval_s": interval, "seed": seed_value, "rows": expected}
+
+    with SessionLocal() as db:
+        existing = store.count(db)
+        if existing == expected:
+            return info
+        if existing:
+            raise SystemExit(
+                f"{url} already holds {existing} readings (expected {expected}); "
+                "seed into an empty database"
+            )
+
+        started = time.perf_counter()
+        chunk = []
+        for row in generate(devices, days, interval, seed_value):
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                _write(db, chunk)
+                chunk = []
+        _write(db, chunk)
+        info["seed_seconds"] = round(time.perf_counter() - started, 1)
+    return info
+
+
+def _write(db, chunk):
+    """Insert one chunk plus its registry and rollup updates, like the ingest path."""
+    import devices
+    import rollups
+    from storage import store
+
+    if not chunk:
+        return
+    store.append(db, chunk)
+    devices.record(db, chunk)
+    rollups.apply(db, chunk)
+    db.commit()
+
+
+def add_arguments(parser):
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=int, default=60, help="seconds between readings per device")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="seed this database instead of a SQLite file under data/")
+    parser.add_argument("--storage", choices=("sql", "tsdb"), default=os.getenv("STORAGE_BACKEND", "sql"),
+                        help="storage backend for the readings (tsdb keeps them next to the database file)")
+
+
+def resolve_url(args):
+    """Database URL for the arguments; also selects the storage backend the app will use."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = default_path(args.devices, args.days, args.interval, args.storage)
+    os.environ["STORAGE_BACKEND"] = args.storage
+    if args.storage == "tsdb":
+        os.environ.setdefault("TSDB_PATH", os.path.splitext(path)[0])
+    if args.database_url:
+        return args.database_url
+    return sqlite_url(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a benchmark database")
+    add_arguments(parser)
+    args = parser.parse_args()
+    url = resolve_url(args)
+    print(json.dumps({"url": url, **seed(url, args.devices, args.days, args.interval, args.seed)}))
+
+
+if __name__ == "__main__":
+    main()
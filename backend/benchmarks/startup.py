@@ -0,0 +1,104 @@
+"""Startup benchmark: import time and time to first request.
+
+Measures, against a copy of a seeded (and migrated) database:
+- import: `import main` in a fresh interpreter, timed inside the child
+- first_request: from launching the server until GET / answers, and then
+  the first GET /data/latest (the first request that needs the database)
+
+One worker runs `uvicorn main:app`; more run `manage.py serve --workers N`.
+
+    python startup.py --devices 5 --days 10 --interval 60
+    python startup.py --workers 1,4 --repeat 10
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from common import APP_DIR, environment, git_revision, summarize, write_results
+import seed
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def time_import(env):
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=APP_DIR, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def time_first_request(env, workers, port):
+    if workers == 1:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "manage.py", "serve", "--port", str(port), "--workers", str(workers)]
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if server.poll() is not None:
+                raise SystemExit(f"server exited with {server.returncode}")
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                time.sleep(0.01)
+            if time.perf_counter() - started > 60:
+                raise SystemExit("server did not start")
+        ready = time.perf_counter() - started
+        httpx.get(f"http://127.0.0.1:{port}/data/latest", timeout=10).raise_for_status()
+        first_data = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+    return ready, first_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import time and time to first request")
+    seed.add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", default="1,2", help="comma-separated worker counts")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--output", help="results file (default: results/startup-<revision>.json)")
+    args = parser.parse_args()
+    if args.storage != "sql" or args.database_url:
+        parser.error("the startup benchmark runs against a seeded SQLite file (--storage sql)")
+
+    url = seed.resolve_url(args)
+    data_set = seed.seed(url, args.devices, args.days, args.interval, args.seed)
+    source = seed.default_path(args.devices, args.days, args.interval)
+
+    results = {
+        "benchmark": "startup",
+        "revision": git_revision(),
+        "environment": environment(),
+        "data_set": data_set,
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "startup.db")
+        shutil.copy(source, path)
+        env = {**os.environ, "DATABASE_URL": seed.sqlite_url(path), "LOG_LEVEL": "WARNING"}
+
+        time_import(env)  # warm the bytecode and OS file caches
+        results["cases"]["import"] = summarize([time_import(env) for _ in range(args.repeat)])
+
+        for workers in [int(w) for w in args.workers.split(",") if w]:
+            ready, first_data = zip(*(time_first_request(env, workers, args.port) for _ in range(args.repeat)))
+            results["cases"][f"ready_{workers}w"] = summarize(ready)
+            results["cases"][f"first_data_{workers}w"] = summarize(first_data)
+
+    for name, summary in results["cases"].items():
+        print(f"{name:<20} p50 {summary['p50_ms']:>9.1f} ms  max {summary['max_ms']:>9.1f} ms")
+    print(f"Results written to {write_results(results, 'startup', args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
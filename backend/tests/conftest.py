@@ -0,0 +1,33 @@
+"""Run the app modules against a throwaway SQLite database.
+
+The modules read DATABASE_URL on import and use flat imports from
+backend/app, so both are set up before any test imports them.
+"""
+import os
+import sys
+import tempfile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+_scratch = tempfile.mkdtemp(prefix="wqm-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, APP_DIR)
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    import migrations
+    from database import engine
+
+    migrations.upgrade(engine)
+    return engine
+
+
+@pytest.fixture
+def db(db_engine):
+    from database import SessionLocal
+
+    with SessionLocal() as session:
+        yield session
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+
+def _readings(device_id, ph_values, start=datetime(2026, 3, 1, 8, 0)):
+    return [
+        {"device_id": device_id, "timestamp": start + timedelta(minutes=i),
+         "ph_value": ph, "tds_value": 300.0, "temperature": 22.0}
+        for i, ph in enumerate(ph_values)
+    ]
+
+
+def test_rolled_back_batch_leaves_alert_engine_unchanged(db, monkeypatch):
+    import ingest
+    from alerts import alert_engine
+    from models import Alert
+
+    before = alert_engine.active()
+    state_before = alert_engine.state("rollback_dev")
+
+    def fail():
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr(db, "commit", fail)
+    with pytest.raises(RuntimeError):
+        ingest.insert_readings(db, _readings("rollback_dev", [9.5]))
+    db.rollback()
+    monkeypatch.undo()
+
+    assert alert_engine.active() == before
+    assert alert_engine.state("rollback_dev") == state_before
+    assert db.scalar(select(func.count()).select_from(Alert).where(Alert.device_id == "rollback_dev")) == 0
+
+    # The same reading, committed this time, raises the alert with its stored id
+    ingest.insert_readings(db, _readings("rollback_dev", [9.5]))
+    active = alert_engine.active("rollback_dev")
+    assert [(a["metric"], a["kind"]) for a in active] == [("ph_value", "threshold")]
+    assert active[0]["id"] is not None
+
+
+def test_rolled_back_resolve_keeps_alert_active(db, monkeypatch):
+    import ingest
+    from alerts import alert_engine
+
+    ingest.insert_readings(db, _readings("resolve_dev", [9.5]))
+    assert len(alert_engine.active("resolve_dev")) == 1
+
+    monkeypatch.setattr(db, "commit", lambda: (_ for _ in ()).throw(RuntimeError("commit failed")))
+    with pytest.raises(RuntimeError):
+        ingest.insert_readings(db, _readings("resolve_dev", [7.0], start=datetime(2026, 3, 1, 9, 0)))
+    db.rollback()
+
+    assert len(alert_engine.active("resolve_dev")) == 1
+
+
+def test_overlapping_batches_for_one_device_apply_in_turn(db_engine):
+    import threading
+
+    from alerts import alert_engine
+    from database import SessionLocal
+    from models import Alert
+
+    first, second = _readings("overlap_dev", [9.5, 9.6])
+    with SessionLocal() as db:
+        staged = alert_engine.evaluate(db, [first])
+        db.commit()
+
+    # The second batch evaluates and commits while the first is still between commit and apply()
+    def ingest_second():
+        with SessionLocal() as other:
+            changes = alert_engine.evaluate(other, [second])
+            other.commit()
+        alert_engine.apply(changes)
+
+    worker = threading.Thread(target=ingest_second)
+    worker.start()
+    worker.join(0.2)
+    assert worker.is_alive()  # waits for the first batch's device lock
+
+    alert_engine.apply(staged)
+    worker.join(5)
+    assert not worker.is_alive()
+
+    with SessionLocal() as db:
+        unresolved = db.scalar(select(func.count()).select_from(Alert).where(
+            Alert.device_id == "overlap_dev", Alert.resolved_at.is_(None)))
+    assert unresolved == 1
+    assert len(alert_engine.active("overlap_dev")) == 1
+    assert alert_engine.state("overlap_dev")["ph_value"]["count"] == 2
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+DAY = datetime(2025, 6, 1)
+
+
+def _readings(device_id, n, start=DAY, step=timedelta(minutes=17)):
+    return [{"device_id": device_id, "timestamp": start + i * step,
+             "ph_value": 7.0, "tds_value": 300.0 + i, "temperature": 20.0} for i in range(n)]
+
+
+@pytest.fixture(scope="module")
+def archived(db_engine, tmp_path_factory):
+    """Two devices' readings for DAY and the next day, DAY moved to a Parquet archive in small row groups."""
+    import archive
+    import ingest
+    from database import SessionLocal
+
+    directory = archive.ARCHIVE_DIR
+    archive.ARCHIVE_DIR = str(tmp_path_factory.mktemp("archive"))
+    rows = _readings("arch_a", 80) + _readings("arch_b", 60)  # 80 * 17 min runs into the next day
+    with SessionLocal() as db:
+        ingest.insert_readings(db, [dict(r) for r in rows])
+        archive.archive_day(db, DAY, ["arch_a", "arch_b"], chunk_size=7)
+    yield rows
+    archive.ARCHIVE_DIR = directory
+
+
+def test_count_matches_the_archived_rows_without_loading_days(archived, monkeypatch):
+    import archive
+
+    # iter_batches() reads, filters and sorts whole days
+    monkeypatch.setattr(archive, "iter_batches", lambda *a, **k: pytest.fail("count() loaded whole days"))
+    next_day = DAY + timedelta(days=1)
+    cases = [
+        (None, None, None),
+        ("arch_a", None, None),
+        ("arch_b", DAY + timedelta(hours=3), DAY + timedelta(hours=9, minutes=5)),
+        (None, DAY + timedelta(hours=20), None),
+        ("arch_a", None, DAY + timedelta(hours=1)),
+        ("missing", None, None),
+    ]
+    for device_id, start, end in cases:
+        expected = sum(
+            1 for r in archived
+            if r["timestamp"] < next_day and (device_id is None or r["device_id"] == device_id)
+            and (start is None or r["timestamp"] >= start) and (end is None or r["timestamp"] < end)
+        )
+        assert archive.count(device_id, start, end) == expected, (device_id, start, end)
+
+
+def test_count_of_whole_days_reads_only_metadata(archived, monkeypatch):
+    import pyarrow.parquet
+
+    import archive
+
+    monkeypatch.setattr(pyarrow.parquet.ParquetFile, "read_row_group",
+                        lambda *a, **k: pytest.fail("read a row group"))
+    assert archive.count(None, DAY, DAY + timedelta(days=1)) == sum(
+        1 for r in archived if r["timestamp"] < DAY + timedelta(days=1))
+
+
+def test_retry_of_an_archived_reading_is_a_duplicate(archived, db, monkeypatch):
+    import archive
+    import ingest
+    from dedupe import RecentKeys
+    from storage import store
+
+    monkeypatch.setattr(ingest, "recent_keys", RecentKeys())  # as after a restart
+    retried = [dict(r) for r in archived[:3]]
+    ids = ingest.insert_readings(db, retried)
+
+    assert all(row["duplicate"] for row in retried)
+    stored = {(r.device_id, r.timestamp): r.id for r in archive.iter_rows("arch_a")}
+    assert ids == [stored[(r["device_id"], r["timestamp"])] for r in retried]
+    series = store.series(db, "arch_a")
+    assert len(series) == len({p["timestamp"] for p in series}) == 80
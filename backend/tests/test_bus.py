@@ -0,0 +1,62 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def _buses(directory, monkeypatch, handler):
+    """A sending and a receiving bus; they register under different pids, like two workers."""
+    from bus import CacheBus
+
+    sender, receiver = CacheBus(directory), CacheBus(directory)
+    sender.start(lambda message: None)
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "getpid", lambda: -1)
+        receiver.start(handler)
+    return sender, receiver
+
+
+def test_share_splits_rows_and_alerts_into_datagrams(tmp_path, monkeypatch):
+    import ingest
+
+    received = []
+    sender, receiver = _buses(str(tmp_path), monkeypatch, received.append)
+    try:
+        monkeypatch.setattr(ingest, "cache_bus", sender)
+        start = datetime(2026, 3, 1)
+        rows = [{"id": i, "device_id": f"bus_device_with_a_long_identifier_{i % 7}",
+                 "timestamp": start + timedelta(seconds=i), "ph_value": 7.0, "tds_value": 300.0,
+                 "temperature": 21.0} for i in range(450)]
+        alert_items = [{"id": i, "device_id": f"bus_device_with_a_long_identifier_{i}", "metric": "ph_value",
+                        "kind": "threshold", "value": 9.5, "message": "pH is 9.5, outside 6.5-8.5" + " " * 60,
+                        "raised_at": start.isoformat(), "resolved_at": None} for i in range(400)]
+        ingest.share(rows, alert_items)
+
+        assert _wait_for(lambda: sum(len(m["alerts"]) for m in received) == 400)
+        assert sum(len(m["rows"]) for m in received) == 450
+        assert len(received) == 8  # 400 alerts / CHUNK_ALERTS
+        assert sender.stats()["oversize"] == 0
+    finally:
+        sender.stop()
+        receiver.stop()
+
+
+def test_oversize_message_is_counted_not_blamed_on_peers(tmp_path, monkeypatch):
+    from bus import MAX_DATAGRAM
+
+    sender, receiver = _buses(str(tmp_path), monkeypatch, lambda message: None)
+    try:
+        assert sender.send({"type": "readings", "rows": ["x" * MAX_DATAGRAM], "alerts": []}) is False
+        stats = sender.stats()
+        assert stats["oversize"] == 1
+        assert stats["errors"] == 0
+        assert stats["sent"] == 0
+    finally:
+        sender.stop()
+        receiver.stop()
@@ -0,0 +1,169 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+np = pytest.importorskip("numpy")
+
+START = datetime(2025, 9, 1)
+PROFILES = {
+    1: {"ph_v7": 2.61, "ph_slope": 0.171, "tds_factor": 1.08, "tds_temp_coefficient": 0.0},
+    2: {"ph_v7": 2.49, "ph_slope": 0.192, "tds_factor": 0.93, "tds_temp_coefficient": 0.02},
+}
+
+
+def _readings(device_id, n, step=timedelta(minutes=30)):
+    return [{"device_id": device_id, "timestamp": START + i * step, "ph_value": 6.5 + (i % 20) / 10,
+             "tds_value": 150.0 + 7 * i, "temperature": 15.0 + (i % 15)} for i in range(n)]
+
+
+def _stored(db, device_id):
+    from models import MonitoringData
+
+    return db.execute(
+        select(MonitoringData.timestamp, MonitoringData.ph_value, MonitoringData.tds_value,
+               MonitoringData.calibration_id)
+        .where(MonitoringData.device_id == device_id).order_by(MonitoringData.timestamp)
+    ).all()
+
+
+def _rollups(db, device_id):
+    from models import MonitoringRollup
+
+    return [
+        (r.resolution, r.bucket, r.count, r.ph_min, r.ph_max, pytest.approx(r.ph_sum), r.tds_min, r.tds_max,
+         pytest.approx(r.tds_sum), pytest.approx(r.temperature_sum))
+        for r in db.scalars(select(MonitoringRollup).where(MonitoringRollup.device_id == device_id)
+                            .order_by(MonitoringRollup.resolution, MonitoringRollup.bucket))
+    ]
+
+
+def test_tds_voltage_inverts_the_curve():
+    from calibration import _tds_curve, _tds_voltage
+
+    volts = np.linspace(0.0, 3.0, 301)
+    np.testing.assert_allclose(_tds_voltage(_tds_curve(volts)), volts, atol=1e-9)
+    # Below the curve's range (a negative reading) there is no voltage; it clamps at 0
+    assert _tds_voltage(np.array([-40.0]))[0] == 0.0
+
+
+def test_recalibrate_round_trips_between_profiles():
+    from calibration import recalibrate
+
+    ph = np.array([4.0, 6.8, 7.0, 9.3, np.nan])
+    tds = np.array([12.0, 180.0, 455.5, 1400.0, 300.0])
+    temperature = np.array([8.0, 22.0, 25.0, 31.5, np.nan])
+    ids = {k: np.full(len(ph), k, dtype=np.int64) for k in (0, 1, 2)}
+
+    # firmware -> 1 -> 2 (temperature compensated) -> firmware
+    ph1, tds1 = recalibrate(ph, tds, temperature, ids[0], ids[1], PROFILES)
+    ph2, tds2 = recalibrate(ph1, tds1, temperature, ids[1], ids[2], PROFILES)
+    back_ph, back_tds = recalibrate(ph2, tds2, temperature, ids[2], ids[0], PROFILES)
+
+    np.testing.assert_allclose(back_ph, ph, rtol=1e-9)
+    np.testing.assert_allclose(back_tds, tds, rtol=1e-9)
+    assert np.isnan(ph2[-1])
+    # Compensation changes the values only where the temperature is known and not 25 C
+    direct = recalibrate(ph, tds, temperature, ids[0], ids[2], PROFILES)[1]
+    np.testing.assert_allclose(direct, tds2, rtol=1e-9)
+    assert direct[2] == pytest.approx(tds[2] * 0.93)
+
+
+def test_recalibrate_clamps_tds_at_zero():
+    from calibration import recalibrate
+
+    ph = np.array([7.0, 7.0])
+    tds = np.array([-25.0, 0.0])
+    temperature = np.array([20.0, 30.0])
+    ones, twos = np.ones(2, dtype=np.int64), np.full(2, 2, dtype=np.int64)
+
+    _, converted = recalibrate(ph, tds, temperature, ones, twos, PROFILES)
+    assert converted.tolist() == [0.0, 0.0]
+    _, back = recalibrate(ph, converted, temperature, twos, ones, PROFILES)
+    assert back.tolist() == [0.0, 0.0]
+
+
+def test_job_rewrites_once_and_rebuilds_only_dirty_days(db, monkeypatch):
+    import calibration
+    import ingest
+    import rollups
+
+    ingest.insert_readings(db, _readings("calib_once", 144))  # three days
+    firmware = _stored(db, "calib_once")
+    valid_from = START + timedelta(days=1, hours=6)
+    calibration.create_profile(db, "calib_once", valid_from, ph_v7=2.61, ph_slope=0.171,
+                               tds_factor=1.08, tds_temp_coefficient=0.02)
+
+    rebuilt = []
+    real_rebuild = rollups.rebuild
+    monkeypatch.setattr(rollups, "rebuild", lambda db, **kw: rebuilt.append(kw) or real_rebuild(db, **kw))
+    item = calibration.run_job(calibration.create_job(db, "calib_once"), chunk_size=25)
+
+    covered = [r for r in firmware if r.timestamp >= valid_from]
+    assert (item["status"], item["rows_scanned"], item["rows_updated"]) == ("done", 144, len(covered))
+    assert rebuilt == [{"device_id": "calib_once", "start": START + timedelta(days=1),
+                        "end": START + timedelta(days=3)}]
+
+    after = _stored(db, "calib_once")
+    assert [r.calibration_id is not None for r in after] == [r.timestamp >= valid_from for r in after]
+    assert [r.ph_value for r in after if r.timestamp < valid_from] == \
+        [r.ph_value for r in firmware if r.timestamp < valid_from]
+
+    # Incrementally rebuilt rollups equal a full rebuild from the rewritten readings
+    incremental = _rollups(db, "calib_once")
+    real_rebuild(db, device_id="calib_once")
+    assert _rollups(db, "calib_once") == incremental
+
+    # Every reading already matches its profile: a second job only scans
+    rebuilt.clear()
+    again = calibration.run_job(calibration.create_job(db, "calib_once"), chunk_size=25)
+    assert (again["rows_scanned"], again["rows_updated"]) == (144, 0)
+    assert rebuilt == []
+    assert _stored(db, "calib_once") == after
+
+
+def test_failed_job_resumes_from_its_cursor(db, monkeypatch):
+    import calibration
+    import ingest
+
+    ingest.insert_readings(db, _readings("calib_resume", 100))
+    calibration.create_profile(db, "calib_resume", START, ph_v7=2.49, ph_slope=0.192, tds_factor=0.93)
+    job_id = calibration.create_job(db, "calib_resume")
+
+    real_rewrite, calls = calibration._rewrite, []
+
+    def failing_rewrite(db, device_id, rows):
+        calls.append(rows[0].timestamp)
+        if len(calls) == 3:
+            real_rewrite(db, device_id, rows)  # written, not yet committed, when it fails
+            raise RuntimeError("disk full")
+        return real_rewrite(db, device_id, rows)
+
+    monkeypatch.setattr(calibration, "_rewrite", failing_rewrite)
+    with pytest.raises(RuntimeError):
+        calibration.run_job(job_id, chunk_size=30)
+
+    from models import ReprocessJob
+
+    db.expire_all()
+    job = db.get(ReprocessJob, job_id)
+    assert (job.status, job.rows_scanned, job.rows_updated) == ("failed", 60, 60)
+    assert (job.current_device, job.last_timestamp) == ("calib_resume", START + timedelta(minutes=30 * 59))
+    # The failed chunk rolled back with its cursor
+    assert sum(r.calibration_id is not None for r in _stored(db, "calib_resume")) == 60
+
+    calls.clear()
+    item = calibration.run_job(job_id, chunk_size=30)
+    assert calls[0] == START + timedelta(minutes=30 * 60)  # no chunk read twice
+    assert (item["status"], item["rows_scanned"], item["rows_updated"]) == ("done", 100, 100)
+
+    # Same values as converting every reading once
+    raw = _readings("calib_resume", 100)
+    (profile,) = calibration.calibration_profiles.all("calib_resume")
+    expected_ph, expected_tds = calibration.recalibrate(
+        *(np.array([r[column] for r in raw]) for column in ("ph_value", "tds_value", "temperature")),
+        np.zeros(100, dtype=np.int64), np.full(100, profile["id"]), calibration.calibration_profiles,
+    )
+    stored = _stored(db, "calib_resume")
+    np.testing.assert_allclose([r.ph_value for r in stored], expected_ph, rtol=1e-12)
+    np.testing.assert_allclose([r.tds_value for r in stored], expected_tds, rtol=1e-12)
@@ -0,0 +1,55 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+
+def _check(indices, n, n_out):
+    assert len(indices) == n_out
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert (np.diff(indices) > 0).all()
+
+
+def test_lttb_keeps_endpoints_and_returns_n_out_points():
+    from downsample import lttb_indices
+
+    x = np.arange(1000, dtype=float)
+    ys = np.vstack([np.sin(x / 40), np.cos(x / 90) * 300, x % 17])
+    for n_out in (3, 4, 10, 100, 998, 999):
+        _check(lttb_indices(x, ys, n_out), 1000, n_out)
+
+
+def test_lttb_small_outputs_and_short_inputs():
+    from downsample import lttb_indices
+
+    x = np.arange(10, dtype=float)
+    ys = x[None, :] ** 2
+    assert lttb_indices(x, ys, 10).tolist() == list(range(10))
+    assert lttb_indices(x, ys, 50).tolist() == list(range(10))
+    assert lttb_indices(x, ys, 2).tolist() == [0, 9]
+    assert lttb_indices(x, ys, 1).tolist() == [0]
+
+
+def test_lttb_keeps_a_spike_in_any_one_series():
+    from downsample import lttb_indices
+
+    x = np.arange(2000, dtype=float)
+    flat = np.full(2000, 7.0)
+    spiky = flat.copy()
+    spiky[1234] = 9.5
+    # The spike is in the second series only; the shared index set still keeps it
+    assert 1234 in lttb_indices(x, np.vstack([flat + x / 1e4, spiky]), 25)
+
+
+def test_rollup_downsample_keeps_dicts_and_the_limit():
+    from datetime import datetime, timedelta
+
+    from rollups import downsample
+
+    start = datetime(2026, 1, 1)
+    points = [{"timestamp": start + timedelta(minutes=i), "ph_value": 7 + (i % 9) / 10,
+               "tds_value": 300.0 + i, "temperature": 20.0} for i in range(500)]
+    reduced = downsample(points, 60)
+    assert len(reduced) == 60
+    assert reduced[0] is points[0] and reduced[-1] is points[-1]
+    assert downsample(points, None) is points
+    assert downsample(points, 500) is points
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client(db_engine):
+    from fastapi.testclient import TestClient
+
+    import ingest
+    import main
+    from database import SessionLocal
+
+    start = datetime(2026, 2, 1)
+    with SessionLocal() as db:
+        ingest.insert_readings(db, [
+            {"device_id": "etag_dev", "timestamp": start + timedelta(minutes=i),
+             "ph_value": 7.0 + (i % 10) / 100, "tds_value": 300.0, "temperature": 21.0}
+            for i in range(200)
+        ])
+    with TestClient(main.app) as client:
+        yield client
+
+
+CHART = "/monitoring_data/etag_dev/chart?date=2026-02-01"
+
+
+def test_compressed_chart_has_its_own_strong_etag(client):
+    plain = client.get(CHART, headers={"accept-encoding": "identity"})
+    gzipped = client.get(CHART, headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in plain.headers
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.headers["etag"] == plain.headers["etag"][:-1] + '-gzip"'
+
+
+def test_chart_revalidates_with_coded_or_weak_tag(client):
+    plain_tag = client.get(CHART, headers={"accept-encoding": "identity"}).headers["etag"]
+    gzip_tag = client.get(CHART, headers={"accept-encoding": "gzip"}).headers["etag"]
+
+    revalidated = client.get(CHART, headers={"accept-encoding": "gzip", "if-none-match": gzip_tag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == gzip_tag
+
+    weak = client.get(CHART, headers={"accept-encoding": "identity", "if-none-match": f"W/{plain_tag}"})
+    assert weak.status_code == 304
+    assert weak.headers["etag"] == plain_tag
+
+    stale = client.get(CHART, headers={"accept-encoding": "gzip", "if-none-match": '"0000-gzip"'})
+    assert stale.status_code == 200
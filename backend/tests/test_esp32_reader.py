@@ -0,0 +1,114 @@
+import json
+import os
+import queue
+import time
+
+import pytest
+
+pty = pytest.importorskip("pty")
+pytest.importorskip("serial")
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def _take(readings, n, timeout=5):
+    return [readings.get(timeout=timeout)[0] for _ in range(n)]
+
+
+def _line(**fields):
+    return (json.dumps(fields) + "\n").encode()
+
+
+@pytest.fixture
+def gateway(tmp_path):
+    import esp32_reader
+
+    raw_log = esp32_reader.RawLog(str(tmp_path / "raw.log"))
+    yield queue.Queue(maxsize=100), esp32_reader.ReaderStats(), raw_log
+    raw_log.close()
+
+
+@pytest.fixture
+def board():
+    """A pseudo-terminal standing in for a USB serial board: (write end, port path)."""
+    master, slave = pty.openpty()
+    yield master, os.ttyname(slave)
+    for fd in (master, slave):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def test_reader_accepts_json_lines_and_frames_and_learns_the_device_id(gateway, board):
+    import esp32_reader
+    import frames
+
+    readings, stats, raw_log = gateway
+    master, port = board
+    reader = esp32_reader.SerialReader(port, readings, stats, raw_log)
+    reader.start()
+    try:
+        assert _wait_for(lambda: reader.connected)
+        default_id = reader.device_id
+
+        os.write(master, _line(ph=7.1, tds=300, temp=22.5))
+        os.write(master, b"boot: sensor warm-up\n")  # not JSON: counted as invalid
+        os.write(master, _line(device_id="esp32_tank", ph=7.2, tds=301, temp=22.4))
+        os.write(master, frames.pack("frame_board", 41, 0, 7.3, 302.0, 22.3) + frames.pack("", None, 0, 7.4, 303.0, 22.2))
+        os.write(master, _line(ph=7.5, tds=304, temp=22.1))
+        first, second, framed, unnamed_frame, last = _take(readings, 5)
+    finally:
+        reader.stopping.set()
+        reader.join(timeout=5)
+
+    assert first["device_id"] == default_id and first["ph_value"] == 7.1
+    assert second["device_id"] == "esp32_tank"
+    assert (framed["device_id"], framed["seq"], framed["tds_value"]) == ("frame_board", 41, 302.0)
+    # A frame without a device id, and later JSON lines, keep the learned one
+    assert (unnamed_frame["device_id"], unnamed_frame["seq"]) == ("frame_board", None)
+    assert last["device_id"] == "frame_board"
+    assert (stats.lines, stats.invalid) == (6, 1)
+
+
+def test_port_manager_reconnects_a_replugged_board(gateway, tmp_path):
+    import esp32_reader
+
+    readings, stats, raw_log = gateway
+    link = str(tmp_path / "ttyESP32")
+    master, slave = pty.openpty()
+    os.symlink(os.ttyname(slave), link)
+    manager = esp32_reader.PortManager(readings, stats, raw_log, ports=[link], scan_interval=0.05)
+    manager.start()
+    open_fds = [master, slave]
+    try:
+        assert _wait_for(lambda: manager.readers.get(link) is not None and manager.readers[link].connected)
+        os.write(master, _line(device_id="esp32_river", ph=7.0, tds=250, temp=19.0))
+        assert _take(readings, 1)[0]["device_id"] == "esp32_river"
+        first_reader = manager.readers[link]
+
+        # Unplug: the reader dies with its port...
+        for fd in open_fds:
+            os.close(fd)
+        open_fds = []
+        assert _wait_for(lambda: not first_reader.is_alive())
+
+        # ...and the board comes back on a new device node behind the same name
+        master, slave = open_fds = list(pty.openpty())
+        os.remove(link)
+        os.symlink(os.ttyname(slave), link)
+        assert _wait_for(lambda: manager.readers[link] is not first_reader and manager.readers[link].connected)
+        os.write(master, _line(ph=7.05, tds=251, temp=19.1))
+        (payload,) = _take(readings, 1)
+    finally:
+        manager.stop()
+        for fd in open_fds:
+            os.close(fd)
+
+    assert payload["device_id"] == "esp32_river"  # kept across the reconnect
+    assert manager.status()[link]["device_id"] == "esp32_river"
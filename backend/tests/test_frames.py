@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+
+def _payloads(seqs):
+    start = datetime(2026, 3, 1, 8, 0).astimezone()
+    payloads = []
+    for i, seq in enumerate(seqs):
+        payload = {"device_id": "frame_dev", "timestamp": (start + timedelta(minutes=i)).isoformat(),
+                   "ph_value": 7.0, "tds_value": 300.0, "temperature": 24.0}
+        if seq is not None:
+            payload["seq"] = seq
+        payloads.append(payload)
+    return payloads
+
+
+def test_frames_without_seq_store_none():
+    import esp32_reader
+    import ingest
+
+    rows, errors = ingest.parse_frames(esp32_reader.encode_frames(_payloads([None, 0, 7])))
+
+    assert errors == []
+    assert [row["seq"] for _, row in rows] == [None, 0, 7]
+
+
+def test_readings_without_seq_are_left_out_of_seq_stats():
+    import esp32_reader
+    import ingest
+    from dedupe import RecentKeys
+
+    # A JSON-fed gateway has no sequence numbers; none of its readings count as gaps or restarts
+    rows, _ = ingest.parse_frames(esp32_reader.encode_frames(_payloads([None] * 5)))
+    keys = RecentKeys()
+    keys.observe([row for _, row in rows], [])
+
+    stats = keys.device_stats("frame_dev")["frame_dev"]
+    assert stats["received"] == 5
+    assert (stats["missing"], stats["restarts"], stats["reordered"], stats["last_seq"]) == (0, 0, 0, None)
@@ -0,0 +1,66 @@
+def test_buffered_post_does_not_open_a_session(db_engine, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    def no_session():
+        raise AssertionError("buffered ingest opened a database session")
+
+    submitted = []
+    monkeypatch.setattr(main, "INGEST_MODE", "buffered")
+    monkeypatch.setattr(main, "SessionLocal", no_session)
+    monkeypatch.setattr(main.write_buffer, "submit", submitted.append)
+
+    client = TestClient(main.app)  # no lifespan: the request must not need the database
+    response = client.post("/data", json={"device_id": "buffered_dev", "ph_value": 7.1,
+                                          "tds_value": 310.0, "temperature": 22.5})
+
+    assert response.status_code == 202
+    assert [row["device_id"] for row in submitted] == ["buffered_dev"]
+
+
+def test_failed_group_commit_fails_only_the_bad_reading(db, monkeypatch):
+    from concurrent.futures import Future
+    from datetime import datetime, timedelta
+
+    import pytest
+    from fastapi.testclient import TestClient
+
+    import ingest
+    import main
+    from storage import store
+    from writebehind import WriteBehindBuffer
+
+    start = datetime(2025, 8, 4, 9, 0)
+    rows = [{"device_id": "group_dev", "timestamp": start + timedelta(minutes=i), "ph_value": 7.0,
+             "tds_value": 300.0 + i, "temperature": 21.0} for i in range(7)]
+    poisoned = rows[4]
+    real_record = ingest.devices.record
+
+    def record(db, stored):
+        if any(row["timestamp"] == poisoned["timestamp"] for row in stored):
+            raise ValueError("sensor sent garbage")
+        return real_record(db, stored)
+
+    monkeypatch.setattr(ingest.devices, "record", record)
+    buffer = WriteBehindBuffer()
+    batch = [(row, Future()) for row in rows]
+    buffer._flush(batch)
+
+    with pytest.raises(ValueError):
+        batch[4][1].result(timeout=0)
+    ids = [future.result(timeout=0) for row, future in batch if row is not poisoned]
+    assert len(set(ids)) == 6
+    assert [p["timestamp"] for p in store.series(db, "group_dev")] == \
+        [row["timestamp"] for row in rows if row is not poisoned]
+    # Failed attempts left the readings as submitted: none is a duplicate of itself
+    assert not any(row.get("duplicate") for row in rows)
+    assert "id" not in poisoned
+
+    stats = buffer.stats()
+    assert (stats["flushes"], stats["flushed_rows"], stats["failed_rows"], stats["lost"]) == (3, 6, 1, 1)
+    assert stats["split_flushes"] == 3  # 7 -> 3 + 4, 4 -> 2 + 2, 2 -> 1 + 1
+
+    monkeypatch.setattr(main, "write_buffer", buffer)
+    body = TestClient(main.app).get("/metrics").text
+    assert 'wqm_ingest_buffer_lost_total{mode="direct"} 1' in body.splitlines()
@@ -0,0 +1,16 @@
+def _types(body):
+    return dict(line.split()[2:4] for line in body.splitlines() if line.startswith("# TYPE "))
+
+
+def test_monotonic_totals_are_counters(db_engine):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    types = _types(TestClient(main.app).get("/metrics").text)
+
+    for name in ("wqm_readings_ingested_total", "wqm_readings_duplicate_total", "wqm_alerts_total",
+                 "wqm_latest_cache_requests_total", "wqm_live_dropped_total"):
+        assert types[name] == "counter"
+    assert all(name.endswith("_total") for name, kind in types.items() if kind == "counter")
+    assert types["wqm_alerts_active"] == "gauge"
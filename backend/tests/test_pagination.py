@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+DAY = datetime(2025, 7, 1)
+DEVICES = ("page_a", "page_b", "page_c")
+
+
+def _readings(start, n, step=timedelta(minutes=45)):
+    # Every device reports at the same instants: pages must break ties on id
+    return [{"device_id": device_id, "timestamp": start + i * step, "ph_value": 7.0,
+             "tds_value": 300.0 + i, "temperature": 20.0} for i in range(n) for device_id in DEVICES]
+
+
+def _client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    return TestClient(main.app)
+
+
+def _pages(client, path, limit, **params):
+    """Every page of a keyset listing, following X-Next-Cursor."""
+    pages, cursor, seen = [], None, set()
+    while True:
+        query = {**params, "limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get(path, params=query)
+        assert response.status_code == 200, response.text
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+        assert cursor not in seen, "the cursor did not move"
+        seen.add(cursor)
+
+
+def _keys(items):
+    return [(item["device_id"], datetime.fromisoformat(item["timestamp"])) for item in items]
+
+
+def test_cursor_round_trips():
+    from pagination import decode_cursor, encode_cursor
+
+    for timestamp, row_id in [(DAY, 1), (DAY + timedelta(microseconds=250), 2 ** 40), (datetime(1999, 12, 31, 23, 59, 59), 0)]:
+        assert decode_cursor(encode_cursor(timestamp, row_id)) == (timestamp, row_id)
+
+
+def test_pages_break_timestamp_ties_without_gaps_or_repeats(db):
+    import ingest
+
+    start = DAY + timedelta(days=20)
+    readings = _readings(start, 9)
+    ingest.insert_readings(db, [dict(r) for r in readings])
+    expected = [(r["device_id"], r["timestamp"]) for r in readings]
+    window = {"from": start.isoformat(), "to": (start + timedelta(days=1)).isoformat()}
+
+    client = _client()
+    for limit in (1, 2, 3, 4, 26, 27, 28):
+        pages = _pages(client, "/data", limit, **window)
+        assert all(len(page) == limit for page in pages[:-1])
+        assert _keys(item for page in pages for item in page) == expected, limit
+
+    history = [datetime.fromisoformat(item["timestamp"]) for page in _pages(client, "/history/page_b", 4, **window)
+               for item in page]
+    assert len(history) == 9 and history == sorted(set(history))
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor!", "bm9waXBl", "MjAyNS0wNy0wMVQwMDowMDowMHx4", ""])
+def test_malformed_cursor_is_a_400(db_engine, cursor):
+    client = _client()
+    for path in ("/data", "/history/page_a"):
+        response = client.get(path, params={"cursor": cursor, "limit": 5})
+        if cursor == "":  # an empty cursor is the first page
+            assert response.status_code == 200
+        else:
+            assert response.status_code == 400, (path, response.text)
+            assert "Invalid cursor" in response.json()["detail"]
+
+
+@pytest.fixture(scope="module")
+def archived(db_engine, tmp_path_factory):
+    """Readings over DAY and the next day, DAY moved to a Parquet archive."""
+    pytest.importorskip("pyarrow")
+    import archive
+    import ingest
+    from database import SessionLocal
+
+    directory = archive.ARCHIVE_DIR
+    archive.ARCHIVE_DIR = str(tmp_path_factory.mktemp("archive"))
+    readings = _readings(DAY + timedelta(hours=12), 30)  # 30 * 45 min runs into the next day
+    with SessionLocal() as db:
+        ingest.insert_readings(db, [dict(r) for r in readings])
+        archive.archive_day(db, DAY, list(DEVICES), chunk_size=5)
+    yield readings
+    archive.ARCHIVE_DIR = directory
+
+
+def test_pages_span_the_archive_boundary(archived, db):
+    import archive
+    from storage import store
+
+    expected = [(r["device_id"], r["timestamp"]) for r in archived]
+    in_archive = sum(1 for r in archived if r["timestamp"] < DAY + timedelta(days=1))
+    assert 0 < in_archive < len(archived)
+    assert sum(1 for _ in archive.iter_rows()) == in_archive
+
+    window = {"from": DAY.isoformat(), "to": (DAY + timedelta(days=2)).isoformat()}
+    client = _client()
+    # Page sizes that end a page just before, on and just after the last archived row
+    for limit in (1, 4, 7, in_archive - 1, in_archive, in_archive + 1):
+        pages = _pages(client, "/data", limit, **window)
+        assert _keys(item for page in pages for item in page) == expected, limit
+
+    history = [datetime.fromisoformat(item["timestamp"]) for page in _pages(client, "/history/page_c", 5, **window)
+               for item in page]
+    assert len(history) == len(archived) // len(DEVICES) and history == sorted(set(history))
+
+    streamed = [(r.device_id, r.timestamp) for chunk in store.stream(start=DAY, end=DAY + timedelta(days=2), db=db)
+                for r in chunk]
+    assert streamed == expected
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+
+def _readings(device_id, start, n, step):
+    return [{"device_id": device_id, "timestamp": start + i * step, "ph_value": 6.8 + (i % 7) / 10,
+             "tds_value": 280.0 + (i % 23), "temperature": 18.0 + (i % 11) / 2} for i in range(n)]
+
+
+def _rollups(db, device_id):
+    from models import MonitoringRollup
+
+    return [
+        (r.resolution, r.bucket, r.count, r.ph_min, r.ph_max, pytest.approx(r.ph_sum), r.tds_min, r.tds_max,
+         pytest.approx(r.tds_sum), r.temperature_min, r.temperature_max, pytest.approx(r.temperature_sum))
+        for r in db.scalars(select(MonitoringRollup).where(MonitoringRollup.device_id == device_id)
+                            .order_by(MonitoringRollup.resolution, MonitoringRollup.bucket))
+    ]
+
+
+def test_incremental_rollups_match_a_full_rebuild(db):
+    import ingest
+    import rollups
+
+    readings = _readings("rollup_dev", datetime(2025, 11, 3, 22, 50), 400, timedelta(seconds=37))
+    # Batches of odd sizes that cut buckets in half, one of them late (out of order)
+    batches = [readings[0:13], readings[13:150], readings[200:400], readings[150:200]]
+    for batch in batches:
+        ingest.insert_readings(db, [dict(r) for r in batch])
+
+    incremental = _rollups(db, "rollup_dev")
+    assert {r[0] for r in incremental} == set(rollups.RESOLUTIONS)
+    assert sum(r[2] for r in incremental if r[0] == "1d") == 400
+
+    rollups.rebuild(db, device_id="rollup_dev")
+    assert _rollups(db, "rollup_dev") == incremental
+
+
+def test_pick_resolution_at_the_max_points_boundaries(db):
+    import ingest
+    import rollups
+
+    # 150 minutes from 23:00, every 20 s: 450 raw points, 150 minutes, 3 hours, 2 days
+    start = datetime(2025, 11, 10, 23, 0)
+    ingest.insert_readings(db, _readings("tier_dev", start, 450, timedelta(seconds=20)))
+    counts = {resolution: rollups.count_points(db, "tier_dev", resolution) for resolution in ("raw", "1m", "1h", "1d")}
+    assert counts == {"raw": 450, "1m": 150, "1h": 3, "1d": 2}
+
+    picks = {max_points: rollups.pick_resolution(db, "tier_dev", max_points)
+             for max_points in (10000, 450, 449, 150, 149, 3, 2, 1)}
+    assert picks == {10000: "raw", 450: "raw", 449: "1m", 150: "1m", 149: "1h", 3: "1h", 2: "1d", 1: "1d"}
+
+    # Counts, and so the tier, follow the requested range
+    window = (start + timedelta(minutes=30), start + timedelta(minutes=60))
+    assert rollups.count_points(db, "tier_dev", "raw", *window) == 90
+    assert rollups.pick_resolution(db, "tier_dev", 90, *window) == "raw"
+    assert rollups.pick_resolution(db, "tier_dev", 89, *window) == "1m"
@@ -0,0 +1,73 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+tsdb = pytest.importorskip("tsdb")
+
+
+def _rows(n, start=datetime(2026, 3, 1)):
+    return [{"device_id": "dev 1", "timestamp": start + timedelta(minutes=i),
+             "ph_value": 7.0 + i / 100, "tds_value": 300.0 + i, "temperature": 20.0} for i in range(n)]
+
+
+def test_store_keeps_the_chunk_capacity_it_was_created_with(tmp_path):
+    store = tsdb.TimeSeriesDB(str(tmp_path), chunk_rows=4)
+    store.append(_rows(10))
+
+    reopened = tsdb.TimeSeriesDB(str(tmp_path))
+    assert reopened.chunk_rows == 4
+    assert [r.tds_value for r in reopened.iter_readings("dev 1")] == [300.0 + i for i in range(10)]
+
+    with pytest.raises(ValueError, match="TSDB_CHUNK_ROWS=4"):
+        tsdb.TimeSeriesDB(str(tmp_path), chunk_rows=8)
+
+
+def test_store_without_recorded_capacity_reads_it_from_the_chunk_files(tmp_path):
+    tsdb.TimeSeriesDB(str(tmp_path), chunk_rows=4).append(_rows(10))
+    # Strip what older versions did not write
+    os.remove(tmp_path / "store.json")
+    index_path = tmp_path / "dev%201" / "index.json"
+    index = json.loads(index_path.read_text())
+    for meta in index["chunks"]:
+        del meta["capacity"]
+    index_path.write_text(json.dumps(index))
+
+    reopened = tsdb.TimeSeriesDB(str(tmp_path))
+    assert reopened.chunk_rows == 4
+    assert [r.ph_value for r in reopened.iter_readings("dev 1")] == [7.0 + i / 100 for i in range(10)]
+    reopened.append(_rows(3, start=datetime(2026, 3, 2)))
+    assert reopened.count("dev 1") == 13
+
+
+def test_readings_are_written_only_when_the_sql_transaction_commits(tmp_path, db, monkeypatch):
+    from storage import TimeSeriesStorage
+
+    store = TimeSeriesStorage(str(tmp_path))
+    rows = _rows(3)
+
+    store.append(db, [dict(r) for r in rows])
+    assert store.count(db) == 0  # staged, not written
+    db.rollback()
+    assert store.count(db) == 0
+
+    # A retry after the rollback is stored, not taken for a duplicate
+    retried = [dict(r) for r in rows]
+    store.append(db, retried)
+    assert not any(r.get("duplicate") for r in retried)
+    # ...and, while staged, a concurrent copy of it is
+    again = [dict(r) for r in rows]
+    store.append(db, again)
+    assert all(r.get("duplicate") for r in again)
+    db.commit()
+    assert store.count(db) == 3
+
+    late = [dict(r) for r in _rows(1, start=datetime(2026, 3, 2))]
+    store.append(db, late)
+    db.close()  # never committed
+    assert store.count(db) == 3
+    store.append(db, late)
+    assert not late[0].get("duplicate")
+    db.commit()
+    assert store.count(db) == 4
@@ -18,6 +18,18 @@ async function loadLocationFromBackend(deviceId) {
     }
 }
 
+// Every site in the visible area with its latest reading, in one request
+async function loadSitesFromBackend(bounds, zoom) {
+    try {
+        const res = await fetch(`http://localhost:8000/map?bbox=${bounds.toBBoxString()}&zoom=${zoom}`);
+        if (!res.ok) return null;
+        return await res.json();
+    } catch (err) {
+        console.error("Failed to fetch map sites:", err);
+        return null;
+    }
+}
+
 async function saveLocationToBackend(deviceId, lat, lng) {
     try {
         const res = await fetch(
@@ -57,6 +69,52 @@ async function initMap() {
     // Single reusable marker
     marker = L.marker([lat, lng]).addTo(map);
     marker.bindPopup(`<b>Water Body Location</b><br>Lat: ${lat}<br>Lng: ${lng}`).openPopup();
+
+    // The other sites, reloaded whenever the view changes
+    sitesLayer = L.layerGroup().addTo(map);
+    map.on('moveend', () => {
+        clearTimeout(sitesTimer);
+        sitesTimer = setTimeout(refreshSites, 250);
+    });
+    refreshSites();
+}
+
+// ----------------------------
+// ALL SITES IN VIEW (markers and clusters)
+// ----------------------------
+let sitesLayer, sitesTimer;
+
+function sitePopup(site) {
+    const r = site.latest;
+    const reading = r
+        ? `pH: ${r.ph_value}<br>TDS: ${r.tds_value} ppm<br>Temp: ${r.temperature} °C<br>` +
+          `<small>${new Date(r.timestamp).toLocaleString()}</small>`
+        : "No readings yet";
+    const alerts = site.active_alerts ? `<br><b>${site.active_alerts} active alert(s)</b>` : "";
+    return `<b>${site.device_id}</b><br>${reading}${alerts}`;
+}
+
+async function refreshSites() {
+    const data = await loadSitesFromBackend(map.getBounds(), map.getZoom());
+    if (!data) return;
+
+    sitesLayer.clearLayers();
+    data.sites
+        .filter(site => site.device_id !== deviceId)  // shown by the editable marker
+        .forEach(site => {
+            L.circleMarker([site.latitude, site.longitude], {
+                radius: 8,
+                color: site.active_alerts ? "#d9534f" : "#0275d8",
+            }).bindPopup(sitePopup(site)).addTo(sitesLayer);
+        });
+    data.clusters.forEach(cluster => {
+        const [west, south, east, north] = cluster.bbox;
+        L.marker([cluster.latitude, cluster.longitude], {
+            icon: L.divIcon({ className: "site-cluster", html: `${cluster.count}`, iconSize: [32, 32] }),
+        })
+            .on('click', () => map.fitBounds([[south, west], [north, east]]))
+            .addTo(sitesLayer);
+    });
 }
 
 // ----------------------------
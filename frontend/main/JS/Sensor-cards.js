@@ -238,34 +238,35 @@ let phChart, tempChart, tdsChart;
 // ==============================
 // BACKEND FETCH
 // ==============================
-async function fetchLatestData() {
-    try {
-        const res = await fetch("http://localhost:8000/monitoring_data/latest");
-        if (!res.ok) throw new Error("Fetch failed");
-
-        const data = await res.json();
+function applyReading(data) {
+    if (data.ph_value == null || data.temperature == null || data.tds_value == null) {
+        throw new Error("Invalid backend response");
+    }
 
-        phValue = data.ph_value;
-        tempValue = data.temperature;
-        tdsValue = data.tds_value;
+    phValue = data.ph_value;
+    tempValue = data.temperature;
+    tdsValue = data.tds_value;
 
-        if (data.ph_value == null || data.temperature == null || data.tds_value == null) {
-            throw new Error("Invalid backend response");
-        }
+    phValueDisplay.textContent = phValue.toFixed(2);
+    tempValueDisplay.textContent = tempValue;
+    tdsValueDisplay.textContent = tdsValue;
 
 
-        phValueDisplay.textContent = phValue.toFixed(2);
-        tempValueDisplay.textContent = tempValue;
-        tdsValueDisplay.textContent = tdsValue;
+    updatePhStatus(phValue);
+    updateHeatStatus(tempValue);
+    updateFilterStatus(tdsValue);
 
+    updateSensorChart(phChart, phValue, 5.0, 8.0);
+    updateSensorChart(tempChart, tempValue, 15, 40);
+    updateSensorChart(tdsChart, tdsValue, 0, 1500);
+}
 
-        updatePhStatus(phValue);
-        updateHeatStatus(tempValue);
-        updateFilterStatus(tdsValue);
+async function fetchLatestData() {
+    try {
+        const res = await fetch("http://localhost:8000/monitoring_data/latest");
+        if (!res.ok) throw new Error("Fetch failed");
 
-        updateSensorChart(phChart, phValue, 5.0, 8.0);
-        updateSensorChart(tempChart, tempValue, 15, 40);
-        updateSensorChart(tdsChart, tdsValue, 0, 1500);
+        applyReading(await res.json());
 
     } catch (err) {
         console.error("Backend error:", err);
@@ -273,185 +274,118 @@ async function fetchLatestData() {
 }
 
 // ==============================
-// INIT
-// ==============================
-document.addEventListener("DOMContentLoaded", () => {
-    phChart = createSensorChart("phChart", 0, 5, 8, "#3498db");
-    tempChart = createSensorChart("tempChart", 0, 15, 40, "#e74c3c");
-    tdsChart = createSensorChart("tdsChart", 0, 0, 1500, "#2ecc71");
-
-    setInterval(fetchLatestData, 5000); // Every 5 seconds
-    fetchLatestData();
-});
-
-
-
-// ==============================
-// 24H CHANGE & STABILITY UPDATES
+// LIVE FEED (WebSocket, polling only while disconnected)
 // ==============================
+let liveSocket = null;
+let pollTimer = null;
+let reconnectDelay = 1000;
 
-async function fetchAllDeviceIds() {
-    try {
-        const res = await fetch("http://localhost:8000/monitoring/list");
-        if (!res.ok) throw new Error("Failed to fetch device list");
-
-        const devices = await res.json(); // [{id: "device_001"}, ...]
-        return devices.map(d => d.id);    // ["device_001", "device_002", ...]
-    } catch (err) {
-        console.error("Error fetching device IDs:", err);
-        return [];
-    }
+function startPolling() {
+    if (!pollTimer) pollTimer = setInterval(fetchLatestData, 5000);
 }
 
-async function updateAllDevices24hChange() {
-    const deviceIds = await fetchAllDeviceIds(); // get all device IDs
-    deviceIds.forEach(id => update24hTemperatureChange(id));
+function stopPolling() {
+    clearInterval(pollTimer);
+    pollTimer = null;
 }
 
-// Call every 5 seconds
-setInterval(updateAllDevices24hChange, 5000);
-
-// Initial call on page load
-updateAllDevices24hChange();
-
-async function update24hTemperatureChange(deviceId) {
-    try {
-        const res = await fetch(`http://localhost:8000/history/${deviceId}`);
-        if (!res.ok) throw new Error(`Failed to fetch history for ${deviceId}`);
+function connectLiveFeed() {
+    liveSocket = new WebSocket("ws://localhost:8000/ws/live");
 
-        const data = await res.json();
-        if (data.length < 2) return; // Not enough data
-
-        const now = new Date();
-        const past24h = new Date(now.getTime() - 24*60*60*1000);
+    liveSocket.onopen = () => {
+        reconnectDelay = 1000;
+        stopPolling();
+        fetchLatestData(); // catch up on anything missed while disconnected
+    };
 
-        let closest = data[0];
-        for (let i = 0; i < data.length; i++) {
-            const ts = new Date(data[i].timestamp);
-            if (Math.abs(ts - past24h) < Math.abs(new Date(closest.timestamp) - past24h)) {
-                closest = data[i];
+    liveSocket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === "alert") {
+            // Threshold alerts are already raised above against the ranges set on this page
+            if (message.status === "raised" && message.kind !== "threshold") {
+                addNotification(`${message.device_id}: ${message.kind} alert`, message.message);
             }
+            return;
         }
+        if (message.type !== "reading") return;
 
-        const latestTemp = data[data.length-1].temperature;
-        const pastTemp = closest.temperature;
-
-        const diff = (latestTemp - pastTemp).toFixed(1);
-        const sign = diff >= 0 ? "+" : "";
-
-        // Dynamic span ID based on device ID
-        const tempChangeElement = document.getElementById(`tempChangeValue-${deviceId}`);
-        if (tempChangeElement) {
-            tempChangeElement.textContent = `${sign}${diff}°C`;
+        try {
+            applyReading(message);
+        } catch (err) {
+            console.error("Live reading error:", err);
         }
 
-    } catch (err) {
-        console.error(`Error updating 24h change for ${deviceId}:`, err);
-    }
+        // Other dashboard scripts (charts) refresh on this instead of a timer
+        window.dispatchEvent(new CustomEvent("live-reading", { detail: message }));
+        console.debug(`Live latency: ${Date.now() - message.ingested_at} ms`);
+    };
+
+    liveSocket.onclose = () => {
+        startPolling();
+        setTimeout(connectLiveFeed, reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+    };
 }
 
 // ==============================
-// STABILITY UPDATES
+// INIT
 // ==============================
+document.addEventListener("DOMContentLoaded", () => {
+    phChart = createSensorChart("phChart", 0, 5, 8, "#3498db");
+    tempChart = createSensorChart("tempChart", 0, 15, 40, "#e74c3c");
+    tdsChart = createSensorChart("tdsChart", 0, 0, 1500, "#2ecc71");
 
-async function updateStability(deviceId) {
-    try {
-        const res = await fetch(`http://localhost:8000/history/${deviceId}`);
-        if (!res.ok) throw new Error(`Failed to fetch history for ${deviceId}`);
-
-        const data = await res.json();
-        if (data.length < 2) return;
-
-        const latest = data[data.length - 1];
-        const past24hTime = new Date(new Date().getTime() - 24*60*60*1000);
-
-        // Find reading closest to 24h ago
-        let closest = data[0];
-        for (let r of data) {
-            const ts = new Date(r.timestamp);
-            if (Math.abs(ts - past24hTime) < Math.abs(new Date(closest.timestamp) - past24hTime)) {
-                closest = r;
-            }
-        }
-
-        // Calculate relative change for pH, temperature, or TDS
-        const stability = {
-            ph: Math.max(0, 100 - Math.abs(latest.ph_value - closest.ph_value) * 20), // scale to % (example)
-            temp: Math.max(0, 100 - Math.abs(latest.temperature - closest.temperature) * 10),
-            tds: Math.max(0, 100 - Math.abs(latest.tds_value - closest.tds_value) * 0.2)
-        };
-
-        // Update the element (example: showing temperature stability)
-        const stabilityElement = document.getElementById(`stabilityValue-${deviceId}`);
-        if (stabilityElement) {
-            stabilityElement.textContent = `${Math.round(stability.temp)}%`;
-        }
-
-    } catch (err) {
-        console.error(`Error updating stability for ${deviceId}:`, err);
-    }
-}
-
-async function updateAllDevicesStability() {
-    const deviceIds = await fetchAllDeviceIds();
-    deviceIds.forEach(id => updateStability(id));
-}
+    fetchLatestData();
+    connectLiveFeed();
+});
 
-// Call every 5 seconds
-setInterval(updateAllDevicesStability, 5000);
-updateAllDevicesStability();
 
 
 // ==============================
-// TDS CHANGE RATE UPDATES
+// 24H CHANGE, STABILITY & TDS CHANGE RATE
 // ==============================
+// All three come from one /metrics/derived call computed server-side,
+// instead of pulling every device's full history three times per tick.
 
-async function updateTDSChangeRate(deviceId) {
+function formatSigned(value, digits) {
+    const fixed = value.toFixed(digits);
+    return value >= 0 ? `+${fixed}` : fixed;
+}
+
+async function updateAllDerivedMetrics() {
     try {
-        const res = await fetch(`http://localhost:8000/history/${deviceId}`);
-        if (!res.ok) throw new Error(`Failed to fetch history for ${deviceId}`);
+        const res = await fetch("http://localhost:8000/metrics/derived");
+        if (!res.ok) throw new Error("Failed to fetch derived metrics");
 
-        const data = await res.json();
-        if (data.length < 2) return; // Not enough data
+        const metrics = await res.json(); // [{device_id, temperature_change_24h, ...}, ...]
 
-        const now = new Date();
-        const past24h = new Date(now.getTime() - 24*60*60*1000);
+        metrics.forEach(m => {
+            if (m.stability === null) return; // Not enough data
 
-        // Find reading closest to 24h ago
-        let closest = data[0];
-        for (let r of data) {
-            const ts = new Date(r.timestamp);
-            if (Math.abs(ts - past24h) < Math.abs(new Date(closest.timestamp) - past24h)) {
-                closest = r;
+            const tempChangeElement = document.getElementById(`tempChangeValue-${m.device_id}`);
+            if (tempChangeElement) {
+                tempChangeElement.textContent = `${formatSigned(m.temperature_change_24h, 1)}°C`;
             }
-        }
 
-        const latestTDS = data[data.length-1].tds_value;
-        const pastTDS = closest.tds_value;
-
-        // Change rate in ppm/day
-        const diff = (latestTDS - pastTDS).toFixed(1);
-        const sign = diff >= 0 ? "+" : "";
+            const stabilityElement = document.getElementById(`stabilityValue-${m.device_id}`);
+            if (stabilityElement) {
+                stabilityElement.textContent = `${Math.round(m.stability.temp)}%`;
+            }
 
-        // Update the element
-        const tdsChangeElement = document.getElementById(`tdsChangeRate-${deviceId}`);
-        if (tdsChangeElement) {
-            tdsChangeElement.textContent = `${sign}${diff} ppm/day`;
-        }
+            const tdsChangeElement = document.getElementById(`tdsChangeRate-${m.device_id}`);
+            if (tdsChangeElement) {
+                tdsChangeElement.textContent = `${formatSigned(m.tds_change_rate, 1)} ppm/day`;
+            }
+        });
 
     } catch (err) {
-        console.error(`Error updating TDS change rate for ${deviceId}:`, err);
+        console.error("Error updating derived metrics:", err);
     }
 }
 
-async function updateAllDevicesTDSChangeRate() {
-    const deviceIds = await fetchAllDeviceIds();
-    deviceIds.forEach(id => updateTDSChangeRate(id));
-}
-
 // Update every 5 seconds
-setInterval(updateAllDevicesTDSChangeRate, 5000);
-updateAllDevicesTDSChangeRate();
+setInterval(updateAllDerivedMetrics, 5000);
+updateAllDerivedMetrics();
 
 
 // ==============================
@@ -7,7 +7,8 @@ let temperatureChart = null;
 ---------------------------- */
 const CONFIG = {
     API_BASE_URL: "http://localhost:8000",
-    REFRESH_INTERVAL: 5000, // 30 seconds
+    REFRESH_INTERVAL: 60000, // fallback when no live readings arrive
+    LIVE_REFRESH_THROTTLE: 5000, // at most one redraw per 5s on live readings
     CHART_OPTIONS: {
         responsive: true,
         maintainAspectRatio: false,
@@ -393,6 +394,8 @@ class AppController {
     constructor() {
         this.chartManager = new ChartManager();
         this.refreshInterval = null;
+        this.liveRefreshPending = false;
+        this.onLiveReading = () => this.scheduleLiveRefresh();
     }
 
     async initialize() {
@@ -405,6 +408,7 @@ class AppController {
             
             await this.refreshAllCharts();
             this.startAutoRefresh();
+            window.addEventListener("live-reading", this.onLiveReading);
         } catch (err) {
             console.error("Initialization failed:", err);
         }
@@ -467,6 +471,17 @@ class AppController {
         );
     }
 
+    // Redraw when the live feed reports new data, throttled
+    scheduleLiveRefresh() {
+        if (this.liveRefreshPending) return;
+        this.liveRefreshPending = true;
+
+        setTimeout(() => {
+            this.liveRefreshPending = false;
+            this.refreshAllCharts();
+        }, CONFIG.LIVE_REFRESH_THROTTLE);
+    }
+
     stopAutoRefresh() {
         if (this.refreshInterval) {
             clearInterval(this.refreshInterval);
@@ -476,6 +491,7 @@ class AppController {
 
     cleanup() {
         this.stopAutoRefresh();
+        window.removeEventListener("live-reading", this.onLiveReading);
         this.chartManager.cleanup();
     }
 }
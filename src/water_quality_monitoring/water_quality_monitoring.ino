@@ -8,6 +8,9 @@
 // =============================
 #define DEVICE_ID "device_001"
 
+// 1 = send 48-byte binary frames (backend/app/frames.py), 0 = JSON lines
+#define SEND_BINARY_FRAMES 0
+
 // =============================
 // SENSOR PINS
 // =============================
@@ -22,6 +25,50 @@ PhSensor   phSensor(PH_PIN);
 TDSSensor  tdsSensor(TDS_PIN);
 TempSensor tempSensor(TEMP_PIN);
 
+// =============================
+// BINARY FRAME (version 1, little-endian, 48 bytes)
+// =============================
+struct __attribute__((packed)) ReadingFrame {
+  char     magic[2];      // "WQ"
+  uint8_t  version;       // 1
+  uint8_t  flags;         // reserved
+  char     deviceId[16];  // NUL-padded
+  uint32_t seq;
+  int64_t  timestampMs;   // 0: no clock, the gateway stamps it
+  float    ph;
+  float    tds;
+  float    temperature;
+  uint32_t crc;           // CRC-32 of everything above
+};
+
+uint32_t frameSeq = 0;
+
+uint32_t crc32(const uint8_t *data, size_t length) {
+  uint32_t crc = 0xFFFFFFFF;
+  for (size_t i = 0; i < length; i++) {
+    crc ^= data[i];
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc >> 1) ^ (0xEDB88320 & -(crc & 1));
+    }
+  }
+  return ~crc;
+}
+
+void sendFrame(float phValue, float tdsValue, float tempValue) {
+  ReadingFrame frame = {};
+  frame.magic[0] = 'W';
+  frame.magic[1] = 'Q';
+  frame.version = 1;
+  strncpy(frame.deviceId, DEVICE_ID, sizeof(frame.deviceId));
+  frame.seq = frameSeq++;
+  frame.timestampMs = 0;
+  frame.ph = phValue;
+  frame.tds = tdsValue;
+  frame.temperature = tempValue;
+  frame.crc = crc32((const uint8_t *)&frame, sizeof(frame) - sizeof(frame.crc));
+  Serial.write((const uint8_t *)&frame, sizeof(frame));
+}
+
 // =============================
 // SETUP
 // =============================
@@ -44,6 +91,12 @@ void loop() {
   float tdsValue  = tdsSensor.readTDS();
   float tempValue = tempSensor.readTemperature();
 
+#if SEND_BINARY_FRAMES
+  sendFrame(phValue, tdsValue, tempValue);
+  delay(5000);
+  return;
+#endif
+
   // Build JSON string exactly like your first example
   String jsonString = "{";
   jsonString += "\"device_id\":\"" + String(DEVICE_ID) + "\",";